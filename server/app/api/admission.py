@@ -0,0 +1,217 @@
+"""Admission control for the LLM-heavy endpoints.
+
+Every chat and ingest request must get past a per-user and a global token
+bucket and per-user and global limits on requests in flight. A request
+over a limit is turned away at once with 429 and a Retry-After header
+rather than queued. Chat costs 1 token per request; ingest costs 1 per
+message, so one large conversation counts like many small ones. Chat and
+ingest have separate limits, so a burst of ingest never uses up chat's;
+run_llm then also puts chat's LLM calls ahead of ingest's. A background
+ingest (?background=true) only holds its in-flight slot until it is
+queued, so it is bounded by the user's queued and running jobs instead.
+
+A rate or limit of 0 turns it off, and ADMISSION_ENABLED=false turns off
+the lot (the load benchmark does this unless told otherwise).
+"""
+
+import math
+import os
+import threading
+import time
+from collections import Counter
+
+from app.api.auth import get_current_user
+from app.api.models import IngestRequest
+from app.memory.jobs import active_jobs
+from app.metrics import inc
+from dotenv import load_dotenv
+from fastapi import Depends, HTTPException
+
+load_dotenv()
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+# token buckets: sustained tokens per second and burst size
+CHAT_RATE_PER_USER = float(os.getenv("CHAT_RATE_PER_USER", "1"))
+CHAT_BURST_PER_USER = float(os.getenv("CHAT_BURST_PER_USER", "10"))
+CHAT_RATE = float(os.getenv("CHAT_RATE", "50"))
+CHAT_BURST = float(os.getenv("CHAT_BURST", "200"))
+INGEST_RATE_PER_USER = float(os.getenv("INGEST_RATE_PER_USER", "2"))
+INGEST_BURST_PER_USER = float(os.getenv("INGEST_BURST_PER_USER", "200"))
+INGEST_RATE = float(os.getenv("INGEST_RATE", "50"))
+INGEST_BURST = float(os.getenv("INGEST_BURST", "1000"))
+# requests in flight
+CHAT_MAX_IN_FLIGHT_PER_USER = int(os.getenv("CHAT_MAX_IN_FLIGHT_PER_USER", "4"))
+CHAT_MAX_IN_FLIGHT = int(os.getenv("CHAT_MAX_IN_FLIGHT", "256"))
+INGEST_MAX_IN_FLIGHT_PER_USER = int(os.getenv("INGEST_MAX_IN_FLIGHT_PER_USER", "2"))
+INGEST_MAX_IN_FLIGHT = int(os.getenv("INGEST_MAX_IN_FLIGHT", "32"))
+# background ingest jobs per user, queued or running
+INGEST_MAX_QUEUED_PER_USER = int(os.getenv("INGEST_MAX_QUEUED_PER_USER", "20"))
+
+# buckets of users idle this long (and so full again) are dropped
+_IDLE_SECONDS = 600
+_PRUNE_EVERY = 1000
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, cost: float) -> float:
+        """Take cost tokens and return 0, or return the seconds until they are there.
+
+        A cost above the burst size is charged as a full bucket, so a big
+        request can still get through on its own.
+        """
+        cost = min(cost, self.burst)
+        self._refill()
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0.0
+        return (cost - self.tokens) / self.rate
+
+    def give_back(self, cost: float):
+        self.tokens = min(self.burst, self.tokens + min(cost, self.burst))
+
+
+class Limiter:
+    """Token buckets and in-flight counts for one class of requests."""
+
+    def __init__(
+        self,
+        name: str,
+        rate_per_user: float,
+        burst_per_user: float,
+        rate: float,
+        burst: float,
+        max_in_flight_per_user: int,
+        max_in_flight: int,
+    ):
+        self.name = name
+        self.rate_per_user = rate_per_user
+        self.burst_per_user = burst_per_user
+        self.max_in_flight_per_user = max_in_flight_per_user
+        self.max_in_flight = max_in_flight
+        self.bucket = TokenBucket(rate, burst) if rate > 0 else None
+        self.buckets: dict[str, TokenBucket] = {}
+        self.in_flight: Counter[str] = Counter()
+        self.total_in_flight = 0
+        self.admitted = 0
+        self._lock = threading.Lock()
+
+    def reject(self, reason: str, retry_after: float):
+        """Count the rejection and raise a 429 HTTPException."""
+        inc("admission_rejected_total", endpoint=self.name, reason=reason)
+        raise HTTPException(
+            status_code=429,
+            detail=f"too many {self.name} requests ({reason.replace('_', ' ')}), retry later",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+
+    def admit(self, user_id: str, cost: float = 1):
+        """Count the request in, or raise a 429 HTTPException."""
+        with self._lock:
+            if self.max_in_flight and self.total_in_flight >= self.max_in_flight:
+                self.reject("global_concurrency", 1)
+            if (
+                self.max_in_flight_per_user
+                and self.in_flight[user_id] >= self.max_in_flight_per_user
+            ):
+                self.reject("user_concurrency", 1)
+            bucket = None
+            if self.rate_per_user > 0:
+                bucket = self.buckets.get(user_id)
+                if bucket is None:
+                    bucket = self.buckets[user_id] = TokenBucket(
+                        self.rate_per_user, self.burst_per_user
+                    )
+                wait = bucket.take(cost)
+                if wait:
+                    self.reject("user_rate", wait)
+            if self.bucket is not None:
+                wait = self.bucket.take(cost)
+                if wait:
+                    if bucket is not None:
+                        bucket.give_back(cost)
+                    self.reject("global_rate", wait)
+            self.in_flight[user_id] += 1
+            self.total_in_flight += 1
+            self.admitted += 1
+            if self.admitted % _PRUNE_EVERY == 0:
+                self._prune()
+
+    def release(self, user_id: str):
+        with self._lock:
+            self.in_flight[user_id] -= 1
+            if self.in_flight[user_id] <= 0:
+                del self.in_flight[user_id]
+            self.total_in_flight -= 1
+
+    def _prune(self):
+        cutoff = time.monotonic() - _IDLE_SECONDS
+        for user_id in [
+            u for u, b in self.buckets.items() if b.updated < cutoff and u not in self.in_flight
+        ]:
+            del self.buckets[user_id]
+
+
+chat_limiter = Limiter(
+    "chat",
+    CHAT_RATE_PER_USER,
+    CHAT_BURST_PER_USER,
+    CHAT_RATE,
+    CHAT_BURST,
+    CHAT_MAX_IN_FLIGHT_PER_USER,
+    CHAT_MAX_IN_FLIGHT,
+)
+ingest_limiter = Limiter(
+    "ingest",
+    INGEST_RATE_PER_USER,
+    INGEST_BURST_PER_USER,
+    INGEST_RATE,
+    INGEST_BURST,
+    INGEST_MAX_IN_FLIGHT_PER_USER,
+    INGEST_MAX_IN_FLIGHT,
+)
+
+
+async def admit_chat(user_id: str = Depends(get_current_user)):
+    """Dependency: the user id, once the chat request is admitted.
+
+    The slot is held until the response, streamed or not, has been sent.
+    """
+    if not ADMISSION_ENABLED:
+        yield user_id
+        return
+    chat_limiter.admit(user_id)
+    try:
+        yield user_id
+    finally:
+        chat_limiter.release(user_id)
+
+
+async def admit_ingest(
+    request: IngestRequest, background: bool = False, user_id: str = Depends(get_current_user)
+):
+    """Dependency: the user id, once the ingest request is admitted."""
+    if not ADMISSION_ENABLED:
+        yield user_id
+        return
+    if (
+        background
+        and INGEST_MAX_QUEUED_PER_USER
+        and await active_jobs(user_id) >= INGEST_MAX_QUEUED_PER_USER
+    ):
+        ingest_limiter.reject("user_queue", 1)
+    ingest_limiter.admit(user_id, len(request.messages))
+    try:
+        yield user_id
+    finally:
+        ingest_limiter.release(user_id)
@@ -1,6 +1,12 @@
+import asyncio
+import hashlib
 import os
+import time
+from collections import OrderedDict
+from typing import Optional
 
 import jwt
+from app.metrics import timed
 from dotenv import load_dotenv
 from fastapi import Header, HTTPException
 from jwt import PyJWKClient
@@ -10,26 +16,159 @@ load_dotenv()
 JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 
+# verified tokens are remembered until they expire (or for at most
+# AUTH_CACHE_MAX_TTL_SECONDS when they carry no exp)
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+AUTH_CACHE_MAX_TTL_SECONDS = float(os.getenv("AUTH_CACHE_MAX_TTL_SECONDS", "3600"))
+JWKS_REFRESH_SECONDS = float(os.getenv("JWKS_REFRESH_SECONDS", "600"))
+# an unknown kid triggers a JWKS refetch at most this often
+JWKS_MIN_REFETCH_SECONDS = 30
+
 _jwks_url = f"{SUPABASE_URL.rstrip('/')}/auth/v1/.well-known/jwks.json" if SUPABASE_URL else None
 _jwk_client = PyJWKClient(_jwks_url) if _jwks_url else None
 
 
-def get_current_user(authorization: str = Header()) -> str:
+class TokenCache:
+    """LRU of verified tokens, keyed by sha256 of the token."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, tuple[str, float]] = OrderedDict()
+
+    @staticmethod
+    def key(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get(self, token: str) -> Optional[str]:
+        key = self.key(token)
+        entry = self._entries.get(key)
+        if entry is None or entry[1] <= time.time():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, token: str, user_id: str, exp: Optional[float]):
+        expires_at = time.time() + AUTH_CACHE_MAX_TTL_SECONDS
+        if exp is not None:
+            expires_at = min(expires_at, float(exp))
+        self._entries[self.key(token)] = (user_id, expires_at)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+token_cache = TokenCache(AUTH_CACHE_SIZE)
+
+_signing_keys: dict[str, object] = {}
+_jwks_lock = asyncio.Lock()
+_last_jwks_fetch = 0.0
+_jwks_failed = False
+_refresh_task: Optional[asyncio.Task] = None
+
+
+async def refresh_jwks():
+    """Fetch the Supabase JWKS in a worker thread and swap in the new keys.
+
+    On failure the keys we have are kept and the error is raised.
+    """
+    global _signing_keys, _last_jwks_fetch, _jwks_failed
+    if not _jwk_client:
+        return
+    _last_jwks_fetch = time.monotonic()
+    try:
+        jwk_set = await asyncio.to_thread(_jwk_client.get_jwk_set, True)
+    except Exception:
+        _jwks_failed = True
+        raise
+    _jwks_failed = False
+    _signing_keys = {key.key_id: key.key for key in jwk_set.keys}
+
+
+async def _signing_key(kid: Optional[str]):
+    """The key for kid, None if the JWKS has no such key.
+
+    Raises 503 when the kid is unknown and the JWKS can't be fetched, as
+    the token may be signed with a key we have not seen yet.
+    """
+    key = _signing_keys.get(kid)
+    if key is not None:
+        return key
+    # unknown kid: the keys were probably rotated, so refetch (rate limited)
+    async with _jwks_lock:
+        if kid not in _signing_keys and (
+            time.monotonic() - _last_jwks_fetch > JWKS_MIN_REFETCH_SECONDS
+        ):
+            try:
+                await refresh_jwks()
+            except Exception as e:
+                print(f"JWKS refetch failed: {e!r}")
+    key = _signing_keys.get(kid)
+    if key is None and _jwks_failed:
+        raise HTTPException(
+            status_code=503,
+            detail="Can't verify tokens right now",
+            headers={"Retry-After": str(JWKS_MIN_REFETCH_SECONDS)},
+        )
+    return key
+
+
+async def _refresh_jwks_forever():
+    while True:
+        await asyncio.sleep(JWKS_REFRESH_SECONDS)
+        try:
+            await refresh_jwks()
+        except Exception as e:
+            print(f"JWKS refresh failed: {e!r}")
+
+
+async def start_jwks_refresh():
+    """Prefetch the JWKS and keep it fresh in the background."""
+    global _refresh_task
+    if not _jwk_client:
+        return
+    try:
+        await refresh_jwks()
+    except Exception as e:
+        print(f"JWKS prefetch failed: {e!r}")
+    _refresh_task = asyncio.create_task(_refresh_jwks_forever())
+
+
+async def stop_jwks_refresh():
+    if _refresh_task:
+        _refresh_task.cancel()
+
+
+@timed("auth")
+async def get_current_user(authorization: str = Header()) -> str:
     if not authorization.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="Missing Bearer token")
 
     token = authorization.removeprefix("Bearer ")
 
+    user_id = token_cache.get(token)
+    if user_id is not None:
+        return user_id
+
     try:
-        alg = jwt.get_unverified_header(token).get("alg")
+        header = jwt.get_unverified_header(token)
+        alg = header.get("alg")
 
         if alg == "ES256":
             if not _jwk_client:
                 raise HTTPException(status_code=500, detail="Server auth misconfigured")
-            signing_key = _jwk_client.get_signing_key_from_jwt(token)
-            payload = jwt.decode(
+            signing_key = await _signing_key(header.get("kid"))
+            if signing_key is None:
+                raise HTTPException(status_code=401, detail="Invalid token")
+            # ECDSA verification is the expensive part, keep it off the loop
+            payload = await asyncio.to_thread(
+                jwt.decode,
                 token,
-                signing_key.key,
+                signing_key,
                 algorithms=["ES256"],
                 options={"verify_aud": False},
             )
@@ -41,9 +180,10 @@ def get_current_user(authorization: str = Header()) -> str:
                 options={"verify_aud": False},
             )
 
-        return payload["sub"]
-
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
+
+    token_cache.put(token, payload["sub"], payload.get("exp"))
+    return payload["sub"]
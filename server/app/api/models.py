@@ -1,4 +1,6 @@
-from pydantic import BaseModel
+from typing import Optional
+
+from pydantic import BaseModel, Field
 
 
 class Message(BaseModel):
@@ -8,15 +10,31 @@ class Message(BaseModel):
 
 class IngestRequest(BaseModel):
     messages: list[Message]
+    # with an id, messages already ingested for that conversation are skipped
+    conversation_id: Optional[str] = None
 
 
 class SearchRequest(BaseModel):
     query: str
+    categories: Optional[list[str]] = None
+    infer_categories: bool = False
+
+
+class BatchSearchQuery(BaseModel):
+    query: str
+    categories: Optional[list[str]] = None
+    limit: int = Field(default=4, ge=1, le=50)
+
+
+class BatchSearchRequest(BaseModel):
+    queries: list[BatchSearchQuery] = Field(max_length=32)
 
 
 class ChatRequest(BaseModel):
     question: str
     past_messages: list[Message] = []
+    categories: Optional[list[str]] = None
+    infer_categories: bool = False
 
 
 class MemoryResult(BaseModel):
@@ -28,5 +46,35 @@ class SearchResponse(BaseModel):
     memories: list[MemoryResult]
 
 
+class BatchSearchResponse(BaseModel):
+    results: list[SearchResponse]
+
+
+class CategoriesResponse(BaseModel):
+    categories: dict[str, int]
+
+
 class ChatResponse(BaseModel):
     answer: str
+
+
+class IngestJobResponse(BaseModel):
+    job_id: str
+    status: str
+
+
+class IngestJobStatus(BaseModel):
+    job_id: str
+    status: str
+    stage: str
+    attempts: int
+    processed: int
+    total: Optional[int] = None
+    actions: list[str]
+    error: Optional[str] = None
+
+
+class ImportResponse(BaseModel):
+    imported: int
+    skipped: int
+    errors: list[str]
@@ -1,40 +1,98 @@
+import json
+import time
+
+from app.api.admission import admit_chat, admit_ingest
 from app.api.auth import get_current_user
 from app.api.models import (
+    BatchSearchRequest,
+    BatchSearchResponse,
+    CategoriesResponse,
     ChatRequest,
     ChatResponse,
+    IngestJobResponse,
+    ImportResponse,
+    IngestJobStatus,
     IngestRequest,
     MemoryResult,
     SearchRequest,
     SearchResponse,
 )
-from app.memory.embed_memory import embed_single
-from app.memory.extract_memory import memory_extract_from_messages
-from app.memory.response_generator import generate_answer
-from app.memory.tool_caller import process_memory
-from app.memory.vector_DB import search_memories
-from fastapi import APIRouter, Depends
+from app.memory.ingest import ingest_conversation
+from app.memory.jobs import get_job, submit_ingest_job
+from app.memory.response_generator import generate_answer, stream_answer
+from app.memory.retrieval_cache import retrieve_memories, retrieve_memories_batch
+from app.memory.transfer import export_memories, import_memories, ndjson_lines
+from app.memory.vector_DB import user_categories
+from app.metrics import request_llm_tokens
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
 
 router = APIRouter()
 
 
 @router.post("/memories")
-async def ingest_memories(request: IngestRequest, user_id: str = Depends(get_current_user)):
+async def ingest_memories(
+    request: IngestRequest,
+    response: Response,
+    background: bool = False,
+    user_id: str = Depends(admit_ingest),
+):
     messages = [m.model_dump() for m in request.messages]
-    memories = memory_extract_from_messages(messages, [])
-    for memory in memories:
-        embedding = embed_single(memory.information)
-        results = await search_memories(embedding, user_id)
-        existing_str = "\n".join(
-            [f"id: {r.id} | text:{r.payload['memory_text']}" for r in results]
-        )
-        await process_memory(memory.information, existing_str, user_id)
-    return {"status": "ok", "processed": len(memories)}
+    if background:
+        job_id = await submit_ingest_job(user_id, messages, request.conversation_id)
+        response.status_code = 202
+        return IngestJobResponse(job_id=job_id, status="queued")
+    actions = await ingest_conversation(
+        messages, user_id, conversation_id=request.conversation_id
+    )
+    return {"status": "ok", "processed": len(actions)}
+
+
+@router.get("/memories/jobs/{job_id}")
+async def ingest_job_status(job_id: str, user_id: str = Depends(get_current_user)):
+    job = await get_job(job_id)
+    if not job or job["user_id"] != user_id:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return IngestJobStatus(
+        job_id=job["id"],
+        status=job["status"],
+        stage=job["stage"],
+        attempts=job["attempts"],
+        processed=job["processed"],
+        total=job["total"],
+        actions=job["actions"],
+        error=job["error"],
+    )
+
+
+@router.get("/memories/export")
+async def export(user_id: str = Depends(get_current_user)):
+    """Every memory of the user with its vector, one JSON object per line."""
+    return StreamingResponse(
+        export_memories(user_id),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="memories.ndjson"'},
+    )
+
+
+@router.post("/memories/import")
+async def import_(request: Request, user_id: str = Depends(get_current_user)):
+    """Upsert an export (NDJSON body) into the user's memories, without re-embedding."""
+    result = await import_memories(ndjson_lines(request.stream()), user_id)
+    return ImportResponse(**result)
+
+
+@router.get("/memories/categories")
+async def categories(user_id: str = Depends(get_current_user)):
+    counts = await user_categories(user_id)
+    return CategoriesResponse(categories=dict(counts.most_common()))
 
 
 @router.post("/memories/search")
 async def search(request: SearchRequest, user_id: str = Depends(get_current_user)):
-    embedding = embed_single(request.query)
-    results = await search_memories(embedding, user_id)
+    results = await retrieve_memories(
+        request.query, user_id, request.categories, infer=request.infer_categories
+    )
     memories = [
         MemoryResult(memory_text=r.payload["memory_text"], score=r.score)
         for r in results
@@ -42,11 +100,81 @@ async def search(request: SearchRequest, user_id: str = Depends(get_current_user
     return SearchResponse(memories=memories)
 
 
+@router.post("/memories/search/batch")
+async def search_batch(request: BatchSearchRequest, user_id: str = Depends(get_current_user)):
+    batches = await retrieve_memories_batch(
+        [(q.query, q.categories, q.limit) for q in request.queries], user_id
+    )
+    return BatchSearchResponse(
+        results=[
+            SearchResponse(
+                memories=[
+                    MemoryResult(memory_text=r.payload["memory_text"], score=r.score)
+                    for r in results
+                ]
+            )
+            for results in batches
+        ]
+    )
+
+
 @router.post("/chat")
-async def chat(request: ChatRequest, user_id: str = Depends(get_current_user)):
-    embedding = embed_single(request.question)
-    results = await search_memories(embedding, user_id)
+async def chat(request: ChatRequest, user_id: str = Depends(admit_chat)):
+    results = await retrieve_memories(
+        request.question, user_id, request.categories, infer=request.infer_categories
+    )
     context = "\n".join([r.payload["memory_text"] for r in results])
     past_messages = [m.model_dump() for m in request.past_messages]
     answer = await generate_answer(request.question, context, past_messages)
     return ChatResponse(answer=answer)
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@router.post("/chat/stream")
+async def chat_stream(request: ChatRequest, user_id: str = Depends(admit_chat)):
+    """Same as /chat, streamed as server-sent events.
+
+    Events: "memories" (retrieved ids and scores), one "token" per chunk of
+    the answer, then "done" with timings and the request's LLM tokens, or
+    "error" if generation fails.
+    """
+    start = time.perf_counter()
+    results = await retrieve_memories(
+        request.question, user_id, request.categories, infer=request.infer_categories
+    )
+    retrieval_ms = (time.perf_counter() - start) * 1000
+    context = "\n".join([r.payload["memory_text"] for r in results])
+    past_messages = [m.model_dump() for m in request.past_messages]
+
+    async def events():
+        yield _sse(
+            "memories",
+            {"memories": [{"id": str(r.id), "score": r.score} for r in results]},
+        )
+        first_token_ms = None
+        try:
+            async for token in stream_answer(request.question, context, past_messages):
+                if first_token_ms is None:
+                    first_token_ms = (time.perf_counter() - start) * 1000
+                yield _sse("token", {"text": token})
+        except Exception as e:
+            yield _sse("error", {"detail": str(e)})
+            return
+        yield _sse(
+            "done",
+            {
+                "retrieval_ms": retrieval_ms,
+                "first_token_ms": first_token_ms,
+                "total_ms": (time.perf_counter() - start) * 1000,
+                "llm_tokens": dict(request_llm_tokens.get() or {}),
+            },
+        )
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
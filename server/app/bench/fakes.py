@@ -0,0 +1,213 @@
+"""Stand-ins for OpenAI used by the load benchmark.
+
+FakeLM answers every dspy signature in this app, and streams answers for
+/chat/stream, with deterministic values after a fixed latency;
+FakeEmbeddings returns hashed bag-of-words vectors (texts sharing words
+are similar, so dedup and retrieval behave). install() swaps them in
+behind the real clients, so batching, caching and the vector store are
+all still exercised.
+"""
+
+import asyncio
+import hashlib
+import json
+import re
+import time
+from types import SimpleNamespace
+
+import numpy as np
+from app.memory import embed_memory
+from app.memory.lm import PooledLM, registry
+from app.metrics import count_request_tokens
+
+_OUTPUT_FIELDS = re.compile(r"^\d+\. `(\w+)` \(([^)]*)\)", re.MULTILINE)
+_INPUT_FIELDS = re.compile(
+    r"\[\[ ## (\w+) ## \]\]\n(.*?)(?=\n\n\[\[ ## |\n\nRespond with|\Z)", re.DOTALL
+)
+_WORDS = re.compile(r"[a-z0-9']+")
+
+CATEGORIES = ["food", "work", "travel", "family", "hobbies", "health"]
+
+
+def hash_embedding(text: str, dimensions: int) -> list[float]:
+    """Signed feature hashing of the words of text, L2 normalised."""
+    vector = np.zeros(dimensions, dtype=np.float32)
+    for word in _WORDS.findall(text.lower()):
+        digest = hashlib.blake2b(word.encode(), digest_size=8).digest()
+        index = int.from_bytes(digest[:4], "little") % dimensions
+        vector[index] += 1.0 if digest[4] & 1 else -1.0
+    norm = np.linalg.norm(vector)
+    if norm == 0:
+        vector[0] = 1.0
+        norm = 1.0
+    return (vector / norm).tolist()
+
+
+def _category(text: str) -> str:
+    return CATEGORIES[int(hashlib.sha1(text.encode()).hexdigest(), 16) % len(CATEGORIES)]
+
+
+def _shorten(text: str, words: int) -> str:
+    return " ".join(text.split()[:words])
+
+
+def _memories(inputs: dict) -> list[dict]:
+    try:
+        messages = json.loads(inputs.get("transcript", "[]"))
+    except json.JSONDecodeError:
+        return []
+    return [
+        {"information": m["content"], "predicted_categories": [_category(m["content"])]}
+        for m in messages
+        if m.get("role") == "user" and m.get("content", "").strip()
+    ]
+
+
+def _actions(inputs: dict) -> list[dict]:
+    actions = []
+    for line in inputs.get("new_memories", "").splitlines():
+        text = re.sub(r"^\d+\.\s*", "", line)
+        text = re.sub(r"\s*\(categories: [^)]*\)$", "", text)
+        if text:
+            actions.append({"action": "add", "text": text, "categories": [_category(text)]})
+    return actions
+
+
+def _next_tool(inputs: dict) -> tuple[str, dict]:
+    # one add, then finish: two ReAct iterations per fact. The trajectory
+    # holds [[ ## tool_name_0 ## ]] markers, so it may be split into fields
+    if "tool_name_0" in inputs or "tool_name_0" in inputs.get("trajectory", ""):
+        return "finish", {}
+    return "add", {
+        "user_id": inputs.get("user_id", ""),
+        "memory_text": inputs.get("new_memory", ""),
+        "categories": [],
+    }
+
+
+def fake_value(name: str, annotation: str, inputs: dict):
+    """The value FakeLM returns for output field name given the prompt inputs."""
+    if name == "memories":
+        return _memories(inputs)
+    if name == "no_info":
+        return not _memories(inputs)
+    if name == "actions":
+        return _actions(inputs)
+    if name == "next_tool_name":
+        return _next_tool(inputs)[0]
+    if name == "next_tool_args":
+        return _next_tool(inputs)[1]
+    if name == "updated_summary":
+        return _shorten(f"{inputs.get('summary', '')} {inputs.get('messages', '')}", 40)
+    if name == "response":
+        return "From what I remember: " + _shorten(inputs.get("context", ""), 30)
+    if annotation == "bool":
+        return False
+    if annotation == "int":
+        return 4
+    if annotation.startswith("list"):
+        return []
+    if annotation.startswith("dict"):
+        return {}
+    return f"{name} (bench)"
+
+
+def _format(value) -> str:
+    if isinstance(value, str):
+        return value
+    return json.dumps(value)
+
+
+def _usage(messages: list[dict], answer: str) -> dict:
+    prompt = sum(len(m["content"].split()) for m in messages)
+    return {"prompt_tokens": prompt, "completion_tokens": len(answer.split())}
+
+
+class FakeLM(PooledLM):
+    """A shared LM that answers from the prompt after latency seconds.
+
+    Only the provider call is replaced, so the registry's concurrency
+    limits and response cache still apply. Sleeps in the calling thread,
+    like a blocking provider call would; streams sleep on the event loop.
+    Token usage is the word count of the prompt and of the answer.
+    """
+
+    latency = 0.0
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.calls = 0
+
+    def complete(self, prompt, messages, **kwargs) -> list:
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        messages = messages or [{"role": "user", "content": prompt or ""}]
+        system = messages[0]["content"] if messages[0]["role"] == "system" else ""
+        outputs = system.split("Your output fields are:", 1)[-1]
+        outputs = outputs.split("All interactions will be structured", 1)[0]
+        inputs = dict(_INPUT_FIELDS.findall(messages[-1]["content"]))
+        sections = [
+            f"[[ ## {name} ## ]]\n{_format(fake_value(name, annotation, inputs))}"
+            for name, annotation in _OUTPUT_FIELDS.findall(outputs)
+        ]
+        sections.append("[[ ## completed ## ]]")
+        outputs = ["\n\n".join(sections)]
+        # the entry dspy.LM would record, usage included
+        self.history.append(
+            {"messages": messages, "outputs": outputs, "usage": _usage(messages, outputs[0])}
+        )
+        return outputs
+
+    async def stream_complete(self, messages: list[dict], **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        prompt = messages[-1]["content"]
+        context = prompt.split("context:\n", 1)[-1].split("\n\nquestion:", 1)[0]
+        answer = "From what I remember: " + _shorten(context, 20)
+        for word in answer.split():
+            yield word + " "
+        usage = _usage(messages, answer)
+        count_request_tokens(usage["prompt_tokens"], usage["completion_tokens"])
+
+
+class FakeEmbeddings:
+    """embeddings.create of the OpenAI clients, sync or async."""
+
+    def __init__(self, latency: float, is_async: bool):
+        self.latency = latency
+        self.is_async = is_async
+        self.calls = 0
+
+    def _response(self, input, dimensions):
+        texts = [input] if isinstance(input, str) else input
+        return SimpleNamespace(
+            data=[SimpleNamespace(embedding=hash_embedding(t, dimensions)) for t in texts]
+        )
+
+    def create(self, model: str, input, dimensions: int):
+        self.calls += 1
+        if not self.is_async:
+            time.sleep(self.latency)
+            return self._response(input, dimensions)
+
+        async def _create():
+            await asyncio.sleep(self.latency)
+            return self._response(input, dimensions)
+
+        return _create()
+
+
+def install(lm_latency: float, embed_latency: float) -> dict:
+    """Route every LLM and embedding call of the app to the fakes.
+
+    Returns the fake embedders so their call counts can go in the report;
+    the LMs are in the registry.
+    """
+    FakeLM.latency = lm_latency
+    registry.use(FakeLM)
+    sync_embeddings = FakeEmbeddings(embed_latency, is_async=False)
+    async_embeddings = FakeEmbeddings(embed_latency, is_async=True)
+    embed_memory.client = SimpleNamespace(embeddings=sync_embeddings)
+    embed_memory.async_client = SimpleNamespace(embeddings=async_embeddings)
+    return {"embeddings": [sync_embeddings, async_embeddings]}
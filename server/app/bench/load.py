@@ -0,0 +1,254 @@
+"""Load benchmark of the API with stand-in LLM, embedder and vector store.
+
+    python -m app.bench.load --users 1,10 --memories 10,100 --concurrency 1,8,32 [--out load.json]
+
+Runs the FastAPI app in process (httpx ASGI transport, lifespan included)
+with the fakes from app.bench.fakes and Qdrant in memory, so nothing leaves
+the machine and runs are comparable. For every users x memories point the
+users are seeded with that many memories each, then every workload (ingest,
+search, chat, chat_stream) is driven at each concurrency. The report has
+req/s, errors and p50/p95/p99 latency per workload and point.
+
+--lm-latency-ms and --embed-latency-ms stand in for provider round trips.
+Set QDRANT_PATH, QDRANT_URL or VECTOR_BACKEND=local to bench another store;
+RECONCILE_ENGINE and the other settings are read from the environment as
+usual. Ingest requests add memories, so later workloads of a point see a
+few more than were seeded.
+"""
+
+import os
+import tempfile
+
+_workdir = tempfile.mkdtemp(prefix="cortex-bench-")
+# the app reads its configuration at import time, so these go first
+if not (os.getenv("QDRANT_PATH") or os.getenv("QDRANT_URL")):
+    os.environ.setdefault("QDRANT_LOCATION", ":memory:")
+for _name, _value in {
+    "OPENAI_API_KEY": "bench",
+    "EMBED_DIMENSIONS": "256",
+    "LOCAL_STORE_DIR": os.path.join(_workdir, "local_store"),
+    "INGEST_QUEUE_PATH": os.path.join(_workdir, "ingest_jobs.db"),
+    "CONVERSATION_LOG_PATH": os.path.join(_workdir, "conversations.db"),
+    "COMPACTION_INTERVAL_SECONDS": "0",
+    # litellm's bundled model prices, instead of fetching them on import
+    "LITELLM_LOCAL_MODEL_COST_MAP": "True",
+    # measure the server, not its rate limits; set it to bench them
+    "ADMISSION_ENABLED": "false",
+}.items():
+    os.environ.setdefault(_name, _value)
+
+import argparse
+import asyncio
+import random
+import time
+from collections import Counter
+from datetime import date
+from typing import Callable
+from uuid import uuid4
+
+import httpx
+from app.api.auth import get_current_user
+from app.bench import fakes
+from app.bench.report import percentiles, write_report
+from app.main import app
+from app.memory.embed_memory import EMBED_DIMENSIONS, embed_flight, embed_texts
+from app.memory.lm import registry, response_cache
+from app.memory.vector_DB import (
+    VECTOR_BACKEND,
+    EmbeddedMemory,
+    delete_user_memories,
+    insert_memories,
+    search_flight,
+)
+from fastapi import Header
+
+WORKLOADS = ["ingest", "search", "chat", "chat_stream"]
+_SEED_BATCH = 256
+
+_SUBJECTS = ["I", "My sister", "My manager", "My partner", "My best friend", "My son"]
+_VERBS = ["love", "hate", "started", "stopped", "am learning", "keep forgetting"]
+_THINGS = [
+    "sushi", "rock climbing", "the piano", "Spanish", "running marathons", "chess",
+    "gardening", "Rust", "jazz", "baking bread", "yoga", "photography", "surfing",
+    "board games", "pottery", "cycling to work", "Italian food", "sci-fi novels",
+]
+_WHEN = ["last year", "this month", "on weekends", "since college", "every morning", "lately"]
+
+
+def fact(rng: random.Random) -> str:
+    return f"{rng.choice(_SUBJECTS)} {rng.choice(_VERBS)} {rng.choice(_THINGS)} {rng.choice(_WHEN)}."
+
+
+def question(rng: random.Random) -> str:
+    return f"What do you know about {rng.choice(_THINGS)}?"
+
+
+async def _bench_user(x_bench_user: str = Header()) -> str:
+    return x_bench_user
+
+
+async def seed(user_ids: list[str], memories: int, rng: random.Random):
+    """Give every user memories facts, embedded with the fake embedder."""
+    pending = [(user_id, fact(rng)) for user_id in user_ids for _ in range(memories)]
+    for start in range(0, len(pending), _SEED_BATCH):
+        batch = pending[start : start + _SEED_BATCH]
+        vectors = await embed_texts([text for _, text in batch])
+        await insert_memories(
+            [
+                EmbeddedMemory(
+                    user_id=user_id,
+                    memory_text=text,
+                    categories=[fakes.CATEGORIES[i % len(fakes.CATEGORIES)]],
+                    date=str(date.today()),
+                    embedding=vector,
+                )
+                for i, ((user_id, text), vector) in enumerate(zip(batch, vectors))
+            ]
+        )
+
+
+def make_request(workload: str, user_ids: list[str], rng: random.Random) -> Callable[[int], tuple]:
+    """(method, url, json body, user) for the i-th request of a workload."""
+
+    def _request(i: int) -> tuple:
+        user_id = user_ids[i % len(user_ids)]
+        if workload == "ingest":
+            body = {
+                "conversation_id": uuid4().hex,
+                "messages": [
+                    {"role": "user", "content": fact(rng)},
+                    {"role": "assistant", "content": "Good to know!"},
+                    {"role": "user", "content": fact(rng)},
+                ],
+            }
+            return "POST", "/memories", body, user_id
+        if workload == "search":
+            return "POST", "/memories/search", {"query": question(rng)}, user_id
+        body = {
+            "question": question(rng),
+            "past_messages": [
+                {"role": "user", "content": fact(rng)},
+                {"role": "assistant", "content": "Noted."},
+            ],
+        }
+        if workload == "chat":
+            return "POST", "/chat", body, user_id
+        return "POST", "/chat/stream", body, user_id
+
+    return _request
+
+
+async def run_workload(
+    http: httpx.AsyncClient, request: Callable[[int], tuple], requests: int, concurrency: int
+) -> dict:
+    latencies: list[float] = []
+    errors = 0
+    rejected = 0
+    indexes = iter(range(requests))
+
+    async def _worker():
+        nonlocal errors, rejected
+        for i in indexes:
+            method, url, body, user_id = request(i)
+            start = time.perf_counter()
+            try:
+                response = await http.request(
+                    method, url, json=body, headers={"X-Bench-User": user_id}
+                )
+                await response.aread()
+                status = response.status_code
+            except Exception as e:
+                print(f"{url} failed: {e!r}")
+                status = None
+            if status == 429:
+                rejected += 1
+            elif status is None or status >= 400:
+                errors += 1
+            else:
+                latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[_worker() for _ in range(concurrency)])
+    wall = time.perf_counter() - start
+    return {
+        "requests": requests,
+        "errors": errors,
+        "rejected": rejected,
+        "req_per_s": round(requests / wall, 2) if wall else None,
+        "latency_ms": percentiles(latencies),
+    }
+
+
+async def bench(args) -> dict:
+    installed = fakes.install(args.lm_latency_ms / 1000, args.embed_latency_ms / 1000)
+    app.dependency_overrides[get_current_user] = _bench_user
+    rng = random.Random(args.seed)
+    report = {
+        "settings": {
+            "vector_backend": VECTOR_BACKEND,
+            "qdrant_location": os.getenv("QDRANT_LOCATION") or os.getenv("QDRANT_PATH"),
+            "reconcile_engine": os.getenv("RECONCILE_ENGINE", "agent"),
+            "embed_dimensions": EMBED_DIMENSIONS,
+            "lm_latency_ms": args.lm_latency_ms,
+            "embed_latency_ms": args.embed_latency_ms,
+            "requests_per_run": args.requests,
+            "admission": os.getenv("ADMISSION_ENABLED"),
+        },
+        "runs": [],
+    }
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+            for users in args.users:
+                for memories in args.memories:
+                    user_ids = [f"bench-{uuid4().hex[:8]}-{i}" for i in range(users)]
+                    await seed(user_ids, memories, rng)
+                    for concurrency in args.concurrency:
+                        run = {"users": users, "memories": memories, "concurrency": concurrency}
+                        for workload in args.workloads:
+                            run[workload] = await run_workload(
+                                http,
+                                make_request(workload, user_ids, rng),
+                                args.requests,
+                                concurrency,
+                            )
+                        report["runs"].append(run)
+                        print(f"users={users} memories={memories} concurrency={concurrency} done")
+                    for user_id in user_ids:
+                        await delete_user_memories(user_id)
+    llm_calls = Counter()
+    for (model, _), lm in registry.lms().items():
+        llm_calls[model] += lm.calls
+    report["llm_calls"] = dict(llm_calls)
+    report["llm_response_cache"] = response_cache.stats()
+    report["single_flight"] = {
+        "embed": embed_flight.stats(),
+        "search": search_flight.stats(),
+    }
+    report["embedding_calls"] = sum(e.calls for e in installed["embeddings"])
+    return report
+
+
+def _ints(value: str) -> list[int]:
+    return [int(n) for n in value.split(",")]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=_ints, default=[1, 10])
+    parser.add_argument("--memories", type=_ints, default=[10, 100])
+    parser.add_argument("--concurrency", type=_ints, default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=100, help="per workload and run")
+    parser.add_argument(
+        "--workloads", type=lambda v: v.split(","), default=WORKLOADS, help=",".join(WORKLOADS)
+    )
+    parser.add_argument("--lm-latency-ms", type=float, default=50)
+    parser.add_argument("--embed-latency-ms", type=float, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="also write the JSON report here")
+    args = parser.parse_args()
+    write_report(await bench(args), args.out)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
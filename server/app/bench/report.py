@@ -0,0 +1,26 @@
+import json
+import statistics
+from typing import Optional
+
+
+def percentiles(samples: list[float]) -> Optional[dict]:
+    """p50/p95/p99 and mean of latency samples in ms, None when empty."""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    result = {
+        f"p{int(q * 100)}": round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 3)
+        for q in (0.5, 0.95, 0.99)
+    }
+    result["mean"] = round(statistics.mean(ordered), 3)
+    result["n"] = len(ordered)
+    return result
+
+
+def write_report(report: dict, path: Optional[str]):
+    """Print the report as JSON and also write it to path when given."""
+    text = json.dumps(report, indent=2)
+    print(text)
+    if path:
+        with open(path, "w") as f:
+            f.write(text + "\n")
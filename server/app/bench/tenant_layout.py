@@ -0,0 +1,143 @@
+"""Compare filtered search on the default and tenant collection layouts.
+
+    python -m app.bench.tenant_layout --tenants 10,100,1000 [--out report.json]
+
+For each tenant count two throwaway collections are filled with the same
+random points: one with the global HNSW graph, one with per-tenant graphs
+(payload_m, m=0). Both are built with the app's own collection_config and
+indexes, so quantization and the tenant index are as configured; only
+custom sharding is left out, as the points carry no shard keys. The same
+per-tenant queries then run against both, and the report gives latency
+percentiles and recall against exact search as the tenant count grows.
+Needs a Qdrant server (QDRANT_URL): the local in-process mode has no
+HNSW, so it would not show the difference.
+"""
+
+import argparse
+import asyncio
+import random
+import time
+
+import numpy as np
+from app.bench.report import percentiles, write_report
+from app.memory.vector_DB import QdrantStore, client, collection_config, search_params
+from qdrant_client.models import models
+
+_UPSERT_BATCH = 1000
+_EXACT = models.SearchParams(exact=True)
+
+LAYOUTS = ["default", "tenant"]
+
+
+def _tenant_filter(tenant: str) -> models.Filter:
+    return models.Filter(
+        must=[models.FieldCondition(key="user_id", match=models.MatchValue(value=tenant))]
+    )
+
+
+async def _wait_indexed(name: str, timeout: float = 600):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        info = await client.get_collection(name)
+        if info.status == models.CollectionStatus.GREEN:
+            return
+        await asyncio.sleep(1)
+    print(f"{name} still optimizing after {timeout}s, measuring anyway")
+
+
+async def _fill(name: str, layout: str, vectors: np.ndarray, tenants: list[str]):
+    config = collection_config(layout, size=vectors.shape[1])
+    config.pop("sharding_method", None)
+    await client.create_collection(collection_name=name, **config)
+    await QdrantStore(client).create_indexes(name, layout)
+    for start in range(0, len(vectors), _UPSERT_BATCH):
+        await client.upsert(
+            collection_name=name,
+            points=models.Batch(
+                ids=list(range(start, min(start + _UPSERT_BATCH, len(vectors)))),
+                vectors=vectors[start : start + _UPSERT_BATCH].tolist(),
+                payloads=[
+                    {"user_id": tenants[i % len(tenants)]}
+                    for i in range(start, min(start + _UPSERT_BATCH, len(vectors)))
+                ],
+            ),
+        )
+    await _wait_indexed(name)
+
+
+async def _measure(name: str, queries: list[tuple[str, list[float]]], k: int) -> dict:
+    latencies, recalls = [], []
+    for tenant, vector in queries:
+        query_filter = _tenant_filter(tenant)
+        start = time.perf_counter()
+        hits = await client.search(
+            collection_name=name,
+            query_vector=vector,
+            query_filter=query_filter,
+            search_params=search_params(),
+            limit=k,
+        )
+        latencies.append((time.perf_counter() - start) * 1000)
+        exact = await client.search(
+            collection_name=name,
+            query_vector=vector,
+            query_filter=query_filter,
+            search_params=_EXACT,
+            limit=k,
+        )
+        expected = {hit.id for hit in exact}
+        if expected:
+            recalls.append(len({hit.id for hit in hits} & expected) / len(expected))
+    return {
+        "search_ms": percentiles(latencies),
+        f"recall@{k}": round(sum(recalls) / len(recalls), 4) if recalls else None,
+    }
+
+
+async def bench(tenant_counts: list[int], per_tenant: int, dim: int, queries: int, k: int, keep: bool) -> dict:
+    rng = np.random.default_rng(0)
+    picker = random.Random(0)
+    report = {"points_per_tenant": per_tenant, "dimensions": dim, "queries": queries, "runs": []}
+    for count in tenant_counts:
+        tenants = [f"tenant-{i}" for i in range(count)]
+        vectors = rng.standard_normal((count * per_tenant, dim), dtype=np.float32)
+        sample = [
+            (picker.choice(tenants), rng.standard_normal(dim).tolist()) for _ in range(queries)
+        ]
+        run = {"tenants": count, "points": len(vectors)}
+        for layout in LAYOUTS:
+            name = f"bench_{layout}_{count}"
+            if await client.collection_exists(name):
+                await client.delete_collection(name)
+            await _fill(name, layout, vectors, tenants)
+            run[layout] = await _measure(name, sample, k)
+            if not keep:
+                await client.delete_collection(name)
+        report["runs"].append(run)
+        print(f"{count} tenants done")
+    return report
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tenants", default="10,100,1000")
+    parser.add_argument("--points-per-tenant", type=int, default=100)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=4)
+    parser.add_argument("--keep", action="store_true", help="keep the collections")
+    parser.add_argument("--out", help="also write the JSON report here")
+    args = parser.parse_args()
+    report = await bench(
+        [int(n) for n in args.tenants.split(",")],
+        args.points_per_tenant,
+        args.dim,
+        args.queries,
+        args.k,
+        args.keep,
+    )
+    write_report(report, args.out)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
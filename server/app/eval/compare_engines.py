@@ -0,0 +1,86 @@
+import asyncio
+import os
+import sys
+import time
+from collections import Counter
+from datetime import date
+from uuid import uuid4
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "../../.."))
+
+from app.eval.data import EXPECTED_ACTIONS, MESSAGES, SEED_MEMORIES
+from app.memory.embed_memory import embed_texts
+from app.memory.ingest import ingest_conversation
+from app.memory.vector_DB import (
+    EmbeddedMemory,
+    delete_user_memories,
+    insert_memories,
+    list_memories,
+)
+
+ENGINES = ["agent", "batch"]
+
+
+def action_kind(action: str) -> str:
+    action = action.lower()
+    if action.startswith("no action"):
+        return "noop"
+    for kind in ("update", "delete", "add"):
+        if kind in action:
+            return kind
+    return "noop"
+
+
+async def seed(user_id: str):
+    embeddings = await embed_texts(SEED_MEMORIES)
+    await insert_memories(
+        [
+            EmbeddedMemory(
+                user_id=user_id,
+                memory_text=text,
+                categories=[],
+                date=str(date.today()),
+                embedding=embedding,
+            )
+            for text, embedding in zip(SEED_MEMORIES, embeddings)
+        ]
+    )
+
+
+async def run_engine(engine: str) -> dict:
+    # every engine gets its own throwaway user so runs don't see each other
+    user_id = f"eval-{engine}-{uuid4().hex[:8]}"
+    await seed(user_id)
+    try:
+        start = time.perf_counter()
+        actions = await ingest_conversation(MESSAGES, user_id, engine=engine)
+        elapsed = time.perf_counter() - start
+        final = await list_memories(user_id)
+    finally:
+        await delete_user_memories(user_id)
+    return {
+        "engine": engine,
+        "seconds": elapsed,
+        "actions": actions,
+        "counts": Counter(action_kind(a) for a in actions),
+        "final": sorted(p.payload["memory_text"] for p in final),
+    }
+
+
+async def main():
+    expected = Counter(EXPECTED_ACTIONS)
+    for engine in ENGINES:
+        report = await run_engine(engine)
+        print(f"\nEngine:        {engine}")
+        print(f"Time:          {report['seconds']:.2f}s")
+        print(f"Actions:       {dict(report['counts'])} (expected {dict(expected)})")
+        for action in report["actions"]:
+            print(f"  - {action}")
+        print("Final memories:")
+        for text in report["final"]:
+            print(f"  - {text}")
+        print("-" * 60)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
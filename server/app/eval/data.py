@@ -1,3 +1,10 @@
+# what the user already has stored before MESSAGES are ingested
+SEED_MEMORIES = [
+    "User's name is Asif",
+    "User lives in Bangalore",
+    "User works as an SDE at Optimum Solution",
+]
+
 MESSAGES = [
     # contradicts existing "lives in Bangalore" → should update
     {"role": "user", "content": "I moved from Mumbai to Delhi last week"},
@@ -8,3 +15,6 @@ MESSAGES = [
     {"role": "user", "content": "my name is Asif"},
     {"role": "user", "content": "I work as an SDE at Optimum Solution"},
 ]
+
+# the action each message above should lead to, in order
+EXPECTED_ACTIONS = ["update", "add", "add", "noop", "noop"]
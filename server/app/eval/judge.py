@@ -1,18 +1,27 @@
+import hashlib
 import json
 import os
+import sqlite3
+import threading
 
 import dspy
+from app.memory.lm import get_lm, run_llm
 from dotenv import load_dotenv
 
 load_dotenv()
 
+JUDGE_MODEL = "gpt-4o"
+# judgements are reused across runs for the same (question, context,
+# response), so re-running an unchanged eval costs no judge calls
+JUDGE_CACHE_PATH = os.getenv("JUDGE_CACHE_PATH", "eval_judge_cache.db")
+
 
 class JudgeSignature(dspy.Signature):
     """you are an evaluator juding the qulity of ai assistants's response"""
 
     question: str = dspy.InputField(desc="the question that was asked")
     context: str = dspy.InputField(desc="the memory context given to the assistant")
-    response: str = dspy.OutputField(desc=" the assistant's response to evaluate")
+    response: str = dspy.InputField(desc=" the assistant's response to evaluate")
     groundedness: int = dspy.OutputField(
         desc="1-5: does the response use facts from context? 1 = ignores context, 5 = fully grounded "
     )
@@ -28,12 +37,63 @@ class JudgeSignature(dspy.Signature):
 judge_predictor = dspy.Predict(JudgeSignature)
 
 
+class JudgeCache:
+    """sqlite cache of judgements keyed by sha256 of the judged inputs."""
+
+    def __init__(self, path: str):
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS judgements (key TEXT PRIMARY KEY, scores TEXT)"
+        )
+        self._db.commit()
+
+    @staticmethod
+    def key(question: str, context: str, response: str) -> str:
+        data = json.dumps([JUDGE_MODEL, question, context, response])
+        return hashlib.sha256(data.encode()).hexdigest()
+
+    def get(self, key: str):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT scores FROM judgements WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key: str, scores: dict):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO judgements (key, scores) VALUES (?, ?)",
+                (key, json.dumps(scores)),
+            )
+            self._db.commit()
+
+
+judge_cache = JudgeCache(JUDGE_CACHE_PATH)
+
+
 async def judge_response(question: str, context: str, response: str) -> dict:
-    with dspy.context(lm=dspy.LM(model="gpt-4o")):
-        result = judge_predictor(question=question, context=context, response=response)
-    return {
+    key = JudgeCache.key(question, context, response)
+    scores = judge_cache.get(key)
+    if scores is not None:
+        return scores
+
+    def _run():
+        with dspy.context(lm=get_lm(JUDGE_MODEL)):
+            return judge_predictor(question=question, context=context, response=response)
+
+    result = await run_llm(_run)
+    scores = {
         "groundedness": int(result.groundedness),
         "accuracy": int(result.accuracy),
         "helpfulness": int(result.helpfulness),
         "reasoning": result.reasoning,
     }
+    judge_cache.put(key, scores)
+    return scores
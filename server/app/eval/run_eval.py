@@ -1,59 +1,210 @@
+import argparse
 import asyncio
+import json
 import os
+import re
+import statistics
+import subprocess
 import sys
+import time
+from datetime import date, datetime, timezone
+from uuid import uuid4
 
 sys.path.append(os.path.join(os.path.dirname(__file__), "../../.."))
 
-from app.eval.judge import judge_response
+from app.bench.report import percentiles, write_report
+from app.eval.judge import judge_cache, judge_response
 from app.eval.test_case import TEST_CASES
-from app.memory.embed_memory import embed_single
+from app.memory.embed_memory import embed_text, embed_texts
 from app.memory.response_generator import generate_answer
-from app.memory.vector_DB import search_memories
+from app.memory.vector_DB import (
+    EmbeddedMemory,
+    delete_user_memories,
+    insert_memories,
+    search_memories,
+)
 
+EVAL_CONCURRENCY = int(os.getenv("EVAL_CONCURRENCY", "8"))
+STAGES = ["seed", "embed", "search", "generate", "judge", "total"]
+SCORES = ["groundedness", "accuracy", "helpfulness"]
 
-async def main():
-    passed = 0
-    failed = 0
 
-    for case in TEST_CASES:
-        search_vector = embed_single(case["question"])
-        results = await search_memories(search_vector, user_id=1)
-        context = "\n".join([r.payload["memory_text"] for r in results])
-        response = await generate_answer(
-            question=case["question"],
-            context=context,
-        )
+def context_facts(context: str) -> list[str]:
+    return [s.strip() for s in re.split(r"(?<=\.)\s+", context) if s.strip()]
 
-        # check if every expected fact appears in the response
-        # facts_found = [
-        #     fact for fact in case["expected_facts"] if fact.lower() in response.lower()
-        # ]
-        facts_missing = [
-            fact
-            for fact in case["expected_facts"]
-            if fact.lower() not in response.lower()
+
+async def seed_case(case: dict, user_id: str):
+    facts = context_facts(case["context"])
+    embeddings = await embed_texts(facts)
+    await insert_memories(
+        [
+            EmbeddedMemory(
+                user_id=user_id,
+                memory_text=fact,
+                categories=[],
+                date=str(date.today()),
+                embedding=embedding,
+            )
+            for fact, embedding in zip(facts, embeddings)
         ]
+    )
+
+
+async def run_case(index: int, case: dict, run_id: str) -> dict:
+    """Run and score one case; a case that raises is reported with its error."""
+    try:
+        return await _run_case(index, case, run_id)
+    except Exception as e:
+        # an LLM error or unparseable judge output only loses this case
+        print(f"case {index} failed: {e!r}")
+        return {"question": case["question"], "error": repr(e)}
 
-        rule_result = "PASS" if not facts_missing else "FAIL"
 
+async def _run_case(index: int, case: dict, run_id: str) -> dict:
+    # every case gets its own throwaway user holding only its context
+    user_id = f"{run_id}-{index}"
+    timings = {}
+
+    def _lap(stage: str, start: float) -> float:
+        now = time.perf_counter()
+        timings[stage] = (now - start) * 1000
+        return now
+
+    began = time.perf_counter()
+    try:
+        await seed_case(case, user_id)
+        start = _lap("seed", began)
+        search_vector = await embed_text(case["question"])
+        start = _lap("embed", start)
+        results = await search_memories(search_vector, user_id)
+        start = _lap("search", start)
+        context = "\n".join([r.payload["memory_text"] for r in results])
+        response = await generate_answer(question=case["question"], context=context)
+        start = _lap("generate", start)
         scores = await judge_response(
             question=case["question"], context=context, response=response
         )
-        if rule_result == "PASS":
-            passed += 1
-        else:
-            failed += 1
-
-        print(f"\nQuestion:      {case['question']}")
-        print(f"Response:      {response}")
-        print(f"Rule check:    {rule_result} | Missing: {facts_missing}")
-        print(f"Groundedness:  {scores['groundedness']}/5")
-        print(f"Accuracy:      {scores['accuracy']}/5")
-        print(f"Helpfulness:   {scores['helpfulness']}/5")
-        print(f"Judge says:    {scores['reasoning']}")
+        _lap("judge", start)
+        _lap("total", began)
+    finally:
+        await delete_user_memories(user_id)
+
+    # check if every expected fact appears in the response
+    facts_missing = [
+        fact for fact in case["expected_facts"] if fact.lower() not in response.lower()
+    ]
+    return {
+        "question": case["question"],
+        "response": response,
+        "rule_check": "PASS" if not facts_missing else "FAIL",
+        "facts_missing": facts_missing,
+        **scores,
+        "latency_ms": {stage: round(ms, 3) for stage, ms in timings.items()},
+    }
+
+
+def _commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def summarize(results: list[dict]) -> dict:
+    """Pass counts, mean scores and latencies of the cases that ran to the end."""
+    scored = [r for r in results if "error" not in r]
+    passed = sum(r["rule_check"] == "PASS" for r in scored)
+    return {
+        "passed": passed,
+        "failed": len(scored) - passed,
+        "errors": len(results) - len(scored),
+        "scores": {
+            name: round(statistics.mean(r[name] for r in scored), 3) if scored else None
+            for name in SCORES
+        },
+        "latency_ms": {
+            stage: percentiles([r["latency_ms"][stage] for r in scored])
+            for stage in STAGES
+        },
+    }
+
+
+def compare(report: dict, baseline: dict) -> dict:
+    """Change of each score and stage p50/p99 against a previous report."""
+    now, before = report["summary"], baseline["summary"]
+    diff = {
+        name: round(now["scores"][name] - before["scores"][name], 3)
+        for name in SCORES
+        if now["scores"][name] is not None and before["scores"].get(name) is not None
+    }
+    diff["passed"] = now["passed"] - before["passed"]
+    diff["errors"] = now["errors"] - before.get("errors", 0)
+    for stage in STAGES:
+        for q in ("p50", "p99"):
+            if now["latency_ms"][stage] and before["latency_ms"].get(stage):
+                diff[f"{stage}_{q}_ms"] = round(
+                    now["latency_ms"][stage][q] - before["latency_ms"][stage][q], 3
+                )
+    diff["baseline_commit"] = baseline.get("commit")
+    return diff
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="run the answer-quality eval")
+    parser.add_argument("--concurrency", type=int, default=EVAL_CONCURRENCY)
+    parser.add_argument("--out", default="eval_report.json")
+    parser.add_argument("--baseline", help="previous report to compare against")
+    args = parser.parse_args()
+
+    run_id = f"eval-{uuid4().hex[:8]}"
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def _bounded(index: int, case: dict) -> dict:
+        async with semaphore:
+            return await run_case(index, case, run_id)
+
+    start = time.perf_counter()
+    results = await asyncio.gather(
+        *[_bounded(i, case) for i, case in enumerate(TEST_CASES)]
+    )
+    wall_ms = (time.perf_counter() - start) * 1000
+
+    for r in results:
+        print(f"\nQuestion:      {r['question']}")
+        if "error" in r:
+            print(f"Error:         {r['error']}")
+            print("-" * 60)
+            continue
+        print(f"Response:      {r['response']}")
+        print(f"Rule check:    {r['rule_check']} | Missing: {r['facts_missing']}")
+        print(f"Groundedness:  {r['groundedness']}/5")
+        print(f"Accuracy:      {r['accuracy']}/5")
+        print(f"Helpfulness:   {r['helpfulness']}/5")
+        print(f"Judge says:    {r['reasoning']}")
         print("-" * 60)
 
-    print(f"\nFinal Score: {passed}/{passed + failed} passed")
+    report = {
+        "run_id": run_id,
+        "commit": _commit(),
+        "finished_at": datetime.now(timezone.utc).isoformat(),
+        "concurrency": args.concurrency,
+        "wall_ms": round(wall_ms, 3),
+        "judge_cache": {"hits": judge_cache.hits, "misses": judge_cache.misses},
+        "summary": summarize(results),
+        "cases": results,
+    }
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["vs_baseline"] = compare(report, json.load(f))
+    write_report(report, args.out)
+    summary = report["summary"]
+    total = summary["passed"] + summary["failed"] + summary["errors"]
+    print(f"\nFinal Score: {summary['passed']}/{total} passed, {summary['errors']} errors")
 
 
 if __name__ == "__main__":
@@ -1,16 +1,47 @@
+import time
+from collections import Counter
 from contextlib import asynccontextmanager
 
+import litellm
+from app.api.admission import chat_limiter, ingest_limiter
+from app.api.auth import start_jwks_refresh, stop_jwks_refresh, token_cache
 from app.api.routes import router
-from app.memory.vector_DB import create_collection
-from fastapi import FastAPI
+from app.memory import embed_memory
+from app.memory.chat_context import context_stats
+from app.memory.compaction import compaction_stats, start_compaction, stop_compaction
+from app.memory.jobs import start_workers, stop_workers
+from app.memory.lm import response_cache
+from app.memory.retrieval_cache import retrieval_cache
+from app.memory.tool_caller import path_counts
+from app.memory.vector_DB import create_collection, search_flight
+from app.metrics import (
+    observe,
+    record_llm_usage,
+    render,
+    request_llm_tokens,
+    request_timings,
+    server_timing,
+)
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     await create_collection()
+    await start_jwks_refresh()
+    await start_workers()
+    start_compaction()
     yield
+    await stop_compaction()
+    await stop_workers()
+    await stop_jwks_refresh()
+
 
+# token counts for every call that goes through dspy
+if record_llm_usage not in litellm.success_callback:
+    litellm.success_callback.append(record_llm_usage)
 
 app = FastAPI(lifespan=lifespan)
 app.add_middleware(
@@ -18,5 +49,120 @@ app.add_middleware(
     allow_origins=["http://localhost:3000"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
 app.include_router(router)
+
+
+@app.middleware("http")
+async def timing(request: Request, call_next):
+    timings = []
+    llm_tokens = Counter()
+    token = request_timings.set(timings)
+    tokens_token = request_llm_tokens.set(llm_tokens)
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        request_timings.reset(token)
+        request_llm_tokens.reset(tokens_token)
+    elapsed = time.perf_counter() - start
+    route = request.scope.get("route")
+    route = route.path if route else "unmatched"
+    observe(
+        "http_request_duration_seconds",
+        elapsed,
+        method=request.method,
+        route=route,
+        status=response.status_code,
+    )
+    # streamed bodies are still being produced here, so their stages and
+    # tokens after the headers are only in the histograms and counters
+    # (/chat/stream reports its tokens in its "done" event)
+    if llm_tokens:
+        for kind, count in llm_tokens.items():
+            observe("request_llm_tokens", count, route=route, kind=kind)
+    response.headers["Server-Timing"] = server_timing(
+        [*timings, ("total", elapsed)], llm_tokens
+    )
+    return response
+
+
+def _counts(counter: dict, label: str) -> dict:
+    return {((label, key),): value for key, value in counter.items()}
+
+
+@app.get("/metrics")
+async def metrics():
+    embed_cache = embed_memory.cache.stats()
+    llm_cache = response_cache.stats()
+    stats = [
+        (
+            "cache_hits_total",
+            "counter",
+            "Cache hits by cache",
+            {
+                (("cache", "embedding"),): embed_cache["hits"],
+                (("cache", "retrieval"),): retrieval_cache.hits,
+                (("cache", "token"),): token_cache.hits,
+                (("cache", "history_summary"),): context_stats["summary_cache_hits"],
+                (("cache", "llm_response"),): llm_cache["hits"],
+            },
+        ),
+        (
+            "cache_misses_total",
+            "counter",
+            "Cache misses by cache",
+            {
+                (("cache", "embedding"),): embed_cache["misses"],
+                (("cache", "retrieval"),): retrieval_cache.misses,
+                (("cache", "token"),): token_cache.misses,
+                (("cache", "history_summary"),): context_stats["summaries_computed"],
+                (("cache", "llm_response"),): llm_cache["misses"],
+            },
+        ),
+        (
+            "reconcile_path_total",
+            "counter",
+            "Reconciliation path taken per extracted fact",
+            _counts(path_counts, "path"),
+        ),
+        (
+            "chat_context_tokens_total",
+            "counter",
+            "History tokens sent and tokens saved by summarizing",
+            {
+                (("kind", "history"),): context_stats["history_tokens"],
+                (("kind", "saved"),): context_stats["prompt_tokens_saved"],
+            },
+        ),
+        (
+            "compaction_total",
+            "counter",
+            "Background compaction counts",
+            _counts(compaction_stats, "kind"),
+        ),
+        (
+            "admission_in_flight",
+            "gauge",
+            "Admitted requests in flight",
+            {
+                (("endpoint", limiter.name),): limiter.total_in_flight
+                for limiter in (chat_limiter, ingest_limiter)
+            },
+        ),
+        (
+            "single_flight_total",
+            "counter",
+            "Upstream calls made and duplicate concurrent calls absorbed",
+            {
+                (("call", name), ("outcome", outcome)): value
+                for name, flight in (
+                    ("embed", embed_memory.embed_flight),
+                    ("search", search_flight),
+                )
+                for outcome, value in flight.stats().items()
+            },
+        ),
+    ]
+    return PlainTextResponse(render(stats), media_type="text/plain; version=0.0.4")
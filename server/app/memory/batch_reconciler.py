@@ -0,0 +1,144 @@
+from datetime import date
+from typing import Literal, Optional
+
+import dspy
+from app.memory.embed_memory import embed_texts
+from app.memory.extract_memory import Memory
+from app.memory.lm import get_lm, run_llm
+from app.memory.locks import memory_locks
+from app.memory.vector_DB import (
+    SEARCH_LIMIT,
+    EmbeddedMemory,
+    MemoryUnitOfWork,
+    search_memories_batch,
+    unit_of_work,
+)
+from dotenv import load_dotenv
+from pydantic import BaseModel
+from qdrant_client import models
+
+load_dotenv()
+
+
+class MemoryAction(BaseModel):
+    action: Literal["add", "update", "delete", "noop"]
+    memory_id: Optional[str] = None
+    text: Optional[str] = None
+    categories: list[str] = []
+
+
+class BatchMemoryReconciler(dspy.Signature):
+    """You are a memory manager. Given a numbered list of new memories and
+    the existing memories related to them, decide what to do with each new
+    memory and return the list of actions to apply.
+
+    Rules:
+    - completely new info with no related existing memory → add with its text
+    and categories
+    - new info that UPDATES or CONTRADICTS an existing memory (e.g. moved
+    cities, changed jobs) → update with the existing memory's id and the new
+    text
+    - already stored with the same meaning → noop
+    - an existing memory that is fully replaced → delete with its id, then add
+    - only use ids that appear in existing memories; never act twice on the
+    same id
+    """
+
+    new_memories: str = dspy.InputField(desc="numbered new memories with categories")
+    existing_memories: str = dspy.InputField(
+        desc="existing memories from the database formatted string"
+    )
+    actions: list[MemoryAction] = dspy.OutputField(
+        desc="the actions to apply, covering every new memory"
+    )
+
+
+batch_reconciler = dspy.Predict(BatchMemoryReconciler)
+
+
+async def reconcile_batch(memories: list[Memory], user_id: str) -> list[str]:
+    """Reconcile all facts of a conversation with one LLM call.
+
+    Retrieves neighbours for every fact, shows the model the deduplicated
+    union of them, and records the returned actions in the unit of work so
+    they are written as one batch, before the neighbours' locks are let go.
+    """
+    if not memories:
+        return []
+    embeddings = await embed_texts([memory.information for memory in memories])
+
+    async def _find():
+        neighbour_lists = await search_memories_batch(
+            [(embedding, None, SEARCH_LIMIT) for embedding in embeddings], user_id
+        )
+        return {str(r.id): r for results in neighbour_lists for r in results}
+
+    async with memory_locks.hold_found(user_id, _find) as existing:
+        async with unit_of_work(user_id) as uow:
+            return await _reconcile_batch(memories, existing, user_id, uow)
+
+
+async def _reconcile_batch(
+    memories: list[Memory],
+    existing: dict[str, models.ScoredPoint],
+    user_id: str,
+    uow: MemoryUnitOfWork,
+) -> list[str]:
+    new_str = "\n".join(
+        f"{i + 1}. {memory.information} (categories: {', '.join(memory.predicted_categories)})"
+        for i, memory in enumerate(memories)
+    )
+    existing_str = "\n".join(
+        f"id: {memory_id} | text:{r.payload['memory_text']}"
+        for memory_id, r in existing.items()
+    )
+
+    def _run():
+        with dspy.context(lm=get_lm("gpt-4o")):
+            return batch_reconciler(
+                new_memories=new_str, existing_memories=existing_str
+            )
+
+    result = await run_llm(_run)
+
+    writes: list[MemoryAction] = []
+    touched: set[str] = set()
+    taken: list[str] = []
+    for action in result.actions:
+        if action.action == "noop":
+            taken.append(f"no action: {action.text or ''}".rstrip())
+        elif action.action == "add" and action.text:
+            writes.append(action)
+        elif action.action in ("update", "delete") and action.memory_id in existing:
+            if action.memory_id in touched:
+                taken.append(f"skipped duplicate {action.action} of {action.memory_id}")
+                continue
+            if action.action == "update" and not action.text:
+                continue
+            touched.add(action.memory_id)
+            writes.append(action)
+        else:
+            taken.append(f"ignored invalid action: {action.model_dump_json()}")
+
+    texts = [action.text for action in writes if action.action != "delete"]
+    vectors = dict(zip(texts, await embed_texts(texts)))
+    today = str(date.today())
+    for action in writes:
+        if action.action == "delete":
+            uow.delete(action.memory_id)
+            taken.append(f"deleted: {action.memory_id}")
+            continue
+        memory = EmbeddedMemory(
+            user_id=user_id,
+            memory_text=action.text,
+            categories=action.categories,
+            date=today,
+            embedding=vectors[action.text],
+        )
+        if action.action == "add":
+            uow.insert(memory)
+            taken.append(f"added: {action.text}")
+        else:
+            uow.update(action.memory_id, memory)
+            taken.append(f"updated: {action.memory_id}")
+    return taken
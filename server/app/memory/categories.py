@@ -0,0 +1,95 @@
+import os
+import time
+from collections import Counter
+from typing import Optional
+
+import numpy as np
+from app.memory.embed_memory import embed_texts
+
+# the registry is rebuilt from the store this often, which picks up writes
+# made by other processes (e.g. the migration or compaction CLIs)
+CATEGORY_REFRESH_SECONDS = float(os.getenv("CATEGORY_REFRESH_SECONDS", "3600"))
+# at most this many categories, most used first, are shown to the extractor
+CATEGORY_PROMPT_LIMIT = int(os.getenv("CATEGORY_PROMPT_LIMIT", "50"))
+# query -> category name similarity needed to scope a search to a category
+CATEGORY_MATCH_THRESHOLD = float(os.getenv("CATEGORY_MATCH_THRESHOLD", "0.35"))
+CATEGORY_MATCH_LIMIT = int(os.getenv("CATEGORY_MATCH_LIMIT", "3"))
+
+
+class CategoryRegistry:
+    """Per-user category names with how many memories use each.
+
+    Loaded from the store on first use, then kept current by the write
+    paths in vector_DB, so reading it never touches the store. It keeps
+    each memory's categories, so an overwrite or delete takes back what
+    the memory counted before.
+    """
+
+    def __init__(self, refresh_seconds: float):
+        self.refresh_seconds = refresh_seconds
+        self._users: dict[str, tuple[float, Counter, dict[str, list[str]]]] = {}
+
+    def get(self, user_id: str) -> Optional[Counter]:
+        entry = self._users.get(user_id)
+        if entry is None or entry[0] <= time.monotonic():
+            return None
+        return entry[1]
+
+    def load(self, user_id: str, memories: dict[str, list[str]]) -> Counter:
+        """Start over from memories (id -> categories)."""
+        counts = Counter(c for categories in memories.values() for c in categories)
+        self._users[user_id] = (time.monotonic() + self.refresh_seconds, counts, memories)
+        return counts
+
+    def put(self, user_id: str, memory_id: str, categories: list[str]):
+        """Record a written memory's categories, if the user is loaded."""
+        entry = self._users.get(user_id)
+        if entry is None:
+            return
+        _, counts, memories = entry
+        counts.subtract(memories.get(memory_id, []))
+        counts.update(categories)
+        memories[memory_id] = list(categories)
+        _drop_unused(counts)
+
+    def remove(self, memory_ids: list[str], user_id: Optional[str] = None):
+        """Forget deleted memories, looking in every user when user_id is None."""
+        entries = [self._users[user_id]] if user_id in self._users else []
+        if user_id is None:
+            entries = list(self._users.values())
+        for _, counts, memories in entries:
+            for memory_id in memory_ids:
+                counts.subtract(memories.pop(memory_id, []))
+            _drop_unused(counts)
+
+    def drop(self, user_id: str):
+        self._users.pop(user_id, None)
+
+
+def _drop_unused(counts: Counter):
+    for category in [c for c, n in counts.items() if n <= 0]:
+        del counts[category]
+
+
+category_registry = CategoryRegistry(CATEGORY_REFRESH_SECONDS)
+
+
+def prompt_categories(counts: Counter) -> list[str]:
+    return [c for c, _ in counts.most_common(CATEGORY_PROMPT_LIMIT)]
+
+
+async def infer_categories(query_embedding: list[float], counts: Counter) -> list[str]:
+    """Pick the user's categories whose names are close to the query.
+
+    Category names go through the embedding cache, so after the first
+    query this costs one small matrix product.
+    """
+    names = list(counts)
+    if not names:
+        return []
+    matrix = np.asarray(await embed_texts(names), dtype=np.float32)
+    query = np.asarray(query_embedding, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(query)
+    scores = matrix @ query / np.where(norms == 0, 1, norms)
+    best = np.argsort(-scores)[:CATEGORY_MATCH_LIMIT]
+    return [names[i] for i in best if scores[i] >= CATEGORY_MATCH_THRESHOLD]
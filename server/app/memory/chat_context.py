@@ -0,0 +1,152 @@
+import os
+from collections import Counter, OrderedDict
+from typing import Dict, Optional
+
+import dspy
+from app.memory.conversations import message_hashes
+from app.memory.lm import CHAT, get_lm, run_llm
+from app.metrics import span
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# tokens of history plus memories sent with each chat prompt
+CHAT_CONTEXT_TOKEN_BUDGET = int(os.getenv("CHAT_CONTEXT_TOKEN_BUDGET", "3000"))
+# room kept for the rolling summary of older turns
+HISTORY_SUMMARY_TOKENS = int(os.getenv("HISTORY_SUMMARY_TOKENS", "300"))
+# older turns are folded into the summary in steps of this many messages,
+# so the summary (and its LLM call) only changes every few turns
+HISTORY_SUMMARY_STEP = int(os.getenv("HISTORY_SUMMARY_STEP", "8"))
+HISTORY_SUMMARY_CACHE_SIZE = int(os.getenv("HISTORY_SUMMARY_CACHE_SIZE", "2000"))
+SUMMARY_MODEL = "gpt-4o-mini"
+
+context_stats: Counter = Counter()
+
+try:
+    import tiktoken
+
+    _encoding = tiktoken.get_encoding("o200k_base")
+except Exception:
+    # no tiktoken or no cached encoding file (offline): estimate instead
+    _encoding = None
+
+
+def count_tokens(text: str) -> int:
+    if _encoding is None:
+        return len(text) // 4 + 1
+    return len(_encoding.encode(text, disallowed_special=()))
+
+
+def format_message(message: Dict) -> str:
+    return f"{message['role']}: {message['content']}"
+
+
+class SummarizeHistory(dspy.Signature):
+    """Update the running summary of a conversation with the messages that follow it. Keep facts, decisions, open questions and anything the user asked to remember; drop small talk. Be brief."""
+
+    summary: str = dspy.InputField(desc="summary of the conversation so far, may be empty")
+    messages: str = dspy.InputField(desc="the messages that follow the summary")
+    updated_summary: str = dspy.OutputField()
+
+
+history_summarizer = dspy.Predict(SummarizeHistory)
+
+
+class SummaryCache:
+    """LRU of rolling summaries keyed by the chained hash of the summarized prefix."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, str] = OrderedDict()
+
+    def get(self, prefix_hash: str) -> Optional[str]:
+        summary = self._entries.get(prefix_hash)
+        if summary is not None:
+            self._entries.move_to_end(prefix_hash)
+        return summary
+
+    def put(self, prefix_hash: str, summary: str):
+        self._entries[prefix_hash] = summary
+        self._entries.move_to_end(prefix_hash)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+summary_cache = SummaryCache(HISTORY_SUMMARY_CACHE_SIZE)
+
+
+async def summarize_prefix(messages: list[Dict], hashes: list[str]) -> str:
+    """Summary of messages, a prefix of the history.
+
+    Resumes from the longest already summarized step when there is one, so
+    on a warm cache the model only reads the messages folded since then.
+    """
+    cached = summary_cache.get(hashes[-1])
+    if cached is not None:
+        context_stats["summary_cache_hits"] += 1
+        return cached
+    start, previous = 0, ""
+    for end in range(len(messages) - HISTORY_SUMMARY_STEP, 0, -HISTORY_SUMMARY_STEP):
+        summary = summary_cache.get(hashes[end - 1])
+        if summary is not None:
+            start, previous = end, summary
+            break
+
+    def _run():
+        with dspy.context(lm=get_lm(SUMMARY_MODEL)):
+            return history_summarizer(
+                summary=previous,
+                messages="\n".join(format_message(m) for m in messages[start:]),
+            )
+
+    with span("summarize"):
+        summary = (await run_llm(_run, priority=CHAT)).updated_summary
+    context_stats["summaries_computed"] += 1
+    summary_cache.put(hashes[-1], summary)
+    return summary
+
+
+async def assemble_context(
+    past_messages: list[Dict], context: str, budget: int = CHAT_CONTEXT_TOKEN_BUDGET
+) -> tuple[str, str]:
+    """Fit history and memories into budget tokens.
+
+    Memories come first and are cut from the end (lowest score) only if
+    they alone overflow. The most recent turns that fit are kept verbatim;
+    older ones are replaced by a cached rolling summary.
+    """
+    memory_lines = context.split("\n") if context else []
+    line_tokens = [count_tokens(line) for line in memory_lines]
+    while memory_lines and sum(line_tokens) > budget:
+        memory_lines.pop()
+        line_tokens.pop()
+    context = "\n".join(memory_lines)
+
+    lines = [format_message(m) for m in past_messages]
+    tokens = [count_tokens(line) for line in lines]
+    full = sum(tokens)
+    remaining = budget - sum(line_tokens)
+    if full <= remaining:
+        context_stats["history_tokens"] += full
+        return "\n".join(lines), context
+
+    # keep the longest suffix that fits next to a summary, then fold
+    # whole steps so the summarized prefix (and its cache key) is stable;
+    # the latest message always stays verbatim
+    kept, start = 0, len(lines)
+    while start > 0 and kept + tokens[start - 1] <= remaining - HISTORY_SUMMARY_TOKENS:
+        start -= 1
+        kept += tokens[start]
+    fold = -(-start // HISTORY_SUMMARY_STEP) * HISTORY_SUMMARY_STEP
+    fold = min(fold, len(lines) - 1)
+    if fold <= 0:
+        context_stats["history_tokens"] += full
+        return "\n".join(lines), context
+    summary = await summarize_prefix(
+        past_messages[:fold], message_hashes(past_messages[:fold])
+    )
+    history = "\n".join([f"summary of earlier conversation: {summary}", *lines[fold:]])
+    sent = count_tokens(history)
+    context_stats["history_tokens"] += sent
+    context_stats["prompt_tokens_saved"] += max(0, full - sent)
+    return history, context
@@ -0,0 +1,244 @@
+"""Merge near-duplicate memories.
+
+    python -m app.memory.compaction --user USER_ID [--dry-run]
+
+The background worker (start_compaction) runs the same pass every
+COMPACTION_INTERVAL_SECONDS for users whose memories changed since their
+last pass.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+from collections import Counter
+
+import dspy
+import numpy as np
+from app.memory.lm import get_lm, run_llm
+from app.memory.locks import memory_locks
+from app.memory.vector_DB import (
+    EmbeddedMemory,
+    list_memories,
+    store,
+    unit_of_work,
+    write_generation,
+    written_users,
+)
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# pairs at or above COMPACT_MERGE_ABOVE are merged outright; pairs between
+# COMPACT_CHECK_ABOVE and it are merged only if the LLM says they are the
+# same fact
+COMPACT_MERGE_ABOVE = float(os.getenv("COMPACT_MERGE_ABOVE", "0.95"))
+COMPACT_CHECK_ABOVE = float(os.getenv("COMPACT_CHECK_ABOVE", "0.85"))
+# 0 disables the background worker
+COMPACTION_INTERVAL_SECONDS = float(os.getenv("COMPACTION_INTERVAL_SECONDS", "3600"))
+COMPACTION_DRY_RUN = os.getenv("COMPACTION_DRY_RUN", "false").lower() == "true"
+# rate limits per background pass
+COMPACTION_MAX_USERS = int(os.getenv("COMPACTION_MAX_USERS", "50"))
+COMPACTION_MAX_LLM_CHECKS = int(os.getenv("COMPACTION_MAX_LLM_CHECKS", "100"))
+COMPACTION_USER_DELAY_SECONDS = float(os.getenv("COMPACTION_USER_DELAY_SECONDS", "1"))
+
+_BLOCK_ROWS = 1024
+
+compaction_stats: Counter = Counter()
+
+
+class SameMemory(dspy.Signature):
+    """Decide whether two stored memories about a user state the same fact, so one of them is redundant. Memories that differ in a detail (a different place, time, name or amount) are not the same."""
+
+    memory_a: str = dspy.InputField()
+    memory_b: str = dspy.InputField()
+    same_fact: bool = dspy.OutputField()
+
+
+same_memory = dspy.Predict(SameMemory)
+
+
+def similar_pairs(vectors: np.ndarray, threshold: float) -> list[tuple[float, int, int]]:
+    """(similarity, i, j) for i < j at or above threshold, most similar first.
+
+    Works in row blocks so memory stays bounded for large users.
+    """
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    unit = vectors / np.where(norms == 0, 1, norms)
+    pairs = []
+    for start in range(0, len(unit), _BLOCK_ROWS):
+        block = unit[start : start + _BLOCK_ROWS] @ unit.T
+        rows, cols = np.nonzero(block >= threshold)
+        for r, c in zip(rows, cols):
+            i = start + r
+            if i < c:
+                pairs.append((float(block[r, c]), int(i), int(c)))
+    pairs.sort(reverse=True)
+    return pairs
+
+
+def _keep_first(a, b) -> bool:
+    """Keep the newer memory, or the more detailed one on the same day."""
+    key_a = (a.payload.get("date", ""), len(a.payload["memory_text"]))
+    key_b = (b.payload.get("date", ""), len(b.payload["memory_text"]))
+    return key_a >= key_b
+
+
+async def _is_same(a, b) -> bool:
+    def _run():
+        with dspy.context(lm=get_lm("gpt-4o-mini", cache=True)):
+            return same_memory(
+                memory_a=a.payload["memory_text"], memory_b=b.payload["memory_text"]
+            )
+
+    return bool((await run_llm(_run)).same_fact)
+
+
+async def compact_user(
+    user_id: str, dry_run: bool = COMPACTION_DRY_RUN, llm_checks: int = COMPACTION_MAX_LLM_CHECKS
+) -> dict:
+    """Merge one user's near-duplicate memories.
+
+    Each merge deletes one memory of the pair and gives the kept one the
+    union of both category lists. Returns the run's stats and, on a dry
+    run, the merges that would have been made.
+    """
+    stats = Counter()
+    points = await list_memories(user_id, with_vectors=True)
+    stats["points"] = len(points)
+    if len(points) < 2:
+        return dict(stats)
+
+    def _pairs():
+        vectors = np.asarray([p.vector for p in points], dtype=np.float32)
+        return similar_pairs(vectors, COMPACT_CHECK_ABOVE)
+
+    # O(n^2) in the user's memories, so kept off the event loop
+    pairs = await asyncio.to_thread(_pairs)
+    removed: set[int] = set()
+    kept: set[int] = set()
+    merges: list[tuple[int, int, float]] = []
+    for score, i, j in pairs:
+        # a memory that absorbed another stays; two of them are left alone
+        if i in removed or j in removed or (i in kept and j in kept):
+            continue
+        if score < COMPACT_MERGE_ABOVE:
+            if stats["llm_checks"] >= llm_checks:
+                stats["llm_checks_skipped"] += 1
+                continue
+            stats["llm_checks"] += 1
+            if not await _is_same(points[i], points[j]):
+                continue
+        if i in kept or (j not in kept and _keep_first(points[i], points[j])):
+            keep, drop = i, j
+        else:
+            keep, drop = j, i
+        kept.add(keep)
+        removed.add(drop)
+        merges.append((keep, drop, score))
+
+    stats["merges"] = len(merges)
+    if dry_run or not merges:
+        result = dict(stats)
+        if dry_run:
+            result["planned"] = [
+                {
+                    "keep": points[keep].payload["memory_text"],
+                    "drop": points[drop].payload["memory_text"],
+                    "score": round(score, 4),
+                }
+                for keep, drop, score in merges
+            ]
+        return result
+
+    ids = {str(points[k].id) for k, d, _ in merges} | {str(points[d].id) for k, d, _ in merges}
+    async with memory_locks.hold(user_id, ids):
+        # ingestion may have changed these memories while we decided
+        current = {str(r.id): r.payload for r in await store.retrieve(list(ids), user_id=user_id)}
+        async with unit_of_work(user_id) as uow:
+            categories: dict[int, list[str]] = {}
+            for keep, drop, _ in merges:
+                if any(
+                    current.get(str(points[n].id)) != points[n].payload for n in (keep, drop)
+                ):
+                    stats["skipped_changed"] += 1
+                    continue
+                uow.delete(str(points[drop].id))
+                stats["deleted"] += 1
+                merged = categories.get(keep, points[keep].payload.get("categories", []))
+                extra = [
+                    c for c in points[drop].payload.get("categories", []) if c not in merged
+                ]
+                if extra:
+                    categories[keep] = merged + extra
+            for keep, merged in categories.items():
+                payload = points[keep].payload
+                uow.update(
+                    str(points[keep].id),
+                    EmbeddedMemory(
+                        user_id=user_id,
+                        memory_text=payload["memory_text"],
+                        categories=merged,
+                        date=payload.get("date", ""),
+                        embedding=points[keep].vector,
+                    ),
+                )
+                stats["updated"] += 1
+    return dict(stats)
+
+
+_compacted: dict[str, tuple[int, int]] = {}
+_task = None
+
+
+async def compact_changed_users(dry_run: bool = COMPACTION_DRY_RUN) -> dict:
+    """One background pass over users written to since their last pass."""
+    totals = Counter()
+    llm_checks = COMPACTION_MAX_LLM_CHECKS
+    users = [u for u in written_users() if _compacted.get(u) != write_generation(u)]
+    for user_id in users[:COMPACTION_MAX_USERS]:
+        stats = await compact_user(user_id, dry_run=dry_run, llm_checks=llm_checks)
+        stats.pop("planned", None)
+        llm_checks -= stats.get("llm_checks", 0)
+        totals.update(stats)
+        totals["users"] += 1
+        if not dry_run:
+            _compacted[user_id] = write_generation(user_id)
+        await asyncio.sleep(COMPACTION_USER_DELAY_SECONDS)
+    compaction_stats.update(totals)
+    return dict(totals)
+
+
+async def _compact_forever():
+    while True:
+        await asyncio.sleep(COMPACTION_INTERVAL_SECONDS)
+        try:
+            totals = await compact_changed_users()
+            if totals:
+                print(f"compaction: {json.dumps(totals)}")
+        except Exception as e:
+            print(f"compaction failed: {e!r}")
+
+
+def start_compaction():
+    global _task
+    if COMPACTION_INTERVAL_SECONDS > 0:
+        _task = asyncio.create_task(_compact_forever())
+
+
+async def stop_compaction():
+    if _task:
+        _task.cancel()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--user", required=True)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    stats = await compact_user(args.user, dry_run=args.dry_run)
+    print(json.dumps(stats, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
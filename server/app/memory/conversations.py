@@ -0,0 +1,131 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+CONVERSATION_LOG_PATH = os.getenv("CONVERSATION_LOG_PATH", "conversations.db")
+# conversations without new turns for this long are forgotten (their next
+# post is ingested in full again), and each user keeps at most the latest
+# CONVERSATION_LOG_MAX_PER_USER; 0 turns either off
+CONVERSATION_LOG_TTL_SECONDS = float(os.getenv("CONVERSATION_LOG_TTL_SECONDS", "2592000"))
+CONVERSATION_LOG_MAX_PER_USER = int(os.getenv("CONVERSATION_LOG_MAX_PER_USER", "1000"))
+# already-ingested messages shown to the extractor before the new ones, so
+# a new turn like "yes, that one" still has its context
+INGEST_OVERLAP_MESSAGES = int(os.getenv("INGEST_OVERLAP_MESSAGES", "2"))
+
+# expired conversations are deleted on every this many marks
+_PRUNE_EVERY = 100
+
+
+def message_hashes(messages: list[dict]) -> list[str]:
+    """Chained hashes: hash i covers messages[:i + 1], in order.
+
+    A message only matches if everything before it matches too, so an
+    edited or branched transcript is re-ingested from the first change.
+    """
+    hashes = []
+    previous = ""
+    for message in messages:
+        data = json.dumps([previous, message.get("role"), message.get("content")])
+        previous = hashlib.sha256(data.encode()).hexdigest()
+        hashes.append(previous)
+    return hashes
+
+
+class ConversationLog:
+    """Which prefixes of each (user, conversation) have been ingested.
+
+    Stored in sqlite so a client re-posting its full transcript after a
+    restart still only pays for the new turns. Old and surplus
+    conversations are pruned as new ones are marked.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        ttl_seconds: float = CONVERSATION_LOG_TTL_SECONDS,
+        max_per_user: int = CONVERSATION_LOG_MAX_PER_USER,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_per_user = max_per_user
+        self._marks = 0
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS ingested ("
+                " user_id TEXT NOT NULL, conversation_id TEXT NOT NULL,"
+                " prefix_hash TEXT NOT NULL, ingested_at REAL NOT NULL,"
+                " PRIMARY KEY (user_id, conversation_id, prefix_hash))"
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS ingested_age ON ingested (ingested_at)"
+            )
+            self._db.commit()
+
+    def processed_count(self, user_id: str, conversation_id: str, hashes: list[str]) -> int:
+        """How many leading messages were already ingested."""
+        if not hashes:
+            return 0
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT prefix_hash FROM ingested WHERE user_id = ? AND conversation_id = ?"
+                f" AND prefix_hash IN ({','.join('?' * len(hashes))})",
+                (user_id, conversation_id, *hashes),
+            ).fetchall()
+        seen = {row[0] for row in rows}
+        for i in range(len(hashes), 0, -1):
+            if hashes[i - 1] in seen:
+                return i
+        return 0
+
+    def mark(self, user_id: str, conversation_id: str, hashes: list[str]):
+        now = time.time()
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO ingested"
+                " (user_id, conversation_id, prefix_hash, ingested_at) VALUES (?, ?, ?, ?)",
+                [(user_id, conversation_id, h, now) for h in hashes],
+            )
+            self._marks += 1
+            if self.ttl_seconds and self._marks % _PRUNE_EVERY == 0:
+                self._db.execute(
+                    "DELETE FROM ingested WHERE ingested_at < ?", (now - self.ttl_seconds,)
+                )
+            if self.max_per_user:
+                self._db.execute(
+                    "DELETE FROM ingested WHERE user_id = ? AND conversation_id NOT IN ("
+                    " SELECT conversation_id FROM ingested WHERE user_id = ?"
+                    " GROUP BY conversation_id ORDER BY MAX(ingested_at) DESC LIMIT ?)",
+                    (user_id, user_id, self.max_per_user),
+                )
+            self._db.commit()
+
+
+_log: Optional[ConversationLog] = None
+_log_lock = threading.Lock()
+
+
+def get_conversation_log() -> ConversationLog:
+    """The process's log, opened on first use rather than on import."""
+    global _log
+    with _log_lock:
+        if _log is None:
+            _log = ConversationLog(CONVERSATION_LOG_PATH)
+        return _log
+
+
+async def processed_count(user_id: str, conversation_id: str, hashes: list[str]) -> int:
+    return await asyncio.to_thread(
+        lambda: get_conversation_log().processed_count(user_id, conversation_id, hashes)
+    )
+
+
+async def mark_ingested(user_id: str, conversation_id: str, hashes: list[str]):
+    await asyncio.to_thread(
+        lambda: get_conversation_log().mark(user_id, conversation_id, hashes)
+    )
@@ -1,12 +1,35 @@
+import asyncio
+import hashlib
 import os
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
 
 from app.memory.extract_memory import Memory
+from app.memory.single_flight import SingleFlight
+from app.metrics import observe, timed
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 
 load_dotenv()
 
+EMBEDDING_MODEL = "text-embedding-3-small"
+# text-embedding-3 models can return shorter vectors; must match the collection
+EMBED_DIMENSIONS = int(os.getenv("EMBED_DIMENSIONS", "1536"))
+# cache entries are only valid for the same model and output size
+EMBEDDING_KEY = f"{EMBEDDING_MODEL}:{EMBED_DIMENSIONS}"
+# max texts sent in one embeddings request, and how long to wait for more
+# texts to arrive before sending a partial batch
+EMBED_MAX_BATCH_SIZE = int(os.getenv("EMBED_MAX_BATCH_SIZE", "64"))
+EMBED_BATCH_WAIT_MS = float(os.getenv("EMBED_BATCH_WAIT_MS", "5"))
+# in-memory LRU size, and an optional sqlite file that keeps vectors across restarts
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "10000"))
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH")
+
 client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+async_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
 
 def embed_memories(memories: list[Memory]) -> list[list[float]]:
@@ -15,16 +38,264 @@ def embed_memories(memories: list[Memory]) -> list[list[float]]:
         for mem in memories
     ]
     response = client.embeddings.create(
-        model="text-embedding-3-small",
+        model=EMBEDDING_MODEL,
         input=emb_strings,
+        dimensions=EMBED_DIMENSIONS,
     )
 
     return [item.embedding for item in response.data]
 
 
+class EmbeddingCache:
+    """Content-addressed embedding cache keyed by (model, sha256(text)).
+
+    Keeps the most recently used vectors in memory. When a path is given,
+    vectors are also kept in sqlite as float32 so the cache survives
+    restarts; get and put only touch memory, so they are safe on the event
+    loop, while load and save do the sqlite work in batches and belong on
+    a thread. Safe to use from the event loop and worker threads.
+    """
+
+    def __init__(self, max_entries: int, path: str | None = None):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, list[float]] = OrderedDict()
+        self._unsaved: dict[str, list[float]] = {}
+        self._lock = threading.Lock()
+        self._db = None
+        self._db_lock = threading.Lock()
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)"
+            )
+            self._db.commit()
+
+    @property
+    def persistent(self) -> bool:
+        return self._db is not None
+
+    @staticmethod
+    def key(model: str, text: str) -> str:
+        return f"{model}:{hashlib.sha256(text.encode()).hexdigest()}"
+
+    def get(self, model: str, text: str) -> list[float] | None:
+        key = self.key(model, text)
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return vector
+
+    def load(self, model: str, texts: list[str]) -> dict[str, list[float]]:
+        """Read texts from sqlite into memory; returns the ones found. Blocking."""
+        if self._db is None or not texts:
+            return {}
+        keys = {self.key(model, text): text for text in texts}
+        with self._db_lock:
+            rows = self._db.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(keys))})",
+                list(keys),
+            ).fetchall()
+        found = {}
+        with self._lock:
+            for key, blob in rows:
+                vector = array("f", blob).tolist()
+                self._remember(key, vector)
+                found[keys[key]] = vector
+        return found
+
+    def put(self, model: str, text: str, vector: list[float]):
+        key = self.key(model, text)
+        with self._lock:
+            self._remember(key, vector)
+            if self._db is not None:
+                self._unsaved[key] = vector
+
+    def save(self):
+        """Write the vectors put since the last save in one transaction. Blocking."""
+        with self._lock:
+            unsaved, self._unsaved = self._unsaved, {}
+        if not unsaved:
+            return
+        with self._db_lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [(key, array("f", vector).tobytes()) for key, vector in unsaved.items()],
+            )
+            self._db.commit()
+
+    def _remember(self, key: str, vector: list[float]):
+        self._entries[key] = vector
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+            }
+
+
+cache = EmbeddingCache(EMBED_CACHE_SIZE, EMBED_CACHE_PATH)
+# concurrent requests for a text that is not cached yet share one embedding
+embed_flight = SingleFlight()
+
+
+def _cached_in_thread(text: str) -> list[float] | None:
+    vector = cache.get(EMBEDDING_KEY, text)
+    if vector is None:
+        vector = cache.load(EMBEDDING_KEY, [text]).get(text)
+    return vector
+
+
 def embed_single(memory: str):
-    response = client.embeddings.create(
-        model="text-embedding-3-small",
-        input=memory,
-    )
-    return response.data[0].embedding
+    cached = _cached_in_thread(memory)
+    if cached is not None:
+        return cached
+
+    def _embed():
+        start = time.perf_counter()
+        response = client.embeddings.create(
+            model=EMBEDDING_MODEL,
+            input=memory,
+            dimensions=EMBED_DIMENSIONS,
+        )
+        observe("stage_duration_seconds", time.perf_counter() - start, stage="embed_api")
+        embedding = response.data[0].embedding
+        cache.put(EMBEDDING_KEY, memory, embedding)
+        cache.save()
+        return embedding
+
+    return embed_flight.call(memory, _embed)
+
+
+class EmbeddingBatcher:
+    """Collects texts from concurrent callers and embeds them in batched requests.
+
+    Texts queued within EMBED_BATCH_WAIT_MS of each other share one
+    embeddings call (up to max_batch_size texts), so a whole conversation,
+    or several concurrent ones, costs a single round trip.
+    """
+
+    def __init__(self, max_batch_size: int, wait_ms: float):
+        self.max_batch_size = max_batch_size
+        self.wait_ms = wait_ms
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self._pending: list[tuple[str, asyncio.Future]] = []
+        self._timer: asyncio.TimerHandle | None = None
+
+    async def embed(self, texts: list[str]) -> list[list[float]]:
+        if not texts:
+            return []
+        self.loop = asyncio.get_running_loop()
+        futures = []
+        for text in texts:
+            future = self.loop.create_future()
+            self._pending.append((text, future))
+            futures.append(future)
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = self.loop.call_later(self.wait_ms / 1000, self._flush)
+        return list(await asyncio.gather(*futures))
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        pending, self._pending = self._pending, []
+        for i in range(0, len(pending), self.max_batch_size):
+            self.loop.create_task(self._send(pending[i : i + self.max_batch_size]))
+
+    async def _send(self, batch: list[tuple[str, asyncio.Future]]):
+        # identical texts in one batch are only sent once
+        unique_texts = list(dict.fromkeys(text for text, _ in batch))
+        start = time.perf_counter()
+        try:
+            response = await async_client.embeddings.create(
+                model=EMBEDDING_MODEL,
+                input=unique_texts,
+                dimensions=EMBED_DIMENSIONS,
+            )
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        # not a span: the batch serves several requests
+        observe("stage_duration_seconds", time.perf_counter() - start, stage="embed_api")
+        vectors = {
+            text: item.embedding for text, item in zip(unique_texts, response.data)
+        }
+        for text, future in batch:
+            if not future.done():
+                future.set_result(vectors[text])
+
+
+batcher = EmbeddingBatcher(EMBED_MAX_BATCH_SIZE, EMBED_BATCH_WAIT_MS)
+
+
+@timed("embed")
+async def embed_texts(texts: list[str]) -> list[list[float]]:
+    vectors = {}
+    for text in texts:
+        if text not in vectors:
+            vectors[text] = cache.get(EMBEDDING_KEY, text)
+    missing = [text for text, vector in vectors.items() if vector is None]
+    if missing and cache.persistent:
+        vectors.update(await asyncio.to_thread(cache.load, EMBEDDING_KEY, missing))
+        missing = [text for text in missing if vectors[text] is None]
+    if missing:
+        # each text is its own flight; the batcher still sends them together
+        found = await asyncio.gather(
+            *[embed_flight.do(text, lambda text=text: _embed_uncached(text)) for text in missing]
+        )
+        vectors.update(zip(missing, found))
+        if cache.persistent:
+            await asyncio.to_thread(cache.save)
+    return [vectors[text] for text in texts]
+
+
+async def _embed_uncached(text: str) -> list[float]:
+    vector = (await batcher.embed([text]))[0]
+    cache.put(EMBEDDING_KEY, text, vector)
+    return vector
+
+
+async def embed_text(text: str) -> list[float]:
+    return (await embed_texts([text]))[0]
+
+
+def embed_from_thread(text: str) -> list[float]:
+    """Embed from a worker thread (e.g. the dspy tools) via the shared batcher.
+
+    Falls back to a direct call when no event loop is serving the batcher,
+    e.g. when the tools are used from a script.
+    """
+    loop = batcher.loop
+    if loop is None or loop.is_closed() or not loop.is_running():
+        return embed_single(text)
+    try:
+        if asyncio.get_running_loop() is loop:
+            # blocking on the batcher from its own loop would deadlock
+            return embed_single(text)
+    except RuntimeError:
+        pass
+    cached = _cached_in_thread(text)
+    if cached is not None:
+        return cached
+    flight = embed_flight.do(text, lambda: _embed_uncached(text))
+    vector = asyncio.run_coroutine_threadsafe(flight, loop).result()
+    if cache.persistent:
+        cache.save()
+    return vector
@@ -1,6 +1,7 @@
 import json
 
 import dspy
+from app.memory.lm import get_lm
 from dotenv import load_dotenv
 from pydantic import BaseModel
 
@@ -17,8 +18,11 @@ class MemoryExtract(dspy.Signature):
     extract relevant information from the converstation . create memory entires that you should remeber when speaking with the user later. Each memory is an unique atomic factoid.return a list of individual memory entries, one fact per item
 
     you will be provided a list of existing categories in the memory database. when predicting the category of this information, you can decide to create new categories , or pick from an existing one if it exists
+
+    earlier messages of the conversation may be given as context. they were already processed, so only extract memories from the transcript
     """
 
+    context: str = dspy.InputField(desc="earlier messages, for reference only")
     transcript: str = dspy.InputField()
     existing_categories: list[str] = dspy.InputField()
     no_info: bool = dspy.OutputField(
@@ -30,11 +34,14 @@ class MemoryExtract(dspy.Signature):
 memory_extractor = dspy.Predict(MemoryExtract)
 
 
-def memory_extract_from_messages(messages, existing_categories):
+def memory_extract_from_messages(messages, existing_categories, context_messages=None):
     transcript = json.dumps(messages)
-    with dspy.context(lm=dspy.LM(model="gpt-4o-mini")):
+    context = json.dumps(context_messages) if context_messages else ""
+    with dspy.context(lm=get_lm("gpt-4o-mini", cache=True)):
         out = memory_extractor(
-            transcript=transcript, existing_categories=existing_categories
+            context=context,
+            transcript=transcript,
+            existing_categories=existing_categories,
         )
     if out.no_info:
         return []
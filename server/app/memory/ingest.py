@@ -0,0 +1,120 @@
+import asyncio
+import os
+from typing import Awaitable, Callable, Optional
+
+from app.memory.batch_reconciler import reconcile_batch
+from app.memory.categories import prompt_categories
+from app.memory.conversations import (
+    INGEST_OVERLAP_MESSAGES,
+    mark_ingested,
+    message_hashes,
+    processed_count,
+)
+from app.memory.embed_memory import embed_texts
+from app.memory.extract_memory import Memory, memory_extract_from_messages
+from app.memory.lm import run_llm
+from app.memory.locks import memory_locks
+from app.memory.tool_caller import reconcile_memory
+from app.memory.vector_DB import search_memories, unit_of_work, user_categories
+from app.metrics import span
+
+# how many facts from one conversation are reconciled at the same time
+INGEST_CONCURRENCY = int(os.getenv("INGEST_CONCURRENCY", "4"))
+# "agent" reconciles each fact with the ReAct agent, "batch" reconciles a
+# whole conversation with one structured LLM call
+RECONCILE_ENGINE = os.getenv("RECONCILE_ENGINE", "agent")
+
+
+async def reconcile_fact(memory: Memory, embedding: list[float], user_id: str) -> str:
+    async def _find():
+        return {str(r.id): r for r in await search_memories(embedding, user_id)}
+
+    async with memory_locks.hold_found(user_id, _find) as found:
+        # the fact's writes are flushed before its locks are released
+        async with unit_of_work(user_id) as uow:
+            uow.remember(found.values())
+            return await reconcile_memory(memory, list(found.values()), user_id)
+
+
+async def reconcile_memories(
+    memories: list[Memory],
+    user_id: str,
+    on_fact_done: Optional[Callable[[str], Awaitable[None]]] = None,
+) -> list[str]:
+    """Embed, retrieve and reconcile every fact, INGEST_CONCURRENCY at a time."""
+    embeddings = await embed_texts([memory.information for memory in memories])
+    semaphore = asyncio.Semaphore(INGEST_CONCURRENCY)
+
+    async def _run(memory: Memory, embedding: list[float]) -> str:
+        async with semaphore:
+            action = await reconcile_fact(memory, embedding, user_id)
+        if on_fact_done:
+            await on_fact_done(action)
+        return action
+
+    return await asyncio.gather(
+        *[_run(memory, embedding) for memory, embedding in zip(memories, embeddings)]
+    )
+
+
+async def ingest_conversation(
+    messages: list[dict],
+    user_id: str,
+    on_progress: Optional[Callable[[str, int, int, list[str]], Awaitable[None]]] = None,
+    engine: str = RECONCILE_ENGINE,
+    conversation_id: Optional[str] = None,
+) -> list[str]:
+    """Extract facts from a conversation and reconcile them into memory.
+
+    With a conversation_id, messages already ingested for that conversation
+    are skipped: only the new ones are extracted from, with the last
+    INGEST_OVERLAP_MESSAGES before them as context.
+
+    on_progress(stage, processed, total, actions) is awaited after
+    extraction and after every reconciled fact.
+    """
+    if conversation_id is None:
+        return await _ingest(messages, [], user_id, on_progress, engine)
+
+    # one ingest per conversation at a time, so two posts of the same new
+    # turns can't both see them as unprocessed
+    async with memory_locks.hold(user_id, {f"conversation:{conversation_id}"}):
+        hashes = message_hashes(messages)
+        done = await processed_count(user_id, conversation_id, hashes)
+        if done == len(messages):
+            if on_progress:
+                await on_progress("reconciling", 0, 0, [])
+            return []
+        context = messages[max(0, done - INGEST_OVERLAP_MESSAGES) : done]
+        actions = await _ingest(messages[done:], context, user_id, on_progress, engine)
+        await mark_ingested(user_id, conversation_id, hashes[done:])
+        return actions
+
+
+async def _ingest(
+    messages: list[dict],
+    context: list[dict],
+    user_id: str,
+    on_progress: Optional[Callable[[str, int, int, list[str]], Awaitable[None]]],
+    engine: str,
+) -> list[str]:
+    # show the extractor the user's categories so it reuses their names
+    existing_categories = prompt_categories(await user_categories(user_id))
+    with span("extract"):
+        memories = await run_llm(
+            memory_extract_from_messages, messages, existing_categories, context
+        )
+    actions: list[str] = []
+    if on_progress:
+        await on_progress("reconciling", 0, len(memories), actions)
+
+    async def _fact_done(action: str):
+        actions.append(action)
+        if on_progress:
+            await on_progress("reconciling", len(actions), len(memories), actions)
+
+    if engine == "batch":
+        for action in await reconcile_batch(memories, user_id):
+            await _fact_done(action)
+        return actions
+    return await reconcile_memories(memories, user_id, on_fact_done=_fact_done)
@@ -0,0 +1,273 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+from uuid import uuid4
+
+from app.memory.ingest import ingest_conversation
+
+INGEST_QUEUE_PATH = os.getenv("INGEST_QUEUE_PATH", "ingest_jobs.db")
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+INGEST_MAX_ATTEMPTS = int(os.getenv("INGEST_MAX_ATTEMPTS", "3"))
+# retry n waits INGEST_RETRY_BACKOFF_SECONDS * 2^(n-1)
+INGEST_RETRY_BACKOFF_SECONDS = float(os.getenv("INGEST_RETRY_BACKOFF_SECONDS", "2"))
+# how long shutdown waits for in-flight jobs before leaving them for the next start
+INGEST_DRAIN_TIMEOUT_SECONDS = float(os.getenv("INGEST_DRAIN_TIMEOUT_SECONDS", "30"))
+
+_POLL_SECONDS = 1.0
+
+
+class IngestQueue:
+    """Durable sqlite-backed queue of ingest jobs.
+
+    Jobs move queued -> running -> done, or back to queued with a backoff
+    when they fail, until INGEST_MAX_ATTEMPTS is reached and they are marked
+    failed. Jobs left running by a previous process are re-queued on start.
+    The methods block on sqlite; call them from a worker thread.
+    """
+
+    def __init__(self, path: str):
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self._db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    user_id TEXT NOT NULL,
+                    messages TEXT NOT NULL,
+                    conversation_id TEXT,
+                    status TEXT NOT NULL,
+                    stage TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    run_after REAL NOT NULL,
+                    processed INTEGER NOT NULL DEFAULT 0,
+                    total INTEGER,
+                    actions TEXT NOT NULL DEFAULT '[]',
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, run_after)"
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS jobs_user ON jobs (user_id, status)"
+            )
+            self._db.commit()
+
+    def enqueue(
+        self, user_id: str, messages: list[dict], conversation_id: Optional[str] = None
+    ) -> str:
+        job_id = uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO jobs (id, user_id, messages, conversation_id, status, stage,"
+                " run_after, created_at, updated_at)"
+                " VALUES (?, ?, ?, ?, 'queued', 'queued', ?, ?, ?)",
+                (job_id, user_id, json.dumps(messages), conversation_id, now, now, now),
+            )
+            self._db.commit()
+        return job_id
+
+    def claim(self) -> Optional[dict]:
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT * FROM jobs WHERE status = 'queued' AND run_after <= ?"
+                " ORDER BY run_after LIMIT 1",
+                (now,),
+            ).fetchone()
+            if not row:
+                return None
+            self._db.execute(
+                "UPDATE jobs SET status = 'running', stage = 'extracting',"
+                " attempts = attempts + 1, processed = 0, updated_at = ? WHERE id = ?",
+                (now, row["id"]),
+            )
+            self._db.commit()
+        job = dict(row)
+        job["attempts"] += 1
+        job["messages"] = json.loads(job["messages"])
+        return job
+
+    def progress(self, job_id: str, stage: str, processed: int, total: int, actions: list[str]):
+        # facts finish concurrently, so their updates can arrive out of
+        # order; an older one never replaces a newer one
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET stage = ?, processed = ?, total = ?, actions = ?,"
+                " updated_at = ? WHERE id = ? AND processed <= ?",
+                (stage, processed, total, json.dumps(actions), time.time(), job_id, processed),
+            )
+            self._db.commit()
+
+    def complete(self, job_id: str, actions: list[str]):
+        self._update(
+            job_id,
+            status="done",
+            stage="done",
+            processed=len(actions),
+            actions=json.dumps(actions),
+            error=None,
+        )
+
+    def fail(self, job_id: str, attempts: int, error: str):
+        if attempts >= INGEST_MAX_ATTEMPTS:
+            self._update(job_id, status="failed", stage="failed", error=error)
+            return
+        backoff = INGEST_RETRY_BACKOFF_SECONDS * 2 ** (attempts - 1)
+        self._update(
+            job_id,
+            status="queued",
+            stage="retrying",
+            run_after=time.time() + backoff,
+            error=error,
+        )
+
+    def active_count(self, user_id: str) -> int:
+        """Jobs of user_id that are queued or running."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT COUNT(*) FROM jobs WHERE user_id = ? AND status IN ('queued', 'running')",
+                (user_id,),
+            ).fetchone()
+        return row[0]
+
+    def requeue_running(self) -> int:
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE jobs SET status = 'queued', stage = 'queued', updated_at = ?"
+                " WHERE status = 'running'",
+                (time.time(),),
+            )
+            self._db.commit()
+        return cursor.rowcount
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT * FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if not row:
+            return None
+        job = dict(row)
+        job["messages"] = json.loads(job["messages"])
+        job["actions"] = json.loads(job["actions"])
+        return job
+
+    def _update(self, job_id: str, **fields):
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._db.execute(
+                f"UPDATE jobs SET {assignments} WHERE id = ?",
+                (*fields.values(), job_id),
+            )
+            self._db.commit()
+
+
+_queue: Optional[IngestQueue] = None
+_queue_lock = threading.Lock()
+
+
+def get_queue() -> IngestQueue:
+    """The process's queue, opened on first use rather than on import."""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = IngestQueue(INGEST_QUEUE_PATH)
+        return _queue
+
+
+_wakeup = asyncio.Event()
+_stopping = False
+_workers: list[asyncio.Task] = []
+
+
+async def submit_ingest_job(
+    user_id: str, messages: list[dict], conversation_id: Optional[str] = None
+) -> str:
+    job_id = await asyncio.to_thread(
+        lambda: get_queue().enqueue(user_id, messages, conversation_id)
+    )
+    _wakeup.set()
+    return job_id
+
+
+async def get_job(job_id: str) -> Optional[dict]:
+    return await asyncio.to_thread(lambda: get_queue().get(job_id))
+
+
+async def active_jobs(user_id: str) -> int:
+    return await asyncio.to_thread(lambda: get_queue().active_count(user_id))
+
+
+async def _run_job(job: dict):
+    queue = get_queue()
+
+    async def _progress(stage: str, processed: int, total: int, actions: list[str]):
+        await asyncio.to_thread(
+            queue.progress, job["id"], stage, processed, total, list(actions)
+        )
+
+    try:
+        actions = await ingest_conversation(
+            job["messages"],
+            job["user_id"],
+            on_progress=_progress,
+            conversation_id=job["conversation_id"],
+        )
+    except Exception as e:
+        print(f"ingest job {job['id']} failed (attempt {job['attempts']}): {e!r}")
+        await asyncio.to_thread(queue.fail, job["id"], job["attempts"], repr(e))
+    else:
+        await asyncio.to_thread(queue.complete, job["id"], actions)
+
+
+async def _worker():
+    queue = get_queue()
+    while not _stopping:
+        job = await asyncio.to_thread(queue.claim)
+        if job is None:
+            _wakeup.clear()
+            try:
+                await asyncio.wait_for(_wakeup.wait(), timeout=_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        await _run_job(job)
+
+
+async def start_workers(count: int = INGEST_WORKERS):
+    global _stopping
+    _stopping = False
+    requeued = await asyncio.to_thread(lambda: get_queue().requeue_running())
+    if requeued:
+        print(f"re-queued {requeued} interrupted ingest jobs")
+    _workers.extend(asyncio.create_task(_worker()) for _ in range(count))
+
+
+async def stop_workers(timeout: float = INGEST_DRAIN_TIMEOUT_SECONDS):
+    """Stop claiming new jobs and let in-flight ones finish.
+
+    Jobs still running after the timeout are cancelled; they stay marked
+    running in the queue and are picked up again on the next start.
+    """
+    global _stopping
+    _stopping = True
+    _wakeup.set()
+    if not _workers:
+        return
+    _, pending = await asyncio.wait(_workers, timeout=timeout)
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+    _workers.clear()
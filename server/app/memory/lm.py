@@ -0,0 +1,329 @@
+"""Process-wide dspy LMs.
+
+get_lm(model) returns the same LM for every call instead of a new
+dspy.LM per request, so litellm's clients and their connection pools are
+reused. Calls to one model are capped at its concurrency limit, and LMs
+asked for with cache=True answer repeated prompts (same model, messages
+and settings) from a bounded, expiring response cache. Only ask for it
+where the answer depends on nothing but the prompt, e.g. extraction.
+
+Blocking LLM work runs through run_llm rather than asyncio.to_thread: on
+dedicated threads, with chat on threads of its own and ahead of
+background work (ingest, compaction) when a model is at its limit.
+Streamed completions (LM.stream) take the same slots and cache.
+"""
+
+import asyncio
+import contextvars
+import functools
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing, asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Callable, Optional, TypeVar
+
+import dspy
+import litellm
+from app.metrics import count_request_tokens, observe, record_llm_usage
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# in-flight calls per model; LM_CONCURRENCY overrides it per model,
+# e.g. "gpt-4o=8,gpt-4o-mini=32"
+LM_MAX_CONCURRENCY = int(os.getenv("LM_MAX_CONCURRENCY", "16"))
+LM_CONCURRENCY = {
+    model: int(limit)
+    for model, _, limit in (
+        item.partition("=") for item in os.getenv("LM_CONCURRENCY", "").split(",") if item
+    )
+}
+LM_CACHE_SIZE = int(os.getenv("LM_CACHE_SIZE", "2048"))
+LM_CACHE_TTL_SECONDS = float(os.getenv("LM_CACHE_TTL_SECONDS", "86400"))
+# threads for blocking LLM calls, apart from asyncio's default pool
+LLM_THREADS = int(os.getenv("LLM_THREADS", "32"))
+CHAT_LLM_THREADS = int(os.getenv("CHAT_LLM_THREADS", "16"))
+
+# priorities, lower goes first
+CHAT = 0
+BACKGROUND = 1
+llm_priority: ContextVar[int] = ContextVar("llm_priority", default=BACKGROUND)
+
+T = TypeVar("T")
+
+# dspy appends every call to LM.history; a shared LM keeps only this many
+# per thread
+_HISTORY_SIZE = 100
+
+
+class ResponseCache:
+    """Thread-safe LRU of LM outputs keyed by a hash of the request, with a TTL."""
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, tuple[float, list]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(model: str, prompt, messages, kwargs: dict) -> str:
+        request = json.dumps(
+            {"model": model, "prompt": prompt, "messages": messages, "kwargs": kwargs},
+            sort_keys=True,
+            default=str,
+        )
+        return hashlib.sha256(request.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[list]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: str, outputs: list):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, outputs)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+
+class PrioritySemaphore:
+    """Counting semaphore for threads that serves waiters by priority.
+
+    A waiter only gets a slot when nobody of a higher priority is waiting,
+    so chat calls overtake queued background calls.
+    """
+
+    def __init__(self, value: int):
+        self.value = value
+        self._waiting = [0, 0]
+        self._condition = threading.Condition()
+
+    def acquire(self, priority: int):
+        with self._condition:
+            self._waiting[priority] += 1
+            while self.value <= 0 or any(self._waiting[:priority]):
+                self._condition.wait()
+            self._waiting[priority] -= 1
+            self.value -= 1
+
+    def release(self):
+        with self._condition:
+            self.value += 1
+            self._condition.notify_all()
+
+    @contextmanager
+    def hold(self, priority: int):
+        self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def hold_async(self, priority: int):
+        """hold() for coroutines; the wait happens on an LLM thread."""
+        loop = asyncio.get_running_loop()
+        acquiring = loop.run_in_executor(_executors[priority], self.acquire, priority)
+        try:
+            await asyncio.shield(acquiring)
+        except asyncio.CancelledError:
+            # the thread still gets the slot, so hand it straight back
+            def _give_back(future):
+                if not future.cancelled() and future.exception() is None:
+                    self.release()
+
+            acquiring.add_done_callback(_give_back)
+            raise
+        try:
+            yield
+        finally:
+            self.release()
+
+
+class _History(threading.local):
+    def __init__(self):
+        self.entries = []
+
+
+class PooledLM(dspy.LM):
+    """A dspy.LM shared across requests.
+
+    Waits for a slot of its model's semaphore, at the caller's priority
+    (see run_llm), before each call and, when given a response cache,
+    looks the request up there first. dspy's own unbounded cache is
+    turned off. History is kept per thread, so each call can read its own
+    entry and add its tokens to the request's (see count_request_tokens).
+    """
+
+    def __init__(
+        self,
+        model: str,
+        limit: PrioritySemaphore,
+        response_cache: Optional[ResponseCache] = None,
+        **kwargs,
+    ):
+        self._history = _History()
+        super().__init__(model=model, cache=False, **kwargs)
+        self.limit = limit
+        self.response_cache = response_cache
+
+    @property
+    def history(self) -> list:
+        return self._history.entries
+
+    @history.setter
+    def history(self, entries: list):
+        self._history.entries = entries
+
+    def __call__(self, prompt=None, messages=None, **kwargs):
+        key = None
+        if self.response_cache is not None:
+            key = ResponseCache.key(self.model, prompt, messages, kwargs)
+            outputs = self.response_cache.get(key)
+            if outputs is not None:
+                return outputs
+        start = time.perf_counter()
+        calls = len(self.history)
+        with self.limit.hold(llm_priority.get()):
+            observe("stage_duration_seconds", time.perf_counter() - start, stage="llm_wait")
+            outputs = self.complete(prompt, messages, **kwargs)
+        if len(self.history) > calls:
+            usage = self.history[-1].get("usage") or {}
+            count_request_tokens(usage.get("prompt_tokens"), usage.get("completion_tokens"))
+        if len(self.history) > _HISTORY_SIZE:
+            del self.history[:-_HISTORY_SIZE]
+        if key is not None:
+            self.response_cache.put(key, outputs)
+        return outputs
+
+    def complete(self, prompt, messages, **kwargs) -> list:
+        """The provider call itself."""
+        return super().__call__(prompt=prompt, messages=messages, **kwargs)
+
+    async def stream(
+        self, messages: list[dict], priority: int = BACKGROUND, **kwargs
+    ) -> AsyncIterator[str]:
+        """Yield the completion of messages in chunks as they arrive.
+
+        Holds a slot of the model's semaphore while the stream is open and
+        uses the response cache like __call__; a cached answer comes as
+        one chunk.
+        """
+        key = None
+        if self.response_cache is not None:
+            key = ResponseCache.key(self.model, None, messages, {**kwargs, "stream": True})
+            outputs = self.response_cache.get(key)
+            if outputs is not None:
+                yield outputs[0]
+                return
+        chunks = []
+        start = time.perf_counter()
+        async with self.limit.hold_async(priority):
+            observe("stage_duration_seconds", time.perf_counter() - start, stage="llm_wait")
+            async with aclosing(self.stream_complete(messages, **kwargs)) as stream:
+                async for chunk in stream:
+                    chunks.append(chunk)
+                    yield chunk
+        if key is not None:
+            self.response_cache.put(key, ["".join(chunks)])
+
+    async def stream_complete(self, messages: list[dict], **kwargs) -> AsyncIterator[str]:
+        """The provider call itself, streamed."""
+        response = await litellm.acompletion(
+            model=self.model,
+            messages=messages,
+            stream=True,
+            stream_options={"include_usage": True},
+            **{**self.kwargs, **kwargs},
+        )
+        async for chunk in response:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+            if getattr(chunk, "usage", None):
+                # litellm's success callbacks don't run for async streams
+                record_llm_usage({"model": self.model}, chunk, None, None)
+                count_request_tokens(
+                    chunk.usage.prompt_tokens, chunk.usage.completion_tokens
+                )
+
+
+class LMRegistry:
+    """One PooledLM per (model, cached) and one semaphore per model."""
+
+    def __init__(self, lm_class=PooledLM):
+        self.lm_class = lm_class
+        self._lms: dict[tuple[str, bool], dspy.LM] = {}
+        self._limits: dict[str, PrioritySemaphore] = {}
+        self._lock = threading.Lock()
+
+    def get(self, model: str, cache: bool = False) -> dspy.LM:
+        key = (model, cache)
+        lm = self._lms.get(key)
+        if lm is not None:
+            return lm
+        with self._lock:
+            if key not in self._lms:
+                if model not in self._limits:
+                    self._limits[model] = PrioritySemaphore(
+                        LM_CONCURRENCY.get(model, LM_MAX_CONCURRENCY)
+                    )
+                self._lms[key] = self.lm_class(
+                    model, self._limits[model], response_cache if cache else None
+                )
+            return self._lms[key]
+
+    def use(self, lm_class):
+        """Build LMs with lm_class from now on, e.g. a stand-in for benchmarks."""
+        with self._lock:
+            self.lm_class = lm_class
+            self._lms.clear()
+
+    def lms(self) -> dict[tuple[str, bool], dspy.LM]:
+        return dict(self._lms)
+
+
+response_cache = ResponseCache(LM_CACHE_SIZE, LM_CACHE_TTL_SECONDS)
+registry = LMRegistry()
+
+
+def get_lm(model: str, cache: bool = False) -> dspy.LM:
+    return registry.get(model, cache)
+
+
+_executors = {
+    CHAT: ThreadPoolExecutor(CHAT_LLM_THREADS, thread_name_prefix="llm-chat"),
+    BACKGROUND: ThreadPoolExecutor(LLM_THREADS, thread_name_prefix="llm"),
+}
+
+
+async def run_llm(fn: Callable[..., T], *args, priority: int = BACKGROUND) -> T:
+    """asyncio.to_thread for LLM work, on the LLM threads of priority.
+
+    fn runs in a copy of the caller's context, like with to_thread, so the
+    unit of work and the request's timings are still visible to it.
+    """
+    context = contextvars.copy_context()
+    context.run(llm_priority.set, priority)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _executors[priority], functools.partial(context.run, fn, *args)
+    )
@@ -0,0 +1,351 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from typing import Optional
+
+import numpy as np
+from qdrant_client.models import models
+
+_INITIAL_CAPACITY = 256
+
+
+class _UserIndex:
+    """One user's vectors as a memory-mapped matrix, one row per slot."""
+
+    def __init__(self, path: str, dim: int, dtype, capacity: int):
+        self.path = path
+        self.dim = dim
+        self.dtype = dtype
+        self.ids: list[Optional[str]] = []
+        self.categories: list[frozenset] = []
+        self.free: list[int] = []
+        self.matrix = None
+        self.alive = np.zeros(0, dtype=bool)
+        self._open(capacity)
+
+    def _open(self, capacity: int):
+        row_bytes = self.dim * np.dtype(self.dtype).itemsize
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        if size < capacity * row_bytes:
+            with open(self.path, "ab") as f:
+                f.truncate(capacity * row_bytes)
+        else:
+            capacity = size // row_bytes
+        if self.matrix is not None:
+            self.matrix.flush()
+        self.matrix = np.memmap(
+            self.path, dtype=self.dtype, mode="r+", shape=(capacity, self.dim)
+        )
+        alive = np.zeros(capacity, dtype=bool)
+        alive[: len(self.alive)] = self.alive[:capacity]
+        self.alive = alive
+
+    def slot_for(self) -> int:
+        if self.free:
+            return self.free.pop()
+        slot = len(self.ids)
+        if slot >= self.matrix.shape[0]:
+            self._open(self.matrix.shape[0] * 2)
+        self.ids.append(None)
+        self.categories.append(frozenset())
+        return slot
+
+
+class LocalVectorStore:
+    """In-process vector store with the same interface as vector_DB.QdrantStore.
+
+    Each user's vectors live in their own memory-mapped file of unit-length
+    rows, so cosine search is one matrix-vector product over that user's
+    rows; payloads and the id -> slot mapping live in sqlite. Meant for
+    single-node deployments, tests and benchmarks.
+    """
+
+    def __init__(self, directory: str, dim: int, dtype: str = "float32"):
+        self.directory = directory
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        self._lock = threading.Lock()
+        self._users: dict[str, _UserIndex] = {}
+        os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(
+            os.path.join(directory, "payloads.db"), check_same_thread=False
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS points ("
+            " id TEXT PRIMARY KEY, user_id TEXT NOT NULL, slot INTEGER NOT NULL,"
+            " payload TEXT NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS points_user ON points (user_id, slot)")
+        self._db.commit()
+
+    def _matrix_path(self, user_id: str) -> str:
+        name = hashlib.sha1(user_id.encode()).hexdigest()
+        return os.path.join(self.directory, f"{name}.{self.dtype.name}")
+
+    def _user(self, user_id: str, create: bool = True) -> Optional[_UserIndex]:
+        """The user's index, loaded on first use.
+
+        With create=False a user without points gets None instead, so
+        reads don't create a matrix file.
+        """
+        index = self._users.get(user_id)
+        if index is not None:
+            return index
+        rows = self._db.execute(
+            "SELECT id, slot, payload FROM points WHERE user_id = ?", (user_id,)
+        ).fetchall()
+        if not rows and not create:
+            return None
+        top = max((slot for _, slot, _ in rows), default=-1) + 1
+        index = _UserIndex(
+            self._matrix_path(user_id),
+            self.dim,
+            self.dtype,
+            max(_INITIAL_CAPACITY, top),
+        )
+        index.ids = [None] * top
+        index.categories = [frozenset()] * top
+        for point_id, slot, payload in rows:
+            index.ids[slot] = point_id
+            index.alive[slot] = True
+            index.categories[slot] = frozenset(json.loads(payload).get("categories", []))
+        index.free = [slot for slot in range(top) if index.ids[slot] is None]
+        self._users[user_id] = index
+        return index
+
+    def _remove(self, point_id: str):
+        row = self._db.execute(
+            "SELECT user_id, slot FROM points WHERE id = ?", (point_id,)
+        ).fetchone()
+        if not row:
+            return
+        user_id, slot = row
+        index = self._user(user_id)
+        index.ids[slot] = None
+        index.alive[slot] = False
+        index.categories[slot] = frozenset()
+        index.free.append(slot)
+        self._db.execute("DELETE FROM points WHERE id = ?", (point_id,))
+
+    async def create_collection(self):
+        print(f"local vector store at {self.directory}")
+
+    # the async interface; the work (sqlite, the memmaps, numpy) blocks, so
+    # it runs in a worker thread
+
+    async def upsert(self, points: list[models.PointStruct]):
+        await asyncio.to_thread(self._upsert, points)
+
+    async def delete(self, ids: list[str], user_id: Optional[str] = None):
+        await asyncio.to_thread(self._delete, ids, user_id)
+
+    async def delete_user(self, user_id: str):
+        await asyncio.to_thread(self._delete_user, user_id)
+
+    async def search(
+        self,
+        search_vector: list[float],
+        user_id: str,
+        categories: Optional[list[str]],
+        limit: int,
+        score_threshold: float,
+    ) -> list[models.ScoredPoint]:
+        return await asyncio.to_thread(
+            self._search, search_vector, user_id, categories, limit, score_threshold
+        )
+
+    async def search_batch(
+        self,
+        queries: list[tuple[list[float], Optional[list[str]], int]],
+        user_id: str,
+        score_threshold: float,
+    ) -> list[list[models.ScoredPoint]]:
+        return await asyncio.to_thread(self._search_batch, queries, user_id, score_threshold)
+
+    async def retrieve(
+        self, ids: list[str], with_vectors: bool = False, user_id: Optional[str] = None
+    ) -> list[models.Record]:
+        return await asyncio.to_thread(self._retrieve, ids, with_vectors, user_id)
+
+    async def scroll(
+        self,
+        user_id: Optional[str],
+        limit: int,
+        offset: Optional[int] = None,
+        with_vectors: bool = False,
+    ) -> tuple[list[models.Record], Optional[int]]:
+        """Page through a user's points in slot order; offset is the next slot.
+
+        With user_id None every point is paged in rowid order instead.
+        """
+        return await asyncio.to_thread(self._scroll, user_id, limit, offset, with_vectors)
+
+    def _upsert(self, points: list[models.PointStruct]):
+        with self._lock:
+            for point in points:
+                point_id = str(point.id)
+                user_id = point.payload["user_id"]
+                row = self._db.execute(
+                    "SELECT user_id, slot FROM points WHERE id = ?", (point_id,)
+                ).fetchone()
+                if row and row[0] == user_id:
+                    index, slot = self._user(user_id), row[1]
+                else:
+                    if row:
+                        self._remove(point_id)
+                    index = self._user(user_id)
+                    slot = index.slot_for()
+                vector = np.asarray(point.vector, dtype=np.float32)
+                norm = np.linalg.norm(vector)
+                index.matrix[slot] = vector / norm if norm else vector
+                index.ids[slot] = point_id
+                index.alive[slot] = True
+                index.categories[slot] = frozenset(point.payload.get("categories", []))
+                self._db.execute(
+                    "INSERT OR REPLACE INTO points (id, user_id, slot, payload) VALUES (?, ?, ?, ?)",
+                    (point_id, user_id, slot, json.dumps(point.payload)),
+                )
+            self._db.commit()
+
+    def _delete(self, ids: list[str], user_id: Optional[str] = None):
+        # ids are unique across users here, so user_id (a Qdrant shard key
+        # hint) is not needed to find them
+        with self._lock:
+            for point_id in ids:
+                self._remove(str(point_id))
+            self._db.commit()
+
+    def _delete_user(self, user_id: str):
+        with self._lock:
+            index = self._users.pop(user_id, None)
+            if index is not None:
+                del index.matrix
+            self._db.execute("DELETE FROM points WHERE user_id = ?", (user_id,))
+            self._db.commit()
+            path = self._matrix_path(user_id)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _search(
+        self,
+        search_vector: list[float],
+        user_id: str,
+        categories: Optional[list[str]],
+        limit: int,
+        score_threshold: float,
+    ) -> list[models.ScoredPoint]:
+        with self._lock:
+            index = self._user(user_id, create=False)
+            if index is None or not index.ids:
+                return []
+            count = len(index.ids)
+            query = np.asarray(search_vector, dtype=np.float32)
+            norm = np.linalg.norm(query)
+            if norm:
+                query = query / norm
+            rows = index.matrix[:count]
+            if rows.dtype != np.float32:
+                # numpy has no fast float16 matmul; float16 halves disk and
+                # page cache at the cost of this conversion
+                rows = rows.astype(np.float32)
+            scores = rows @ query
+            keep = index.alive[:count].copy()
+            if categories:
+                wanted = set(categories)
+                keep &= np.array([bool(c & wanted) for c in index.categories])
+            keep &= scores >= score_threshold
+            candidates = np.flatnonzero(keep)
+            if len(candidates) > limit:
+                top = np.argpartition(-scores[candidates], limit - 1)[:limit]
+                candidates = candidates[top]
+            candidates = candidates[np.argsort(-scores[candidates])]
+            ids = [index.ids[slot] for slot in candidates]
+            payloads = self._payloads(ids)
+            return [
+                models.ScoredPoint(
+                    id=point_id,
+                    version=0,
+                    score=float(scores[slot]),
+                    payload=payloads[point_id],
+                )
+                for point_id, slot in zip(ids, candidates)
+            ]
+
+    def _search_batch(
+        self,
+        queries: list[tuple[list[float], Optional[list[str]], int]],
+        user_id: str,
+        score_threshold: float,
+    ) -> list[list[models.ScoredPoint]]:
+        return [
+            self._search(search_vector, user_id, categories, limit, score_threshold)
+            for search_vector, categories, limit in queries
+        ]
+
+    def _retrieve(
+        self, ids: list[str], with_vectors: bool = False, user_id: Optional[str] = None
+    ) -> list[models.Record]:
+        if not ids:
+            return []
+        with self._lock:
+            ids = [str(point_id) for point_id in ids]
+            rows = self._db.execute(
+                f"SELECT id, user_id, slot, payload FROM points WHERE id IN ({','.join('?' * len(ids))})",
+                ids,
+            ).fetchall()
+            return [
+                models.Record(
+                    id=point_id,
+                    payload=json.loads(payload),
+                    vector=self._vector(owner, slot) if with_vectors else None,
+                )
+                for point_id, owner, slot, payload in rows
+            ]
+
+    def _scroll(
+        self,
+        user_id: Optional[str],
+        limit: int,
+        offset: Optional[int] = None,
+        with_vectors: bool = False,
+    ) -> tuple[list[models.Record], Optional[int]]:
+        with self._lock:
+            if user_id is None:
+                rows = self._db.execute(
+                    "SELECT id, user_id, slot, payload, rowid FROM points WHERE rowid >= ?"
+                    " ORDER BY rowid LIMIT ?",
+                    (offset or 0, limit + 1),
+                ).fetchall()
+            else:
+                rows = self._db.execute(
+                    "SELECT id, user_id, slot, payload, slot FROM points"
+                    " WHERE user_id = ? AND slot >= ? ORDER BY slot LIMIT ?",
+                    (user_id, offset or 0, limit + 1),
+                ).fetchall()
+            next_offset = rows[limit][4] if len(rows) > limit else None
+            return (
+                [
+                    models.Record(
+                        id=point_id,
+                        payload=json.loads(payload),
+                        vector=self._vector(owner, slot) if with_vectors else None,
+                    )
+                    for point_id, owner, slot, payload, _ in rows[:limit]
+                ],
+                next_offset,
+            )
+
+    def _payloads(self, ids: list[str]) -> dict[str, dict]:
+        if not ids:
+            return {}
+        rows = self._db.execute(
+            f"SELECT id, payload FROM points WHERE id IN ({','.join('?' * len(ids))})",
+            ids,
+        ).fetchall()
+        return {point_id: json.loads(payload) for point_id, payload in rows}
+
+    def _vector(self, user_id: str, slot: int) -> list[float]:
+        return self._user(user_id).matrix[slot].astype(np.float32).tolist()
@@ -0,0 +1,71 @@
+import asyncio
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, TypeVar
+
+T = TypeVar("T")
+
+
+class MemoryLocks:
+    """Per-(user, memory id) locks.
+
+    Facts whose retrieved neighbours overlap are reconciled one after the
+    other, so two facts never race to update or delete the same memory.
+    Locks are always taken in sorted order to avoid deadlocks. Holders
+    flush their writes before releasing, so whoever gets a lock next reads
+    the stored result.
+    """
+
+    def __init__(self):
+        self._locks: dict[tuple[str, str], asyncio.Lock] = {}
+        self._users: dict[tuple[str, str], int] = defaultdict(int)
+
+    @asynccontextmanager
+    async def hold(self, user_id: str, memory_ids: set[str]):
+        keys = [(user_id, memory_id) for memory_id in sorted(memory_ids)]
+        for key in keys:
+            self._users[key] += 1
+            self._locks.setdefault(key, asyncio.Lock())
+
+        acquired = []
+        waited = False
+        try:
+            for key in keys:
+                lock = self._locks[key]
+                waited = waited or lock.locked()
+                await lock.acquire()
+                acquired.append(lock)
+            yield waited
+        finally:
+            for lock in acquired:
+                lock.release()
+            for key in keys:
+                self._users[key] -= 1
+                if not self._users[key]:
+                    del self._users[key]
+                    del self._locks[key]
+
+    @asynccontextmanager
+    async def hold_found(
+        self, user_id: str, find: Callable[[], Awaitable[dict[str, T]]]
+    ) -> AsyncIterator[dict[str, T]]:
+        """Run find() (memories by id) and hold the locks of what it found.
+
+        If another holder had one of them, find() runs again once the locks
+        are ours, and more ids are locked until every id found is held.
+        """
+        found = await find()
+        locked_ids = set(found)
+        while True:
+            async with self.hold(user_id, locked_ids) as waited:
+                if waited:
+                    # another fact touched these memories while we queued
+                    found = await find()
+                    if not set(found) <= locked_ids:
+                        locked_ids |= set(found)
+                        continue
+                yield found
+                return
+
+
+memory_locks = MemoryLocks()
@@ -0,0 +1,218 @@
+"""Rebuild the memories collection into the layout the current config asks for.
+
+    python -m app.memory.migrate_collection --force   # migrate, then report
+    python -m app.memory.migrate_collection --report  # recall/latency report only
+
+The layout comes from vector_DB.collection_config (EMBED_DIMENSIONS,
+QDRANT_QUANTIZATION, QDRANT_LAYOUT, QDRANT_SHARD_KEYS, ...). Points are
+copied into a new collection and "memories" becomes an alias of it.
+Vectors are reused when the size is unchanged. When the new size is
+smaller they are truncated and re-normalised, which text-embedding-3
+vectors support. They are only re-embedded from memory_text when the new
+size is larger.
+
+Writes are not frozen for you: points written or deleted while the copy
+runs are not carried over, and the first migration of a real "memories"
+collection has to drop it before the alias can take its name, so searches
+fail for that moment. Stop the API (or everything that writes memories)
+first; migrating refuses to start without --force to say you have.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import statistics
+import time
+
+from app.memory.embed_memory import embed_texts
+from app.memory.vector_DB import (
+    COLLECTION_NAME,
+    QDRANT_QUANTIZATION,
+    VECTOR_SIZE,
+    QdrantStore,
+    by_shard_key,
+    client,
+    collection_config,
+    search_params,
+)
+from qdrant_client.models import models
+
+PAGE_SIZE = 256
+
+
+async def resolve_collection(name: str = COLLECTION_NAME) -> str:
+    """The physical collection behind name, following an alias if there is one."""
+    aliases = await client.get_aliases()
+    for alias in aliases.aliases:
+        if alias.alias_name == name:
+            return alias.collection_name
+    return name
+
+
+def resize(vector: list[float], size: int):
+    if len(vector) == size:
+        return vector
+    if len(vector) < size:
+        return None
+    vector = vector[:size]
+    norm = math.sqrt(sum(x * x for x in vector))
+    return [x / norm for x in vector] if norm else vector
+
+
+async def migrate() -> str:
+    """Copy every point into a new collection and point "memories" at it.
+
+    Only safe while nothing writes memories, see the module docstring.
+    """
+    source = await resolve_collection()
+    target = f"{COLLECTION_NAME}_{int(time.time())}"
+    store = QdrantStore(client)
+    await client.create_collection(collection_name=target, **collection_config())
+    await store.create_shard_keys(target)
+    await store.create_indexes(target)
+
+    copied = reembedded = 0
+    offset = None
+    while True:
+        page, offset = await client.scroll(
+            collection_name=source,
+            limit=PAGE_SIZE,
+            offset=offset,
+            with_payload=True,
+            with_vectors=True,
+        )
+        vectors = [resize(point.vector, VECTOR_SIZE) for point in page]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            fresh = await embed_texts([page[i].payload["memory_text"] for i in missing])
+            for i, vector in zip(missing, fresh):
+                vectors[i] = vector
+            reembedded += len(missing)
+        points = [
+            models.PointStruct(id=point.id, payload=point.payload, vector=vector)
+            for point, vector in zip(page, vectors)
+        ]
+        for key, group in by_shard_key(points).items():
+            await client.upsert(
+                collection_name=target, points=group, shard_key_selector=key
+            )
+        if page:
+            copied += len(page)
+            print(f"copied {copied} points ({reembedded} re-embedded)")
+        if offset is None:
+            break
+
+    # point the name at the new collection; if "memories" was a real
+    # collection it has to be dropped first, so searches fail for a moment
+    operations = []
+    if source == COLLECTION_NAME:
+        await client.delete_collection(source)
+    else:
+        operations.append(
+            models.DeleteAliasOperation(
+                delete_alias=models.DeleteAlias(alias_name=COLLECTION_NAME)
+            )
+        )
+    operations.append(
+        models.CreateAliasOperation(
+            create_alias=models.CreateAlias(
+                collection_name=target, alias_name=COLLECTION_NAME
+            )
+        )
+    )
+    await client.update_collection_aliases(change_aliases_operations=operations)
+    if source != COLLECTION_NAME:
+        await client.delete_collection(source)
+    print(f"{COLLECTION_NAME} -> {target}: {copied} points, {reembedded} re-embedded")
+    return target
+
+
+def _percentiles(samples: list[float]) -> dict:
+    ordered = sorted(samples)
+    return {
+        f"p{int(q * 100)}": ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+        for q in (0.5, 0.95, 0.99)
+    }
+
+
+async def recall_report(samples: int = 100, k: int = 10) -> dict:
+    """Compare the configured search against exact full-precision search.
+
+    Stored points are used as queries, filtered to their own user, so the
+    numbers reflect real per-user searches.
+    """
+    collection = await resolve_collection()
+    points, _ = await client.scroll(
+        collection_name=collection, limit=samples, with_payload=True, with_vectors=True
+    )
+    exact_params = models.SearchParams(
+        exact=True, quantization=models.QuantizationSearchParams(ignore=True)
+    )
+    recalls, fast_ms, exact_ms = [], [], []
+    for point in points:
+        query_filter = models.Filter(
+            must=[
+                models.FieldCondition(
+                    key="user_id",
+                    match=models.MatchValue(value=point.payload["user_id"]),
+                )
+            ]
+        )
+        timings = []
+        results = []
+        for params in (search_params(), exact_params):
+            start = time.perf_counter()
+            hits = await client.search(
+                collection_name=collection,
+                query_vector=point.vector,
+                query_filter=query_filter,
+                search_params=params,
+                limit=k,
+            )
+            timings.append((time.perf_counter() - start) * 1000)
+            results.append({hit.id for hit in hits})
+        fast, exact = results
+        recalls.append(len(fast & exact) / len(exact) if exact else 1.0)
+        fast_ms.append(timings[0])
+        exact_ms.append(timings[1])
+
+    info = await client.get_collection(collection)
+    bytes_per_vector = {"none": VECTOR_SIZE * 4, "scalar": VECTOR_SIZE, "binary": VECTOR_SIZE / 8}
+    report = {
+        "collection": collection,
+        "points": info.points_count,
+        "dimensions": VECTOR_SIZE,
+        "quantization": QDRANT_QUANTIZATION,
+        "vector_ram_mb": (info.points_count or 0)
+        * bytes_per_vector[QDRANT_QUANTIZATION]
+        / 2**20,
+        "queries": len(points),
+        f"recall@{k}": statistics.mean(recalls) if recalls else None,
+        "search_ms": _percentiles(fast_ms) if fast_ms else None,
+        "exact_search_ms": _percentiles(exact_ms) if exact_ms else None,
+    }
+    print(json.dumps(report, indent=2))
+    return report
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--report", action="store_true", help="only print the report")
+    parser.add_argument(
+        "--force", action="store_true", help="migrate; writes must be stopped meanwhile"
+    )
+    parser.add_argument("--samples", type=int, default=100)
+    parser.add_argument("-k", type=int, default=10)
+    args = parser.parse_args()
+    if not args.report:
+        if not args.force:
+            parser.error(
+                "writes made while migrating are lost; stop the API's writers and pass --force"
+            )
+        await migrate()
+    await recall_report(args.samples, args.k)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,7 +1,15 @@
-import asyncio
-from typing import Dict
+from contextlib import aclosing
+from typing import AsyncIterator, Dict
 
 import dspy
+from app.memory.chat_context import assemble_context
+from app.memory.lm import CHAT, get_lm, run_llm
+from app.metrics import span, timed
+from dotenv import load_dotenv
+
+load_dotenv()
+
+RESPONSE_MODEL = "gpt-4o-mini"
 
 
 class ResponseGenerator(dspy.Signature):
@@ -16,14 +24,39 @@ class ResponseGenerator(dspy.Signature):
 response_generator = dspy.Predict(ResponseGenerator)
 
 
+@timed("generate")
 async def generate_answer(question: str, context: str, past_messages: list[Dict] = []):
-    history = "\n".join([f"{m['role']}: {m['content']}" for m in past_messages])
+    history, context = await assemble_context(past_messages, context)
 
     def _run():
-        with dspy.context(lm=dspy.LM(model="gpt-4o-mini")):
+        with dspy.context(lm=get_lm(RESPONSE_MODEL)):
             return response_generator(
                 history=history, question=question, context=context
             )
 
-    result = await asyncio.to_thread(_run)
+    result = await run_llm(_run, priority=CHAT)
     return result.response
+
+
+async def stream_answer(
+    question: str, context: str, past_messages: list[Dict] = []
+) -> AsyncIterator[str]:
+    """Yield the answer in chunks as the model produces them."""
+    history, context = await assemble_context(past_messages, context)
+    messages = [
+        {"role": "system", "content": ResponseGenerator.instructions},
+        {
+            "role": "user",
+            "content": (
+                f"history:\n{history}\n\n"
+                f"context:\n{context}\n\n"
+                f"question:\n{question}"
+            ),
+        },
+    ]
+    stream = get_lm(RESPONSE_MODEL).stream(messages, priority=CHAT)
+    # closed right away if the client goes, so the model's slot is freed
+    with span("generate"):
+        async with aclosing(stream):
+            async for chunk in stream:
+                yield chunk
@@ -0,0 +1,135 @@
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from app.memory.categories import infer_categories
+from app.memory.embed_memory import embed_text, embed_texts
+from app.memory.vector_DB import (
+    SEARCH_LIMIT,
+    search_memories,
+    search_memories_batch,
+    user_categories,
+    write_generation,
+)
+
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "5000"))
+RETRIEVAL_CACHE_TTL_SECONDS = float(os.getenv("RETRIEVAL_CACHE_TTL_SECONDS", "300"))
+
+
+class RetrievalCache:
+    """Search results keyed by (user_id, query hash, categories, limit).
+
+    Each entry remembers the user's write generation at the time of the
+    search and is ignored once any write for that user has happened, so a
+    cached result never hides an insert, update or delete.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[tuple, tuple] = OrderedDict()
+
+    @staticmethod
+    def key(user_id: str, query: str, categories: Optional[list[str]], limit: int) -> tuple:
+        return (
+            user_id,
+            hashlib.sha256(query.encode()).hexdigest(),
+            tuple(sorted(categories or [])),
+            limit,
+        )
+
+    def get(self, key: tuple):
+        entry = self._entries.get(key)
+        if entry is not None:
+            generation, expires_at, results = entry
+            if generation == write_generation(key[0]) and expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return results
+            del self._entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, key: tuple, generation: tuple[int, int], results):
+        self._entries[key] = (generation, time.monotonic() + self.ttl_seconds, results)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+
+retrieval_cache = RetrievalCache(RETRIEVAL_CACHE_SIZE, RETRIEVAL_CACHE_TTL_SECONDS)
+
+
+async def retrieve_memories(
+    query: str,
+    user_id: str,
+    categories: Optional[list[str]] = None,
+    limit: int = SEARCH_LIMIT,
+    infer: bool = False,
+):
+    """Embed query and search the user's memories, using the cache when valid.
+
+    With infer and no explicit categories, the search is scoped to the
+    user's categories closest to the query, falling back to an unscoped
+    search when that finds nothing.
+    """
+    if categories is None and infer:
+        embedding = await embed_text(query)
+        inferred = await infer_categories(embedding, await user_categories(user_id))
+        if inferred:
+            results = await _retrieve(query, user_id, inferred, limit)
+            if results:
+                return results
+    return await _retrieve(query, user_id, categories, limit)
+
+
+async def _retrieve(
+    query: str, user_id: str, categories: Optional[list[str]], limit: int
+):
+    key = RetrievalCache.key(user_id, query, categories, limit)
+    results = retrieval_cache.get(key)
+    if results is not None:
+        return results
+    # read the generation before searching: a write that lands mid-search
+    # then makes this entry stale instead of being missed
+    generation = write_generation(user_id)
+    embedding = await embed_text(query)
+    results = await search_memories(embedding, user_id, categories, limit)
+    retrieval_cache.put(key, generation, results)
+    return results
+
+
+async def retrieve_memories_batch(
+    queries: list[tuple[str, Optional[list[str]], int]],
+    user_id: str,
+):
+    """Like retrieve_memories for several (query, categories, limit) at once.
+
+    Cache misses are embedded in one call and searched in one batch request.
+    Results come back in the order of queries.
+    """
+    keys = [RetrievalCache.key(user_id, *query) for query in queries]
+    results = [retrieval_cache.get(key) for key in keys]
+    missing = [i for i, result in enumerate(results) if result is None]
+    if not missing:
+        return results
+    generation = write_generation(user_id)
+    embeddings = await embed_texts([queries[i][0] for i in missing])
+    found = await search_memories_batch(
+        [
+            (embedding, queries[i][1], queries[i][2])
+            for i, embedding in zip(missing, embeddings)
+        ],
+        user_id,
+    )
+    for i, result in zip(missing, found):
+        retrieval_cache.put(keys[i], generation, result)
+        results[i] = result
+    return results
@@ -0,0 +1,69 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Awaitable, Callable, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """Shares one in-flight call between concurrent callers with the same key.
+
+    The first caller for a key starts the call; callers arriving before it
+    finishes wait for its result (or exception) instead of repeating it.
+    Nothing is kept once the call finishes, so this only absorbs duplicate
+    bursts; caching is left to the caches.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.coalesced = 0
+        self._tasks: dict[Hashable, asyncio.Task] = {}
+        self._futures: dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        task = self._tasks.get(key)
+        if task is None:
+            self.calls += 1
+            # a task, so one waiter being cancelled doesn't cancel the rest
+            task = asyncio.ensure_future(fn())
+            self._tasks[key] = task
+            task.add_done_callback(lambda t: self._done(key, t))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _done(self, key: Hashable, task: asyncio.Task):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        if not task.cancelled():
+            # mark the exception retrieved in case every waiter went away
+            task.exception()
+
+    def call(self, key: Hashable, fn: Callable[[], T]) -> T:
+        """do() for blocking calls made from threads."""
+        with self._lock:
+            future = self._futures.get(key)
+            leader = future is None
+            if leader:
+                future = self._futures[key] = Future()
+                self.calls += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result()
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._futures[key]
+
+    def stats(self) -> dict:
+        return {"calls": self.calls, "coalesced": self.coalesced}
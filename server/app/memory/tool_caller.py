@@ -1,11 +1,23 @@
-import asyncio
+import os
+from collections import Counter
 
 import dspy
+from app.memory.extract_memory import Memory
+from app.memory.lm import get_lm, run_llm
 from app.memory.tools import add, delete, noop, update
+from app.memory.vector_DB import unit_of_work
+from app.metrics import observe, span, timed
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# a fact whose closest existing memory scores at or above FAST_NOOP_ABOVE is
+# a duplicate, and one with nothing scoring at least FAST_ADD_BELOW is new;
+# only facts in between go to the agent. FAST_NOOP_ABOVE > 1 and
+# FAST_ADD_BELOW = 0 send everything to the agent.
+FAST_NOOP_ABOVE = float(os.getenv("FAST_NOOP_ABOVE", "0.95"))
+FAST_ADD_BELOW = float(os.getenv("FAST_ADD_BELOW", "0.1"))
+
 
 class MemoryToolCaller(dspy.Signature):
     """You are a memory manager. Given a new memory and existing
@@ -40,12 +52,58 @@ agent = dspy.ReAct(
 
 async def process_memory(new_memory: str, existing_memories: str, user_id: str):
     def _run():
-        with dspy.context(lm=dspy.LM(model="gpt-4o")):
+        with dspy.context(lm=get_lm("gpt-4o")):
             return agent(
                 new_memory=new_memory,
                 existing_memories=existing_memories,
                 user_id=user_id,
             )
 
-    result = await asyncio.to_thread(_run)
+    async with unit_of_work(user_id):
+        with span("react"):
+            result = await run_llm(_run)
+    trajectory = getattr(result, "trajectory", None) or {}
+    observe("react_iterations", sum(key.startswith("tool_name_") for key in trajectory))
     return result
+
+
+# how often each reconciliation path was taken: "noop", "add" or "agent"
+path_counts: Counter[str] = Counter()
+
+
+def format_existing(results) -> str:
+    return "\n".join(
+        [f"id: {r.id} | text:{r.payload['memory_text']}" for r in results]
+    )
+
+
+def choose_path(results) -> str:
+    top_score = max((r.score for r in results), default=0.0)
+    if top_score >= FAST_NOOP_ABOVE:
+        return "noop"
+    if top_score < FAST_ADD_BELOW:
+        return "add"
+    return "agent"
+
+
+@timed("reconcile")
+async def reconcile_memory(memory: Memory, results, user_id: str) -> str:
+    """Decide what to do with a new fact given its retrieved neighbours.
+
+    Clear duplicates and clearly new facts are handled directly from the
+    similarity scores; only the ambiguous band runs the ReAct agent.
+    """
+    path = choose_path(results)
+    path_counts[path] += 1
+    if path == "noop":
+        best = max(results, key=lambda r: r.score)
+        return noop(f"duplicate of {best.id} (score {best.score:.3f})")
+    if path == "add":
+        async with unit_of_work(user_id):
+            return await run_llm(
+                add, user_id, memory.information, memory.predicted_categories
+            )
+    result = await process_memory(
+        memory.information, format_existing(results), user_id
+    )
+    return result.action_taken
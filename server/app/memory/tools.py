@@ -1,47 +1,66 @@
 from datetime import date
 
-from app.memory.embed_memory import embed_single
-from app.memory.vector_DB import (
-    EmbeddedMemory,
-    sync_delete_memory,
-    sync_get_memory_by_id,
-    sync_insert_memory,
-    sync_update_memory,
-)
+from app.memory.embed_memory import embed_from_thread
+from app.memory.vector_DB import EmbeddedMemory, MemoryUnitOfWork, current_unit_of_work
+from app.metrics import inc, span
+
+# the tools record their writes in the caller's unit of work (see
+# vector_DB.unit_of_work); nothing is sent to Qdrant until it is flushed
+
+
+def _unit_of_work() -> MemoryUnitOfWork:
+    uow = current_unit_of_work()
+    if uow is None:
+        raise RuntimeError("memory tools must run inside vector_DB.unit_of_work")
+    return uow
 
 
 def add(user_id: str, memory_text: str, categories: list[str] = []) -> str:
-    embedding = embed_single(memory_text)
-    memory = EmbeddedMemory(
-        user_id=user_id,
-        memory_text=memory_text,
-        categories=categories,
-        date=str(date.today()),
-        embedding=embedding,
-    )
-    sync_insert_memory(memory)
-    return f"added: {memory_text}"
+    inc("tool_calls_total", tool="add")
+    with span("tool_add"):
+        uow = _unit_of_work()
+        embedding = embed_from_thread(memory_text)
+        memory = EmbeddedMemory(
+            user_id=uow.user_id,
+            memory_text=memory_text,
+            categories=categories,
+            date=str(date.today()),
+            embedding=embedding,
+        )
+        uow.insert(memory)
+        return f"added: {memory_text}"
 
 
 def update(memory_id: str, new_text: str, categories: list[str] = []) -> str:
-    existing = sync_get_memory_by_id(memory_id)
-    if not existing:
-        return f"memory {memory_id} not found"
-    embedding = embed_single(new_text)
-    sync_update_memory(
-        memory_id=memory_id,
-        new_text=new_text,
-        categories=categories,
-        user_id=existing.payload["user_id"],
-        embedding=embedding,
-    )
-    return f"updated: {memory_id}"
+    inc("tool_calls_total", tool="update")
+    with span("tool_update"):
+        uow = _unit_of_work()
+        if not uow.get(memory_id):
+            return f"memory {memory_id} not found"
+        embedding = embed_from_thread(new_text)
+        uow.update(
+            memory_id,
+            EmbeddedMemory(
+                user_id=uow.user_id,
+                memory_text=new_text,
+                categories=categories,
+                date=str(date.today()),
+                embedding=embedding,
+            ),
+        )
+        return f"updated: {memory_id}"
 
 
 def delete(memory_id: str) -> str:
-    sync_delete_memory(memory_id)
-    return f"deleted: {memory_id}"
+    inc("tool_calls_total", tool="delete")
+    with span("tool_delete"):
+        uow = _unit_of_work()
+        if not uow.get(memory_id):
+            return f"memory {memory_id} not found"
+        uow.delete(memory_id)
+        return f"deleted: {memory_id}"
 
 
 def noop(reason: str) -> str:
+    inc("tool_calls_total", tool="noop")
     return f"no action: {reason}"
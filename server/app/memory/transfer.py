@@ -0,0 +1,143 @@
+"""Export and import memories, vectors included, as NDJSON.
+
+    python -m app.memory.transfer export [--user USER_ID] > memories.ndjson
+    python -m app.memory.transfer import [--user USER_ID] < memories.ndjson
+
+Each line is {"id": ..., "payload": {...}, "vector": [...]}. Importing
+never calls the embedding API: vectors of the configured size are used as
+they are, longer ones are truncated and re-normalised, and shorter ones are
+rejected. Without --user the CLI exports every user and imports points
+with their own ids and owners, for moving a whole collection.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+from typing import AsyncIterator, Iterable, Optional
+from uuid import NAMESPACE_URL, UUID, uuid5
+
+from app.memory.migrate_collection import resize
+from app.memory.vector_DB import VECTOR_SIZE, store, upsert_points
+from qdrant_client.models import models
+
+EXPORT_PAGE_SIZE = int(os.getenv("EXPORT_PAGE_SIZE", "256"))
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "512"))
+# how many per-line errors an import reports back
+_MAX_ERRORS = 20
+
+
+async def export_memories(user_id: Optional[str]) -> AsyncIterator[str]:
+    """Yield one NDJSON line per point, one scroll page in memory at a time."""
+    offset = None
+    while True:
+        page, offset = await store.scroll(
+            user_id, EXPORT_PAGE_SIZE, offset=offset, with_vectors=True
+        )
+        for point in page:
+            yield json.dumps(
+                {"id": point.id, "payload": point.payload, "vector": point.vector}
+            ) + "\n"
+        if offset is None:
+            return
+
+
+async def ndjson_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Split a byte stream into lines without reading it all."""
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line.decode()
+    if buffer:
+        yield buffer.decode()
+
+
+async def _own_ids(points: list[models.PointStruct], user_id: str):
+    """Give points whose id belongs to another user a new id.
+
+    The new id is derived from (user_id, old id), so importing the same
+    file twice still updates instead of duplicating.
+    """
+    existing = await store.retrieve([point.id for point in points], user_id=user_id)
+    foreign = {str(r.id) for r in existing if r.payload.get("user_id") != user_id}
+    for point in points:
+        if str(point.id) in foreign:
+            point.id = str(uuid5(NAMESPACE_URL, f"{user_id}:{point.id}"))
+
+
+async def import_memories(lines: AsyncIterator[str], user_id: Optional[str]) -> dict:
+    """Upsert exported points in batches of IMPORT_BATCH_SIZE.
+
+    With a user_id every point is imported as that user's (the API path);
+    with None, owners and ids are kept as they are (the admin CLI).
+    """
+    imported = 0
+    errors: list[str] = []
+    skipped = 0
+    batch: list[models.PointStruct] = []
+
+    async def _flush():
+        nonlocal imported
+        if user_id is not None:
+            await _own_ids(batch, user_id)
+        await upsert_points(batch)
+        imported += len(batch)
+        batch.clear()
+
+    number = 0
+    async for line in lines:
+        number += 1
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            point_id = record["id"]
+            if not isinstance(point_id, int):
+                # qdrant ids are unsigned ints or UUIDs
+                UUID(str(point_id))
+            payload = dict(record["payload"])
+            vector = resize([float(x) for x in record["vector"]], VECTOR_SIZE)
+            if vector is None:
+                raise ValueError(f"vector shorter than {VECTOR_SIZE}")
+            if user_id is not None:
+                payload["user_id"] = user_id
+            if not payload.get("user_id") or "memory_text" not in payload:
+                raise ValueError("payload needs user_id and memory_text")
+            batch.append(
+                models.PointStruct(id=point_id, payload=payload, vector=vector)
+            )
+        except (ValueError, KeyError, TypeError) as e:
+            skipped += 1
+            if len(errors) < _MAX_ERRORS:
+                errors.append(f"line {number}: {e}")
+            continue
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            await _flush()
+    if batch:
+        await _flush()
+    return {"imported": imported, "skipped": skipped, "errors": errors}
+
+
+async def _stdin_lines(stream: Iterable[str]) -> AsyncIterator[str]:
+    for line in stream:
+        yield line
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("command", choices=["export", "import"])
+    parser.add_argument("--user", help="only this user's memories / import as this user")
+    args = parser.parse_args()
+    if args.command == "export":
+        async for line in export_memories(args.user):
+            sys.stdout.write(line)
+    else:
+        result = await import_memories(_stdin_lines(sys.stdin), args.user)
+        print(json.dumps(result, indent=2), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
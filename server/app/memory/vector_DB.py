@@ -1,15 +1,25 @@
-import asyncio
+import hashlib
+import math
 import os
+import threading
+from array import array
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
 from datetime import date
 from typing import Optional
 from uuid import uuid4
 
+from app.memory.categories import category_registry
+from app.memory.single_flight import SingleFlight
+from app.metrics import timed
 from dotenv import load_dotenv
 from pydantic import BaseModel
-from qdrant_client import AsyncQdrantClient, QdrantClient
+from qdrant_client import AsyncQdrantClient
 from qdrant_client.models import Distance, Filter, VectorParams, models
 
 COLLECTION_NAME = "memories"
+SCORE_THRESHOLD = 0.1
+SEARCH_LIMIT = 4
 
 
 class EmbeddedMemory(BaseModel):
@@ -22,97 +32,458 @@ class EmbeddedMemory(BaseModel):
 
 load_dotenv()
 
-client = AsyncQdrantClient(
-    url=os.getenv("QDRANT_URL"), api_key=os.getenv("QDRANT_API_KEY")
-)
+# "qdrant" talks to the Qdrant server, "local" keeps vectors in memory-mapped
+# files under LOCAL_STORE_DIR (see local_store.py)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "qdrant")
+# must match embed_memory.EMBED_DIMENSIONS
+VECTOR_SIZE = int(os.getenv("EMBED_DIMENSIONS", "1536"))
+# "none", "scalar" (int8, ~4x less RAM) or "binary" (~32x less RAM); the
+# original vectors then live on disk and are only read for rescoring
+QDRANT_QUANTIZATION = os.getenv("QDRANT_QUANTIZATION", "none")
+QDRANT_RESCORE = os.getenv("QDRANT_RESCORE", "true").lower() == "true"
+QDRANT_OVERSAMPLING = float(os.getenv("QDRANT_OVERSAMPLING", "2.0"))
+# "tenant" builds one HNSW graph per user (payload_m, with m=0 so there is
+# no global graph) instead of one graph across everyone's points
+QDRANT_LAYOUT = os.getenv("QDRANT_LAYOUT", "default")
+QDRANT_PAYLOAD_M = int(os.getenv("QDRANT_PAYLOAD_M", "16"))
+# tenant layout only: users (comma separated) that get a shard key of their
+# own; everyone else shares DEFAULT_SHARD_KEY
+QDRANT_SHARD_KEYS = [key for key in os.getenv("QDRANT_SHARD_KEYS", "").split(",") if key]
+DEFAULT_SHARD_KEY = "default"
 
-# sync client for use in non-async contexts (tools)
-sync_client = QdrantClient(
-    url=os.getenv("QDRANT_URL"), api_key=os.getenv("QDRANT_API_KEY")
-)
+# QDRANT_LOCATION=":memory:" or QDRANT_PATH (a directory) run Qdrant in
+# process instead of connecting to QDRANT_URL, e.g. for the benchmarks
+QDRANT_LOCATION = os.getenv("QDRANT_LOCATION")
+QDRANT_PATH = os.getenv("QDRANT_PATH")
 
+if QDRANT_LOCATION or QDRANT_PATH:
+    client = AsyncQdrantClient(location=QDRANT_LOCATION, path=QDRANT_PATH)
+else:
+    client = AsyncQdrantClient(
+        url=os.getenv("QDRANT_URL"), api_key=os.getenv("QDRANT_API_KEY")
+    )
 
-async def create_collection():
-    if not (await client.collection_exists("memories")):
-        await client.create_collection(
-            collection_name=COLLECTION_NAME,
-            vectors_config=VectorParams(size=1536, distance=Distance.COSINE),
+
+def _user_filter(user_id: str, categories: Optional[list[str]] = None) -> Filter:
+    must_conditions: list[models.Condition] = [
+        models.FieldCondition(key="user_id", match=models.MatchValue(value=user_id))
+    ]
+    if categories:
+        must_conditions.append(
+            models.FieldCondition(
+                key="categories", match=models.MatchAny(any=categories)
+            )
         )
-        await client.create_payload_index(
-            collection_name="memories",
+    return Filter(must=must_conditions)
+
+
+def custom_sharding() -> bool:
+    return QDRANT_LAYOUT == "tenant" and bool(QDRANT_SHARD_KEYS)
+
+
+def shard_key(user_id: str) -> Optional[str]:
+    """The shard key holding user_id's points, None without custom sharding."""
+    if not custom_sharding():
+        return None
+    return user_id if user_id in QDRANT_SHARD_KEYS else DEFAULT_SHARD_KEY
+
+
+def by_shard_key(points: list[models.PointStruct]) -> dict[Optional[str], list]:
+    groups: dict[Optional[str], list] = {}
+    for point in points:
+        groups.setdefault(shard_key(point.payload["user_id"]), []).append(point)
+    return groups
+
+
+def collection_config(layout: Optional[str] = None, size: int = VECTOR_SIZE) -> dict:
+    """create_collection arguments for layout (QDRANT_LAYOUT by default)."""
+    layout = layout or QDRANT_LAYOUT
+    quantization = None
+    if QDRANT_QUANTIZATION == "scalar":
+        quantization = models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(
+                type=models.ScalarType.INT8, quantile=0.99, always_ram=True
+            )
+        )
+    elif QDRANT_QUANTIZATION == "binary":
+        quantization = models.BinaryQuantization(
+            binary=models.BinaryQuantizationConfig(always_ram=True)
+        )
+    config = {
+        "vectors_config": VectorParams(
+            size=size,
+            distance=Distance.COSINE,
+            on_disk=quantization is not None,
+        ),
+        "quantization_config": quantization,
+    }
+    if layout == "tenant":
+        config["hnsw_config"] = models.HnswConfigDiff(payload_m=QDRANT_PAYLOAD_M, m=0)
+    if layout == "tenant" and QDRANT_SHARD_KEYS:
+        config["sharding_method"] = models.ShardingMethod.CUSTOM
+    return config
+
+
+def search_params() -> Optional[models.SearchParams]:
+    if QDRANT_QUANTIZATION == "none":
+        return None
+    return models.SearchParams(
+        quantization=models.QuantizationSearchParams(
+            rescore=QDRANT_RESCORE, oversampling=QDRANT_OVERSAMPLING
+        )
+    )
+
+
+class QdrantStore:
+    """Storage backend on the Qdrant server.
+
+    Every backend (see local_store.LocalVectorStore) offers the same async
+    methods: create_collection, upsert, delete, delete_user, search,
+    search_batch, retrieve and scroll, taking and returning qdrant_client
+    models.
+    """
+
+    def __init__(self, client: AsyncQdrantClient):
+        self.client = client
+
+    async def create_collection(self):
+        if not (await self.collection_exists(COLLECTION_NAME)):
+            await self.client.create_collection(
+                collection_name=COLLECTION_NAME, **collection_config()
+            )
+            await self.create_shard_keys(COLLECTION_NAME)
+            await self.create_indexes(COLLECTION_NAME)
+            print("collections created")
+        else:
+            print("collections alrdy exists")
+
+    async def collection_exists(self, name: str) -> bool:
+        """True if name is a collection or an alias (migrations swap in aliases)."""
+        if await self.client.collection_exists(name):
+            return True
+        aliases = await self.client.get_aliases()
+        return any(alias.alias_name == name for alias in aliases.aliases)
+
+    async def create_shard_keys(self, collection_name: str):
+        if not custom_sharding():
+            return
+        for key in [DEFAULT_SHARD_KEY, *QDRANT_SHARD_KEYS]:
+            await self.client.create_shard_key(collection_name, key)
+
+    async def create_indexes(self, collection_name: str, layout: Optional[str] = None):
+        user_id_schema = models.PayloadSchemaType.KEYWORD
+        if (layout or QDRANT_LAYOUT) == "tenant":
+            # is_tenant (qdrant >= 1.11) also groups each user's points on disk
+            user_id_schema = models.KeywordIndexParams(type="keyword", is_tenant=True)
+        await self.client.create_payload_index(
+            collection_name=collection_name,
             field_name="user_id",
-            field_schema=models.PayloadSchemaType.KEYWORD,
+            field_schema=user_id_schema,
         )
-        await client.create_payload_index(
-            collection_name="memories",
+        await self.client.create_payload_index(
+            collection_name=collection_name,
             field_name="categories",
             field_schema=models.PayloadSchemaType.KEYWORD,
         )
-        print("collections created")
+
+    async def upsert(self, points: list[models.PointStruct]):
+        for key, group in by_shard_key(points).items():
+            await self.client.upsert(
+                collection_name=COLLECTION_NAME, points=group, shard_key_selector=key
+            )
+
+    async def delete(self, ids: list[str], user_id: Optional[str] = None):
+        await self.client.delete(
+            collection_name=COLLECTION_NAME,
+            points_selector=models.PointIdsList(points=ids),
+            shard_key_selector=shard_key(user_id) if user_id is not None else None,
+        )
+
+    async def delete_user(self, user_id: str):
+        await self.client.delete(
+            collection_name=COLLECTION_NAME,
+            points_selector=models.FilterSelector(filter=_user_filter(user_id)),
+            shard_key_selector=shard_key(user_id),
+        )
+
+    async def search(
+        self,
+        search_vector: list[float],
+        user_id: str,
+        categories: Optional[list[str]],
+        limit: int,
+        score_threshold: float,
+    ):
+        return await self.client.search(
+            collection_name=COLLECTION_NAME,
+            query_vector=search_vector,
+            with_payload=True,
+            query_filter=_user_filter(user_id, categories),
+            search_params=search_params(),
+            score_threshold=score_threshold,
+            limit=limit,
+            shard_key_selector=shard_key(user_id),
+        )
+
+    async def search_batch(
+        self,
+        queries: list[tuple[list[float], Optional[list[str]], int]],
+        user_id: str,
+        score_threshold: float,
+    ):
+        return await self.client.search_batch(
+            collection_name=COLLECTION_NAME,
+            requests=[
+                models.SearchRequest(
+                    shard_key=shard_key(user_id),
+                    vector=search_vector,
+                    filter=_user_filter(user_id, categories),
+                    params=search_params(),
+                    limit=limit,
+                    score_threshold=score_threshold,
+                    with_payload=True,
+                )
+                for search_vector, categories, limit in queries
+            ],
+        )
+
+    async def retrieve(
+        self, ids: list[str], with_vectors: bool = False, user_id: Optional[str] = None
+    ):
+        return await self.client.retrieve(
+            collection_name=COLLECTION_NAME,
+            ids=ids,
+            with_payload=True,
+            with_vectors=with_vectors,
+            shard_key_selector=shard_key(user_id) if user_id is not None else None,
+        )
+
+    async def scroll(
+        self,
+        user_id: Optional[str],
+        limit: int,
+        offset=None,
+        with_vectors: bool = False,
+    ):
+        """Page through a user's points, or every point when user_id is None."""
+        return await self.client.scroll(
+            collection_name=COLLECTION_NAME,
+            scroll_filter=_user_filter(user_id) if user_id is not None else None,
+            limit=limit,
+            offset=offset,
+            with_payload=True,
+            with_vectors=with_vectors,
+            shard_key_selector=shard_key(user_id) if user_id is not None else None,
+        )
+
+
+if VECTOR_BACKEND == "local":
+    from app.memory.local_store import LocalVectorStore
+
+    store = LocalVectorStore(
+        os.getenv("LOCAL_STORE_DIR", "local_store"),
+        VECTOR_SIZE,
+        os.getenv("LOCAL_STORE_DTYPE", "float32"),
+    )
+else:
+    store = QdrantStore(client)
+
+# identical concurrent searches outside a unit of work share one request
+search_flight = SingleFlight()
+
+
+# per-user counters bumped by every write, so caches of search results can
+# tell whether a user's memories changed; writes whose owner is unknown
+# (delete by id) bump the global counter, which invalidates everyone
+_write_generations: dict[str, int] = {}
+_global_generation = 0
+
+
+def write_generation(user_id: str) -> tuple[int, int]:
+    return _global_generation, _write_generations.get(user_id, 0)
+
+
+def written_users() -> list[str]:
+    """Users with at least one write since this process started."""
+    return list(_write_generations)
+
+
+def bump_write_generation(user_id: Optional[str] = None):
+    global _global_generation
+    if user_id is None:
+        _global_generation += 1
     else:
-        print("collections alrdy exists")
+        _write_generations[user_id] = _write_generations.get(user_id, 0) + 1
+
+
+async def create_collection():
+    await store.create_collection()
 
 
+@timed("qdrant_write")
 async def insert_memories(memories: list[EmbeddedMemory]):
-    await client.upsert(
-        collection_name=COLLECTION_NAME,
-        points=[
-            models.PointStruct(
-                id=uuid4().hex,
-                payload={
-                    "user_id": memory.user_id,
-                    "categories": memory.categories,
-                    "memory_text": memory.memory_text,
-                    "date": memory.date,
-                },
-                vector=memory.embedding,
-            )
-            for memory in memories
-        ],
+    ids = [uuid4().hex for _ in memories]
+    await store.upsert(
+        [_to_point(memory_id, memory) for memory_id, memory in zip(ids, memories)]
     )
+    for memory_id, memory in zip(ids, memories):
+        category_registry.put(memory.user_id, memory_id, memory.categories)
+    for user_id in {memory.user_id for memory in memories}:
+        bump_write_generation(user_id)
 
 
+@timed("search")
 async def search_memories(
-    search_vector: list[float], user_id: str, categories: Optional[list[str]] = None
+    search_vector: list[float],
+    user_id: str,
+    categories: Optional[list[str]] = None,
+    limit: int = SEARCH_LIMIT,
 ):
-
-    must_conditions: list[models.Condition] = [
-        models.FieldCondition(key="user_id", match=models.MatchValue(value=user_id))
-    ]
-    if categories:
-        must_conditions.append(
-            models.FieldCondition(
-                key="categories", match=models.MatchAny(any=categories)
-            )
+    uow = current_unit_of_work(user_id)
+    if uow is None:
+        # the generation keeps a search started before a write from
+        # answering one that arrives after it
+        key = (
+            user_id,
+            write_generation(user_id),
+            hashlib.sha256(array("f", search_vector).tobytes()).hexdigest(),
+            tuple(sorted(categories or [])),
+            limit,
+        )
+        return await search_flight.do(
+            key,
+            lambda: store.search(search_vector, user_id, categories, limit, SCORE_THRESHOLD),
         )
-    res = await client.search(
-        collection_name=COLLECTION_NAME,
-        query_vector=search_vector,
-        with_payload=True,
-        query_filter=Filter(must=must_conditions),
-        score_threshold=0.1,
-        limit=4,
+    # fetch extra hits so pending deletes and updates can't leave us short
+    res = await store.search(
+        search_vector,
+        user_id,
+        categories,
+        limit + uow.pending_count(),
+        SCORE_THRESHOLD,
     )
-    return res
+    return uow.overlay(res, search_vector, categories, limit)
 
 
-async def delete_memory(memory_id: str):
-    await client.delete(
-        collection_name=COLLECTION_NAME,
-        points_selector=models.PointIdsList(points=[memory_id]),
+@timed("search")
+async def search_memories_batch(
+    queries: list[tuple[list[float], Optional[list[str]], int]],
+    user_id: str,
+):
+    """Run several (vector, categories, limit) searches in one request."""
+    uow = current_unit_of_work(user_id)
+    if uow is None:
+        return await store.search_batch(queries, user_id, SCORE_THRESHOLD)
+    extra = uow.pending_count()
+    batches = await store.search_batch(
+        [(vector, categories, limit + extra) for vector, categories, limit in queries],
+        user_id,
+        SCORE_THRESHOLD,
     )
+    return [
+        uow.overlay(res, vector, categories, limit)
+        for res, (vector, categories, limit) in zip(batches, queries)
+    ]
 
 
-async def get_memory_by_id(memory_id: str):
-    result = await client.retrieve(
-        collection_name=COLLECTION_NAME,
-        ids=[memory_id],
-        with_payload=True,
-        with_vectors=True,
+def _to_point(memory_id: str, memory: EmbeddedMemory) -> models.PointStruct:
+    return models.PointStruct(
+        id=memory_id,
+        payload={
+            "user_id": memory.user_id,
+            "categories": memory.categories,
+            "memory_text": memory.memory_text,
+            "date": memory.date,
+        },
+        vector=memory.embedding,
     )
+
+
+@timed("qdrant_write")
+async def apply_memory_writes(
+    upserts: dict[str, EmbeddedMemory],
+    deletes: list[str],
+    user_id: Optional[str] = None,
+):
+    """Apply a batch of upserts (by id) and deletes in at most two requests.
+
+    user_id is the owner of the deleted ids, when the caller knows it.
+    """
+    if upserts:
+        await store.upsert(
+            [_to_point(memory_id, memory) for memory_id, memory in upserts.items()]
+        )
+        for memory_id, memory in upserts.items():
+            category_registry.put(memory.user_id, memory_id, memory.categories)
+        for owner in {memory.user_id for memory in upserts.values()}:
+            bump_write_generation(owner)
+    if deletes:
+        await store.delete(deletes, user_id)
+        category_registry.remove(deletes, user_id)
+        bump_write_generation(user_id)
+
+
+async def list_memories(user_id: str, with_vectors: bool = False, page_size: int = 256):
+    """Return every memory of a user, paging through the collection."""
+    points = []
+    offset = None
+    while True:
+        page, offset = await store.scroll(
+            user_id, page_size, offset=offset, with_vectors=with_vectors
+        )
+        points.extend(page)
+        if offset is None:
+            return points
+
+
+async def user_categories(user_id: str):
+    """Category -> memory count for a user, from the registry when loaded."""
+    counts = category_registry.get(user_id)
+    if counts is None:
+        points = await list_memories(user_id)
+        counts = category_registry.load(
+            user_id, {str(point.id): point.payload.get("categories", []) for point in points}
+        )
+    return counts
+
+
+@timed("qdrant_write")
+async def upsert_points(points: list[models.PointStruct]):
+    """Write points as given, vectors included, e.g. from an export."""
+    if not points:
+        return
+    await store.upsert(points)
+    for point in points:
+        category_registry.put(
+            point.payload["user_id"], str(point.id), point.payload.get("categories", [])
+        )
+    for owner in {point.payload["user_id"] for point in points}:
+        bump_write_generation(owner)
+
+
+@timed("qdrant_write")
+async def delete_user_memories(user_id: str):
+    await store.delete_user(user_id)
+    category_registry.drop(user_id)
+    bump_write_generation(user_id)
+
+
+@timed("qdrant_write")
+async def delete_memory(memory_id: str, user_id: Optional[str] = None):
+    await store.delete([memory_id], user_id)
+    category_registry.remove([memory_id], user_id)
+    bump_write_generation(user_id)
+
+
+async def get_memory_by_id(memory_id: str, user_id: Optional[str] = None):
+    uow = current_unit_of_work(user_id)
+    if uow is not None and uow.has_pending(memory_id):
+        return uow.get(memory_id)
+    result = await store.retrieve([memory_id], with_vectors=True, user_id=user_id)
     return result[0] if result else None
 
 
+@timed("qdrant_write")
 async def update_memory(
     memory_id: str,
     new_text: str,
@@ -120,72 +491,163 @@ async def update_memory(
     user_id: str,
     embedding: list[float],
 ):
-    await client.upsert(
-        collection_name=COLLECTION_NAME,
-        points=[
-            models.PointStruct(
-                id=memory_id,
-                payload={
-                    "user_id": user_id,
-                    "memory_text": new_text,
-                    "categories": categories,
-                    "date": str(date.today()),
-                },
-                vector=embedding,
+    await store.upsert(
+        [
+            _to_point(
+                memory_id,
+                EmbeddedMemory(
+                    user_id=user_id,
+                    memory_text=new_text,
+                    categories=categories,
+                    date=str(date.today()),
+                    embedding=embedding,
+                ),
             )
-        ],
+        ]
     )
+    category_registry.put(user_id, memory_id, categories)
+    bump_write_generation(user_id)
 
 
-# sync versions for tools
-def sync_insert_memory(memory: EmbeddedMemory):
-    sync_client.upsert(
-        collection_name=COLLECTION_NAME,
-        points=[
-            models.PointStruct(
-                id=uuid4().hex,
-                payload={
-                    "user_id": memory.user_id,
-                    "categories": memory.categories,
-                    "memory_text": memory.memory_text,
-                    "date": memory.date,
-                },
-                vector=memory.embedding,
-            )
-        ],
-    )
+class MemoryUnitOfWork:
+    """Write-behind buffer for one user's memory mutations.
 
+    The memory tools run in worker threads and only record their writes
+    here; they are flushed as one upsert and one delete when the block
+    (one fact, or one batch of facts, while its memory locks are held)
+    exits.
+    Searches and lookups made while the unit of work is active see the
+    pending writes, and the tools can only touch memories that this unit
+    of work has seen, so an id from another user is never modified.
+    """
 
-def sync_delete_memory(memory_id: str):
-    sync_client.delete(
-        collection_name=COLLECTION_NAME,
-        points_selector=models.PointIdsList(points=[memory_id]),
-    )
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+        self._lock = threading.Lock()
+        self._upserts: dict[str, EmbeddedMemory] = {}
+        self._deletes: set[str] = set()
+        self._inserted: set[str] = set()
+        self._seen: dict[str, dict] = {}
 
+    def insert(self, memory: EmbeddedMemory) -> str:
+        memory_id = uuid4().hex
+        with self._lock:
+            self._upserts[memory_id] = memory
+            self._inserted.add(memory_id)
+        return memory_id
 
-def sync_get_memory_by_id(memory_id: str):
-    result = sync_client.retrieve(
-        collection_name=COLLECTION_NAME,
-        ids=[memory_id],
-        with_payload=True,
-        with_vectors=True,
-    )
-    return result[0] if result else None
+    def update(self, memory_id: str, memory: EmbeddedMemory):
+        with self._lock:
+            self._deletes.discard(memory_id)
+            self._upserts[memory_id] = memory
 
+    def delete(self, memory_id: str):
+        with self._lock:
+            self._upserts.pop(memory_id, None)
+            if memory_id in self._inserted:
+                # never stored, so there is nothing to delete
+                self._inserted.discard(memory_id)
+                self._seen.pop(memory_id, None)
+            else:
+                self._deletes.add(memory_id)
 
-def sync_update_memory(memory_id: str, new_text: str, categories: list[str], user_id: str, embedding: list[float]):
-    sync_client.upsert(
-        collection_name=COLLECTION_NAME,
-        points=[
-            models.PointStruct(
-                id=memory_id,
-                payload={
-                    "user_id": user_id,
-                    "memory_text": new_text,
-                    "categories": categories,
-                    "date": str(date.today()),
-                },
-                vector=embedding,
-            )
-        ],
-    )
+    def get(self, memory_id: str) -> Optional[models.Record]:
+        """Return the memory as this unit of work sees it, or None if unknown."""
+        with self._lock:
+            if memory_id in self._deletes:
+                return None
+            if memory_id in self._upserts:
+                memory = self._upserts[memory_id]
+                return models.Record(
+                    id=memory_id,
+                    payload=_to_point(memory_id, memory).payload,
+                    vector=memory.embedding,
+                )
+            if memory_id in self._seen:
+                return models.Record(id=memory_id, payload=self._seen[memory_id])
+            return None
+
+    def has_pending(self, memory_id: str) -> bool:
+        with self._lock:
+            return memory_id in self._upserts or memory_id in self._deletes
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return len(self._upserts) + len(self._deletes)
+
+    def overlay(self, results, search_vector, categories, limit):
+        """Merge pending writes into search results from the store."""
+        with self._lock:
+            merged = [
+                r
+                for r in results
+                if str(r.id) not in self._deletes and str(r.id) not in self._upserts
+            ]
+            for memory_id, memory in self._upserts.items():
+                if categories and not set(categories) & set(memory.categories):
+                    continue
+                score = _cosine(search_vector, memory.embedding)
+                if score >= SCORE_THRESHOLD:
+                    merged.append(
+                        models.ScoredPoint(
+                            id=memory_id,
+                            version=0,
+                            score=score,
+                            payload=_to_point(memory_id, memory).payload,
+                        )
+                    )
+            merged.sort(key=lambda r: r.score, reverse=True)
+            merged = merged[:limit]
+        self.remember(merged)
+        return merged
+
+    def remember(self, results):
+        """Let the tools act on results searched outside this unit of work."""
+        with self._lock:
+            for r in results:
+                self._seen[str(r.id)] = r.payload
+
+    async def flush(self):
+        with self._lock:
+            upserts, self._upserts = self._upserts, {}
+            deletes, self._deletes = self._deletes, set()
+            self._inserted = set()
+        await apply_memory_writes(upserts, list(deletes), self.user_id)
+
+
+_unit_of_work: ContextVar[Optional[MemoryUnitOfWork]] = ContextVar(
+    "memory_unit_of_work", default=None
+)
+
+
+def current_unit_of_work(user_id: Optional[str] = None) -> Optional[MemoryUnitOfWork]:
+    uow = _unit_of_work.get()
+    if uow is None or (user_id is not None and uow.user_id != user_id):
+        return None
+    return uow
+
+
+@asynccontextmanager
+async def unit_of_work(user_id: str):
+    """Buffer memory writes for user_id and flush them when the block exits.
+
+    Nested blocks for the same user share the outer unit of work. If the
+    block raises, its pending writes are discarded.
+    """
+    uow = current_unit_of_work(user_id)
+    if uow is not None:
+        yield uow
+        return
+    uow = MemoryUnitOfWork(user_id)
+    token = _unit_of_work.set(uow)
+    try:
+        yield uow
+    finally:
+        _unit_of_work.reset(token)
+    await uow.flush()
+
+
+def _cosine(a: list[float], b: list[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
@@ -0,0 +1,188 @@
+"""In-process metrics: per-stage latency histograms, counters and Server-Timing.
+
+Recording is a dict lookup and a few additions under a lock, cheap enough
+to leave on. /metrics renders everything in the Prometheus text format.
+"""
+
+import functools
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterable, Optional
+
+PREFIX = "cortex_"
+# seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_lock = threading.Lock()
+# (name, labels) -> [count per bucket..., +Inf count, sum]
+_histograms: dict[tuple[str, tuple], list[float]] = {}
+_buckets: dict[str, tuple] = {
+    "react_iterations": (1, 2, 3, 4, 5, 6),
+    "request_llm_tokens": (100, 250, 500, 1000, 2000, 5000, 10000, 20000, 50000),
+}
+_counters: dict[tuple[str, tuple], float] = {}
+_help: dict[str, str] = {
+    "stage_duration_seconds": "Time spent in each stage of a request",
+    "http_request_duration_seconds": "Request latency by route",
+    "llm_tokens_total": "LLM tokens used, by model and kind",
+    "request_llm_tokens": "LLM tokens used per request, by route and kind",
+    "llm_calls_total": "LLM calls that reached the provider, by model",
+    "react_iterations": "ReAct iterations per reconciled fact",
+    "tool_calls_total": "Memory tool calls made by the agent",
+    "admission_rejected_total": "Requests turned away with 429, by reason",
+}
+
+# (stage, seconds) of the current request, for the Server-Timing header
+request_timings: ContextVar[Optional[list]] = ContextVar("request_timings", default=None)
+# kind ("prompt", "completion") -> LLM tokens used by the current request
+request_llm_tokens: ContextVar[Optional[Counter]] = ContextVar(
+    "request_llm_tokens", default=None
+)
+
+
+def _key(name: str, labels: dict) -> tuple[str, tuple]:
+    return name, tuple(sorted(labels.items()))
+
+
+def observe(name: str, value: float, **labels):
+    key = _key(name, labels)
+    buckets = _buckets.get(name, BUCKETS)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [0.0] * (len(buckets) + 2)
+        histogram[bisect_left(buckets, value)] += 1
+        histogram[-1] += value
+
+
+def inc(name: str, value: float = 1, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+@contextmanager
+def span(stage: str):
+    """Time a block into stage_duration_seconds and the request's Server-Timing."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        observe("stage_duration_seconds", elapsed, stage=stage)
+        timings = request_timings.get()
+        if timings is not None:
+            timings.append((stage, elapsed))
+
+
+def timed(stage: str):
+    """Decorator: run an async function inside span(stage)."""
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            with span(stage):
+                return await fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def record_llm_usage(kwargs, completion_response, start_time, end_time):
+    """litellm success callback: count calls and tokens per model."""
+    model = kwargs.get("model", "unknown")
+    inc("llm_calls_total", model=model)
+    usage = getattr(completion_response, "usage", None)
+    if usage is not None:
+        inc("llm_tokens_total", getattr(usage, "prompt_tokens", 0) or 0, model=model, kind="prompt")
+        inc(
+            "llm_tokens_total",
+            getattr(usage, "completion_tokens", 0) or 0,
+            model=model,
+            kind="completion",
+        )
+
+
+def count_request_tokens(prompt: int, completion: int):
+    """Add one LLM call's tokens to the current request's tally, if any.
+
+    Like span, this works from the LLM threads too (run_llm copies the
+    request's context), so every call made for a request adds up.
+    """
+    tokens = request_llm_tokens.get()
+    if tokens is not None:
+        with _lock:
+            tokens["prompt"] += prompt or 0
+            tokens["completion"] += completion or 0
+
+
+def server_timing(
+    timings: Iterable[tuple[str, float]], llm_tokens: Optional[Counter] = None
+) -> str:
+    """Server-Timing value, summing repeated stages (e.g. several searches).
+
+    LLM tokens, when given, go in as llm_tokens entries with the count as
+    desc, e.g. llm_tokens_prompt;desc=1200.
+    """
+    totals: dict[str, float] = {}
+    for stage, seconds in timings:
+        totals[stage] = totals.get(stage, 0) + seconds
+    entries = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in totals.items()]
+    for kind, count in sorted((llm_tokens or {}).items()):
+        entries.append(f"llm_tokens_{kind};desc={count}")
+    return ", ".join(entries)
+
+
+def _labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    pairs = []
+    for k, v in labels:
+        value = str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{k}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def render(stats: Iterable[tuple[str, str, str, dict]] = ()) -> str:
+    """Prometheus text exposition of everything recorded plus extra stats.
+
+    stats are (name, type, help, {labels tuple: value}) for values that live
+    elsewhere, like cache hit counters.
+    """
+    lines = []
+    described = set()
+
+    def _describe(name: str, kind: str, help_text: str):
+        if name not in described:
+            described.add(name)
+            lines.append(f"# HELP {PREFIX}{name} {help_text}")
+            lines.append(f"# TYPE {PREFIX}{name} {kind}")
+
+    with _lock:
+        histograms = {key: list(value) for key, value in _histograms.items()}
+        counters = dict(_counters)
+
+    for (name, labels), histogram in sorted(histograms.items()):
+        _describe(name, "histogram", _help.get(name, name))
+        cumulative = 0.0
+        for bound, count in zip((*_buckets.get(name, BUCKETS), "+Inf"), histogram[:-1]):
+            cumulative += count
+            bucket_labels = (*labels, ("le", bound))
+            lines.append(f"{PREFIX}{name}_bucket{_labels(bucket_labels)} {cumulative:g}")
+        lines.append(f"{PREFIX}{name}_sum{_labels(labels)} {histogram[-1]:g}")
+        lines.append(f"{PREFIX}{name}_count{_labels(labels)} {cumulative:g}")
+
+    for (name, labels), value in sorted(counters.items()):
+        _describe(name, "counter", _help.get(name, name))
+        lines.append(f"{PREFIX}{name}{_labels(labels)} {value:g}")
+
+    for name, kind, help_text, values in stats:
+        _describe(name, kind, help_text)
+        for labels, value in values.items():
+            lines.append(f"{PREFIX}{name}{_labels(labels)} {value:g}")
+    return "\n".join(lines) + "\n"
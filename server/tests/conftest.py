@@ -0,0 +1,59 @@
+import os
+import tempfile
+
+import pytest
+
+# the app reads its configuration at import time, so this runs before any
+# test module imports it: Qdrant in process, small vectors, state in a temp dir
+_workdir = tempfile.mkdtemp(prefix="cortex-tests-")
+for _name, _value in {
+    "QDRANT_LOCATION": ":memory:",
+    "VECTOR_BACKEND": "qdrant",
+    "OPENAI_API_KEY": "test",
+    "EMBED_DIMENSIONS": "16",
+    "LOCAL_STORE_DIR": os.path.join(_workdir, "local_store"),
+    "INGEST_QUEUE_PATH": os.path.join(_workdir, "ingest_jobs.db"),
+    "CONVERSATION_LOG_PATH": os.path.join(_workdir, "conversations.db"),
+    "JUDGE_CACHE_PATH": os.path.join(_workdir, "eval_judge_cache.db"),
+    "COMPACTION_INTERVAL_SECONDS": "0",
+    # litellm's bundled model prices, instead of fetching them
+    "LITELLM_LOCAL_MODEL_COST_MAP": "True",
+}.items():
+    os.environ[_name] = _value
+for _name in ["QDRANT_URL", "QDRANT_PATH", "EMBED_CACHE_PATH", "SUPABASE_URL"]:
+    os.environ.pop(_name, None)
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+def _unit_vector(hot: int) -> list[float]:
+    vector = [0.0] * 16
+    vector[hot] = 1.0
+    return vector
+
+
+def _memory(user_id: str, text: str, hot: int = 0, categories: tuple = ("music",)):
+    from app.memory.vector_DB import EmbeddedMemory
+
+    return EmbeddedMemory(
+        user_id=user_id,
+        memory_text=text,
+        categories=list(categories),
+        date="2024-01-01",
+        embedding=_unit_vector(hot),
+    )
+
+
+@pytest.fixture
+def unit_vector():
+    """unit_vector(hot): a 16-d vector with 1.0 at index hot."""
+    return _unit_vector
+
+
+@pytest.fixture
+def make_memory():
+    """make_memory(user_id, text, hot=0, categories=("music",)): an EmbeddedMemory."""
+    return _memory
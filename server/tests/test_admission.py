@@ -0,0 +1,89 @@
+import pytest
+from app.api import admission
+from app.api.admission import Limiter, TokenBucket, admit_ingest
+from app.api.models import IngestRequest
+from fastapi import HTTPException
+
+
+def test_token_bucket_refills_at_its_rate(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(admission.time, "monotonic", lambda: now[0])
+    bucket = TokenBucket(rate=2, burst=4)
+    assert bucket.take(3) == 0
+    assert bucket.take(3) == pytest.approx(1.0)
+    now[0] += 1
+    assert bucket.take(3) == 0
+
+
+def test_token_bucket_charges_big_requests_a_full_bucket():
+    bucket = TokenBucket(rate=1, burst=4)
+    assert bucket.take(100) == 0
+    assert bucket.take(1) > 0
+    bucket.give_back(100)
+    assert bucket.tokens == 4
+
+
+def _limiter(**limits) -> Limiter:
+    settings = dict(
+        rate_per_user=0,
+        burst_per_user=0,
+        rate=0,
+        burst=0,
+        max_in_flight_per_user=0,
+        max_in_flight=0,
+    )
+    settings.update(limits)
+    return Limiter("test", **settings)
+
+
+def _rejection(limiter: Limiter, user_id: str, cost: float = 1) -> HTTPException:
+    with pytest.raises(HTTPException) as raised:
+        limiter.admit(user_id, cost)
+    assert raised.value.status_code == 429
+    assert int(raised.value.headers["Retry-After"]) >= 1
+    return raised.value
+
+
+def test_limits_requests_in_flight_per_user_and_overall():
+    limiter = _limiter(max_in_flight_per_user=1, max_in_flight=2)
+    limiter.admit("a")
+    assert "user concurrency" in _rejection(limiter, "a").detail
+    limiter.admit("b")
+    assert "global concurrency" in _rejection(limiter, "c").detail
+    limiter.release("a")
+    limiter.admit("c")
+    assert limiter.total_in_flight == 2
+
+
+def test_global_rejection_gives_the_user_tokens_back():
+    limiter = _limiter(rate_per_user=1, burst_per_user=5, rate=1, burst=3)
+    limiter.admit("a", 3)
+    limiter.release("a")
+    assert "global rate" in _rejection(limiter, "b", 3).detail
+    assert limiter.buckets["b"].tokens == pytest.approx(5, abs=0.01)
+    assert "user rate" in _rejection(limiter, "a", 3).detail
+
+
+@pytest.mark.anyio
+async def test_background_ingest_is_bounded_by_queued_jobs(monkeypatch):
+    async def _active_jobs(user_id):
+        return {"busy": 20}.get(user_id, 0)
+
+    monkeypatch.setattr(admission, "ADMISSION_ENABLED", True)
+    monkeypatch.setattr(admission, "INGEST_MAX_QUEUED_PER_USER", 20)
+    monkeypatch.setattr(admission, "active_jobs", _active_jobs)
+    monkeypatch.setattr(admission, "ingest_limiter", _limiter())
+    request = IngestRequest(messages=[{"role": "user", "content": "hi"}])
+
+    with pytest.raises(HTTPException) as raised:
+        await admit_ingest(request, background=True, user_id="busy").__anext__()
+    assert raised.value.status_code == 429
+
+    admitted = admit_ingest(request, background=True, user_id="idle")
+    assert await admitted.__anext__() == "idle"
+    await admitted.aclose()
+    # foreground ingests are bounded by their in-flight slot instead
+    admitted = admit_ingest(request, background=False, user_id="busy")
+    assert await admitted.__anext__() == "busy"
+    await admitted.aclose()
+    assert admission.ingest_limiter.total_in_flight == 0
@@ -0,0 +1,93 @@
+import time
+from types import SimpleNamespace
+
+import jwt
+import pytest
+from app.api import auth
+from app.api.auth import TokenCache, get_current_user
+from cryptography.hazmat.primitives.asymmetric import ec
+from fastapi import HTTPException
+
+pytestmark = pytest.mark.anyio
+
+
+class _JWKS:
+    """PyJWKClient stand-in serving keys, or failing like an unreachable JWKS."""
+
+    def __init__(self, keys: dict, error: Exception = None):
+        self.keys = keys
+        self.error = error
+        self.fetches = 0
+
+    def get_jwk_set(self, refresh: bool = False):
+        self.fetches += 1
+        if self.error:
+            raise self.error
+        return SimpleNamespace(
+            keys=[SimpleNamespace(key_id=kid, key=key) for kid, key in self.keys.items()]
+        )
+
+
+@pytest.fixture
+def es256(monkeypatch):
+    private_key = ec.generate_private_key(ec.SECP256R1())
+    monkeypatch.setattr(auth, "_signing_keys", {"old": private_key.public_key()})
+    monkeypatch.setattr(auth, "_last_jwks_fetch", 0.0)
+    monkeypatch.setattr(auth, "_jwks_failed", False)
+    monkeypatch.setattr(auth, "token_cache", TokenCache(16))
+
+    def _token(kid: str, sub: str = "user-1") -> str:
+        claims = {"sub": sub, "exp": int(time.time()) + 60}
+        return "Bearer " + jwt.encode(claims, private_key, "ES256", headers={"kid": kid})
+
+    return private_key, _token
+
+
+async def test_known_kid_is_verified_and_cached(es256, monkeypatch):
+    _, token = es256
+    monkeypatch.setattr(auth, "_jwk_client", _JWKS({}))
+    bearer = token("old")
+    assert await get_current_user(bearer) == "user-1"
+    assert await get_current_user(bearer) == "user-1"
+    assert auth.token_cache.hits == 1
+
+
+async def test_unknown_kid_refetches_the_jwks(es256, monkeypatch):
+    private_key, token = es256
+    jwks = _JWKS({"new": private_key.public_key()})
+    monkeypatch.setattr(auth, "_jwk_client", jwks)
+    assert await get_current_user(token("new")) == "user-1"
+    assert jwks.fetches == 1
+
+
+async def test_unknown_kid_missing_from_the_jwks_is_unauthorized(es256, monkeypatch):
+    _, token = es256
+    monkeypatch.setattr(auth, "_jwk_client", _JWKS({}))
+    with pytest.raises(HTTPException) as raised:
+        await get_current_user(token("forged"))
+    assert raised.value.status_code == 401
+
+
+async def test_jwks_outage_keeps_the_cached_keys(es256, monkeypatch):
+    _, token = es256
+    jwks = _JWKS({}, error=jwt.PyJWKClientConnectionError("unreachable"))
+    monkeypatch.setattr(auth, "_jwk_client", jwks)
+    with pytest.raises(HTTPException) as raised:
+        await get_current_user(token("rotated"))
+    assert raised.value.status_code == 503
+    assert await get_current_user(token("old", sub="user-2")) == "user-2"
+    # the refetch is rate limited, not retried on every request
+    with pytest.raises(HTTPException):
+        await get_current_user(token("rotated", sub="user-3"))
+    assert jwks.fetches == 1
+
+
+def test_token_cache_expires_and_evicts():
+    cache = TokenCache(max_entries=2)
+    cache.put("a", "user-a", exp=time.time() + 60)
+    cache.put("expired", "user-x", exp=time.time() - 1)
+    assert cache.get("expired") is None
+    cache.put("b", "user-b", exp=None)
+    cache.put("c", "user-c", exp=None)
+    assert cache.get("a") is None
+    assert cache.get("c") == "user-c"
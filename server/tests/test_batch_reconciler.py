@@ -0,0 +1,162 @@
+from types import SimpleNamespace
+
+import pytest
+from app.bench.fakes import FakeEmbeddings
+from app.memory import batch_reconciler, embed_memory
+from app.memory.batch_reconciler import MemoryAction, reconcile_batch
+from app.memory.embed_memory import EmbeddingCache, embed_texts
+from app.memory.extract_memory import Memory
+from app.memory.vector_DB import (
+    EmbeddedMemory,
+    create_collection,
+    insert_memories,
+    list_memories,
+)
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def embeddings(monkeypatch):
+    monkeypatch.setattr(
+        embed_memory,
+        "async_client",
+        SimpleNamespace(embeddings=FakeEmbeddings(latency=0, is_async=True)),
+    )
+    monkeypatch.setattr(embed_memory, "cache", EmbeddingCache(max_entries=100))
+
+
+@pytest.fixture
+def answer(monkeypatch):
+    """answer(*actions): make the reconciler's LLM call return actions."""
+    prompts = []
+
+    def _answer(*actions: MemoryAction):
+        def _predict(new_memories, existing_memories):
+            prompts.append(existing_memories)
+            return SimpleNamespace(actions=list(actions))
+
+        monkeypatch.setattr(batch_reconciler, "batch_reconciler", _predict)
+        return prompts
+
+    return _answer
+
+
+async def _seed(user_id: str, *texts: str) -> dict[str, str]:
+    """Store texts for user_id; returns text -> id."""
+    await create_collection()
+    vectors = await embed_texts(list(texts))
+    await insert_memories(
+        [
+            EmbeddedMemory(
+                user_id=user_id,
+                memory_text=text,
+                categories=["places"],
+                date="2024-01-01",
+                embedding=vector,
+            )
+            for text, vector in zip(texts, vectors)
+        ]
+    )
+    return {p.payload["memory_text"]: str(p.id) for p in await list_memories(user_id)}
+
+
+async def _texts(user_id: str) -> list[str]:
+    return sorted(p.payload["memory_text"] for p in await list_memories(user_id))
+
+
+def _facts(*texts: str) -> list[Memory]:
+    return [Memory(information=text, predicted_categories=["places"]) for text in texts]
+
+
+async def test_applies_adds_updates_and_deletes(embeddings, answer):
+    ids = await _seed("batch-apply", "lives in Paris", "works in Paris")
+    prompts = answer(
+        MemoryAction(action="update", memory_id=ids["lives in Paris"], text="lives in Berlin"),
+        MemoryAction(action="delete", memory_id=ids["works in Paris"]),
+        MemoryAction(action="add", text="works in Berlin", categories=["work"]),
+        MemoryAction(action="noop", text="already known"),
+    )
+
+    taken = await reconcile_batch(
+        _facts("lives in Berlin", "works in Berlin now"), "batch-apply"
+    )
+    assert taken == [
+        "no action: already known",
+        f"updated: {ids['lives in Paris']}",
+        f"deleted: {ids['works in Paris']}",
+        "added: works in Berlin",
+    ]
+    assert await _texts("batch-apply") == ["lives in Berlin", "works in Berlin"]
+    # the model saw the neighbours of every fact, once each
+    assert sorted(line.split(" | ")[0] for line in prompts[0].splitlines()) == sorted(
+        f"id: {memory_id}" for memory_id in ids.values()
+    )
+
+
+async def test_ignores_ids_it_was_not_shown(embeddings, answer):
+    await _seed("batch-unknown", "lives in Paris")
+    other = await _seed("batch-unknown-other", "lives in Paris")
+    answer(
+        MemoryAction(action="update", memory_id="f" * 32, text="lives in Rome"),
+        MemoryAction(action="delete", memory_id=other["lives in Paris"]),
+    )
+
+    taken = await reconcile_batch(_facts("lives in Paris"), "batch-unknown")
+    assert all(action.startswith("ignored invalid action") for action in taken)
+    assert len(taken) == 2
+    assert await _texts("batch-unknown") == ["lives in Paris"]
+    assert await _texts("batch-unknown-other") == ["lives in Paris"]
+
+
+async def test_acts_once_per_id(embeddings, answer):
+    ids = await _seed("batch-twice", "lives in Paris")
+    memory_id = ids["lives in Paris"]
+    answer(
+        MemoryAction(action="update", memory_id=memory_id, text="lives in Lyon"),
+        MemoryAction(action="delete", memory_id=memory_id),
+        MemoryAction(action="update", memory_id=memory_id, text="lives in Nice"),
+    )
+
+    taken = await reconcile_batch(_facts("lives in Lyon"), "batch-twice")
+    assert taken == [
+        f"skipped duplicate delete of {memory_id}",
+        f"skipped duplicate update of {memory_id}",
+        f"updated: {memory_id}",
+    ]
+    assert await _texts("batch-twice") == ["lives in Lyon"]
+
+
+async def test_drops_updates_without_text_and_invalid_adds(embeddings, answer):
+    ids = await _seed("batch-empty", "lives in Paris")
+    memory_id = ids["lives in Paris"]
+    answer(
+        MemoryAction(action="update", memory_id=memory_id),
+        MemoryAction(action="add"),
+        # the empty update didn't use up the id
+        MemoryAction(action="update", memory_id=memory_id, text="lives in Lille"),
+    )
+
+    taken = await reconcile_batch(_facts("lives in Lille"), "batch-empty")
+    assert taken[0].startswith("ignored invalid action")
+    assert taken[1:] == [f"updated: {memory_id}"]
+    assert await _texts("batch-empty") == ["lives in Lille"]
+
+
+async def test_delete_then_add_replaces_a_memory(embeddings, answer):
+    ids = await _seed("batch-replace", "has a dog named Rex")
+    answer(
+        MemoryAction(action="delete", memory_id=ids["has a dog named Rex"]),
+        MemoryAction(action="add", text="has a cat named Rex", categories=["pets"]),
+    )
+
+    await reconcile_batch(_facts("has a cat named Rex, not a dog"), "batch-replace")
+    [point] = await list_memories("batch-replace")
+    assert point.payload["memory_text"] == "has a cat named Rex"
+    assert str(point.id) != ids["has a dog named Rex"]
+    assert point.payload["categories"] == ["pets"]
+
+
+async def test_nothing_to_reconcile(answer):
+    answer()
+    assert await reconcile_batch([], "batch-none") == []
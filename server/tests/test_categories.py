@@ -0,0 +1,56 @@
+import pytest
+from app.memory.categories import CategoryRegistry, prompt_categories
+from app.memory.vector_DB import (
+    apply_memory_writes,
+    create_collection,
+    delete_memory,
+    insert_memories,
+    list_memories,
+    update_memory,
+    upsert_points,
+    user_categories,
+)
+from qdrant_client import models
+
+pytestmark = pytest.mark.anyio
+
+
+def test_registry_counts_each_memory_once():
+    registry = CategoryRegistry(refresh_seconds=60)
+    registry.put("u", "m1", ["food"])
+    assert registry.get("u") is None
+
+    registry.load("u", {"m1": ["food"], "m2": ["food", "work"]})
+    registry.put("u", "m1", ["food"])
+    assert registry.get("u") == {"food": 2, "work": 1}
+
+    registry.put("u", "m2", ["travel"])
+    assert registry.get("u") == {"food": 1, "travel": 1}
+    registry.remove(["m1"], "u")
+    registry.remove(["m2"])
+    assert registry.get("u") == {}
+    assert prompt_categories(registry.get("u")) == []
+
+
+async def test_overwrites_and_deletes_adjust_the_counts(make_memory):
+    await create_collection()
+    user_id = "categories"
+    await insert_memories([make_memory(user_id, "likes sushi", categories=["food"])])
+    assert await user_categories(user_id) == {"food": 1}
+
+    [point] = await list_memories(user_id, with_vectors=True)
+    # re-importing an export writes the same ids again
+    await upsert_points(
+        [models.PointStruct(id=point.id, payload=point.payload, vector=point.vector)]
+    )
+    assert await user_categories(user_id) == {"food": 1}
+
+    memory_id = str(point.id)
+    await update_memory(memory_id, "cooks sushi", ["food", "hobbies"], user_id, point.vector)
+    await apply_memory_writes(
+        {memory_id: make_memory(user_id, "cooks sushi weekly", categories=["hobbies"])}, []
+    )
+    assert await user_categories(user_id) == {"hobbies": 1}
+
+    await delete_memory(memory_id, user_id)
+    assert await user_categories(user_id) == {}
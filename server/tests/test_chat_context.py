@@ -0,0 +1,80 @@
+from types import SimpleNamespace
+
+import pytest
+from app.memory import chat_context
+from app.memory.chat_context import SummaryCache, assemble_context
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def summarizer(monkeypatch):
+    """Stand-in summarizer; one word is one token. Returns its calls."""
+    calls = []
+
+    def _summarize(summary, messages):
+        calls.append((summary, messages.splitlines()))
+        return SimpleNamespace(updated_summary=f"summary {len(calls)}")
+
+    monkeypatch.setattr(chat_context, "history_summarizer", _summarize)
+    monkeypatch.setattr(chat_context, "count_tokens", lambda text: len(text.split()))
+    monkeypatch.setattr(chat_context, "HISTORY_SUMMARY_TOKENS", 10)
+    monkeypatch.setattr(chat_context, "HISTORY_SUMMARY_STEP", 4)
+    monkeypatch.setattr(chat_context, "summary_cache", SummaryCache(100))
+    return calls
+
+
+def _messages(count: int) -> list[dict]:
+    # "user: mI a b" is 4 tokens
+    return [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": f"m{i} a b"}
+        for i in range(count)
+    ]
+
+
+async def test_history_that_fits_is_sent_as_is(summarizer):
+    history, context = await assemble_context(_messages(5), "likes jazz", budget=40)
+    assert history.splitlines() == [f"{m['role']}: {m['content']}" for m in _messages(5)]
+    assert context == "likes jazz"
+    assert summarizer == []
+
+
+async def test_older_turns_are_folded_in_whole_steps(summarizer):
+    history, _ = await assemble_context(_messages(20), "", budget=40)
+    # 7 messages fit next to the summary; the fold rounds 13 up to 16
+    [(previous, folded)] = summarizer
+    assert previous == ""
+    assert len(folded) == 16
+    assert history.splitlines() == [
+        "summary of earlier conversation: summary 1",
+        *[f"{m['role']}: {m['content']}" for m in _messages(20)[16:]],
+    ]
+
+
+async def test_latest_message_stays_verbatim(summarizer):
+    messages = _messages(2) + [{"role": "user", "content": " ".join(["word"] * 100)}]
+    history, _ = await assemble_context(messages, "", budget=50)
+    [(_, folded)] = summarizer
+    assert len(folded) == 2
+    assert history.splitlines()[-1] == f"user: {messages[-1]['content']}"
+
+
+async def test_memories_are_cut_from_the_end_only_when_they_overflow(summarizer):
+    lines = [f"memory {i} a b c" for i in range(12)]
+    history, context = await assemble_context([], "\n".join(lines), budget=40)
+    assert context.splitlines() == lines[:8]
+    assert history == ""
+
+
+async def test_summaries_resume_from_the_last_cached_step(summarizer):
+    await assemble_context(_messages(20), "", budget=40)
+    history, _ = await assemble_context(_messages(28), "", budget=40)
+    # the first 16 were summarized already, so only 16..23 are read
+    assert summarizer[1] == (
+        "summary 1",
+        [f"{m['role']}: {m['content']}" for m in _messages(28)[16:24]],
+    )
+    assert history.startswith("summary of earlier conversation: summary 2")
+
+    await assemble_context(_messages(28), "", budget=40)
+    assert len(summarizer) == 2
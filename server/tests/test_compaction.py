@@ -0,0 +1,47 @@
+import threading
+
+import numpy as np
+import pytest
+from app.memory import compaction
+from app.memory.compaction import compact_user, similar_pairs
+from app.memory.vector_DB import create_collection, insert_memories, list_memories
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_compaction_rereads_before_merging(make_memory):
+    await create_collection()
+    await insert_memories(
+        [make_memory("compact", "loves jazz"), make_memory("compact", "loves jazz music")]
+    )
+
+    stats = await compact_user("compact", dry_run=False)
+    assert stats["deleted"] == 1
+    assert len(await list_memories("compact")) == 1
+
+
+async def test_similar_pairs_run_off_the_event_loop(monkeypatch, make_memory):
+    await create_collection()
+    await insert_memories(
+        [
+            make_memory("compact-thread", "plays go"),
+            make_memory("compact-thread", "plays go a lot"),
+        ]
+    )
+    threads = []
+    similar_pairs = compaction.similar_pairs
+
+    def _similar_pairs(vectors, threshold):
+        threads.append(threading.current_thread())
+        return similar_pairs(vectors, threshold)
+
+    monkeypatch.setattr(compaction, "similar_pairs", _similar_pairs)
+    await compact_user("compact-thread", dry_run=True)
+    assert threads and threads[0] is not threading.main_thread()
+
+
+def test_similar_pairs_most_similar_first():
+    vectors = np.asarray([[1, 0], [0.9, 0.1], [0, 1], [1, 0]], dtype=np.float32)
+    pairs = similar_pairs(vectors, 0.9)
+    assert pairs[0][1:] == (0, 3)
+    assert sorted((i, j) for _, i, j in pairs[1:]) == [(0, 1), (1, 3)]
@@ -0,0 +1,55 @@
+from app.api.models import IngestRequest
+from app.memory import conversations
+from app.memory.conversations import ConversationLog, message_hashes
+
+MESSAGES = [
+    {"role": "user", "content": "I moved to Lisbon"},
+    {"role": "assistant", "content": "Nice!"},
+    {"role": "user", "content": "I work remotely now"},
+]
+
+
+def test_conversation_id_is_opt_in():
+    assert IngestRequest(messages=[]).conversation_id is None
+
+
+def test_processed_count_follows_the_chain(tmp_path):
+    log = ConversationLog(str(tmp_path / "log.db"))
+    hashes = message_hashes(MESSAGES)
+    log.mark("u", "c", hashes[:2])
+    assert log.processed_count("u", "c", hashes) == 2
+    assert log.processed_count("u", "other", hashes) == 0
+    edited = message_hashes([{"role": "user", "content": "I moved to Porto"}, *MESSAGES[1:]])
+    assert log.processed_count("u", "c", edited) == 0
+
+
+def test_keeps_the_latest_conversations_per_user(tmp_path):
+    log = ConversationLog(str(tmp_path / "log.db"), max_per_user=2)
+    hashes = message_hashes(MESSAGES)
+    for conversation_id in ["a", "b", "c"]:
+        log.mark("u", conversation_id, hashes)
+    log.mark("someone-else", "a", hashes)
+    assert log.processed_count("u", "a", hashes) == 0
+    assert log.processed_count("u", "c", hashes) == 3
+    assert log.processed_count("someone-else", "a", hashes) == 3
+
+
+def test_prunes_expired_conversations(tmp_path, monkeypatch):
+    monkeypatch.setattr(conversations, "_PRUNE_EVERY", 1)
+    log = ConversationLog(str(tmp_path / "log.db"), ttl_seconds=60)
+    hashes = message_hashes(MESSAGES)
+    log.mark("u", "old", hashes)
+    log._db.execute("UPDATE ingested SET ingested_at = ingested_at - 120")
+    log.mark("u", "new", hashes)
+    assert log.processed_count("u", "old", hashes) == 0
+    assert log.processed_count("u", "new", hashes) == 3
+
+
+
+def test_log_is_opened_on_first_use(monkeypatch, tmp_path):
+    path = tmp_path / "lazy.db"
+    monkeypatch.setattr(conversations, "CONVERSATION_LOG_PATH", str(path))
+    monkeypatch.setattr(conversations, "_log", None)
+    assert not path.exists()
+    assert conversations.get_conversation_log() is conversations.get_conversation_log()
+    assert path.exists()
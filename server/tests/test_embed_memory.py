@@ -0,0 +1,119 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+
+import pytest
+from app.bench.fakes import FakeEmbeddings
+from app.memory import embed_memory
+from app.memory.embed_memory import EmbeddingBatcher, EmbeddingCache
+
+pytestmark = pytest.mark.anyio
+
+
+def test_embedding_cache_keys_by_model_and_text():
+    cache = EmbeddingCache(max_entries=10)
+    cache.put("small:16", "likes jazz", [0.5, 0.25])
+    assert cache.get("small:16", "likes jazz") == [0.5, 0.25]
+    assert cache.get("small:32", "likes jazz") is None
+    assert cache.get("small:16", "likes rock") is None
+    assert cache.stats() == {"hits": 1, "misses": 2, "entries": 1}
+
+
+def test_embedding_cache_evicts_least_recently_used():
+    cache = EmbeddingCache(max_entries=2)
+    cache.put("m", "a", [1.0])
+    cache.put("m", "b", [2.0])
+    assert cache.get("m", "a") == [1.0]
+    cache.put("m", "c", [3.0])
+    assert cache.get("m", "b") is None
+    assert cache.get("m", "a") == [1.0]
+    assert cache.get("m", "c") == [3.0]
+
+
+def test_embedding_cache_persists_to_sqlite(tmp_path):
+    path = str(tmp_path / "embeddings.db")
+    cache = EmbeddingCache(max_entries=10, path=path)
+    cache.put("m", "likes jazz", [0.5, -0.25])
+    assert EmbeddingCache(max_entries=10, path=path).load("m", ["likes jazz"]) == {}
+    cache.save()
+
+    reopened = EmbeddingCache(max_entries=10, path=path)
+    assert reopened.get("m", "likes jazz") is None
+    # stored as float32, so only values float32 holds exactly come back as is
+    assert reopened.load("m", ["likes jazz", "has a cat"]) == {"likes jazz": [0.5, -0.25]}
+    assert reopened.get("m", "likes jazz") == [0.5, -0.25]
+
+
+@pytest.fixture
+def embeddings(monkeypatch):
+    fake = FakeEmbeddings(latency=0, is_async=True)
+    monkeypatch.setattr(embed_memory, "async_client", SimpleNamespace(embeddings=fake))
+    return fake
+
+
+async def test_batcher_sends_concurrent_texts_together(embeddings):
+    batcher = EmbeddingBatcher(max_batch_size=64, wait_ms=5)
+    first, second = await asyncio.gather(
+        batcher.embed(["likes jazz", "has a cat"]), batcher.embed(["likes jazz"])
+    )
+    assert embeddings.calls == 1
+    assert first[0] == second[0]
+    assert len(first[1]) == embed_memory.EMBED_DIMENSIONS
+
+
+async def test_batcher_splits_at_max_batch_size(embeddings):
+    batcher = EmbeddingBatcher(max_batch_size=2, wait_ms=1000)
+    vectors = await batcher.embed(["a", "b", "c", "d", "e"])
+    assert len(vectors) == 5
+    assert embeddings.calls == 3
+
+
+async def test_batcher_fails_every_caller_of_a_failed_batch(monkeypatch):
+    async def _create(**kwargs):
+        raise RuntimeError("provider down")
+
+    monkeypatch.setattr(
+        embed_memory,
+        "async_client",
+        SimpleNamespace(embeddings=SimpleNamespace(create=_create)),
+    )
+    batcher = EmbeddingBatcher(max_batch_size=64, wait_ms=1)
+    results = await asyncio.gather(
+        batcher.embed(["a"]), batcher.embed(["b"]), return_exceptions=True
+    )
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+
+async def test_embed_texts_embeds_each_uncached_text_once(embeddings, monkeypatch):
+    monkeypatch.setattr(embed_memory, "cache", EmbeddingCache(max_entries=10))
+    vectors = await embed_memory.embed_texts(["likes jazz", "likes jazz", "has a cat"])
+    assert vectors[0] == vectors[1]
+    assert embeddings.calls == 1
+
+    await embed_memory.embed_texts(["likes jazz", "has a cat"])
+    assert embeddings.calls == 1
+    assert embed_memory.cache.stats()["hits"] == 2
+
+
+async def test_embed_texts_keeps_sqlite_off_the_loop(embeddings, monkeypatch, tmp_path):
+    path = str(tmp_path / "embeddings.db")
+    cache = EmbeddingCache(max_entries=10, path=path)
+    threads = []
+    for name in ("load", "save"):
+        method = getattr(cache, name)
+
+        def _record(*args, method=method):
+            threads.append(threading.current_thread())
+            return method(*args)
+
+        monkeypatch.setattr(cache, name, _record)
+    monkeypatch.setattr(embed_memory, "cache", cache)
+
+    vectors = await embed_memory.embed_texts(["likes jazz", "has a cat"])
+    assert len(threads) == 2
+    assert threading.main_thread() not in threads
+
+    # a restart finds both in the file, with one read
+    monkeypatch.setattr(embed_memory, "cache", EmbeddingCache(max_entries=10, path=path))
+    assert await embed_memory.embed_texts(["likes jazz", "has a cat"]) == vectors
+    assert embeddings.calls == 1
@@ -0,0 +1,172 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from app.bench.fakes import FakeEmbeddings
+from app.memory import embed_memory, ingest, tool_caller, tools
+from app.memory.extract_memory import Memory
+from app.memory.lm import run_llm
+from app.memory.locks import memory_locks
+from app.memory.vector_DB import (
+    create_collection,
+    current_unit_of_work,
+    insert_memories,
+    list_memories,
+    store,
+    unit_of_work,
+)
+
+pytestmark = pytest.mark.anyio
+
+
+async def _texts(user_id: str) -> list[str]:
+    return sorted(point.payload["memory_text"] for point in await list_memories(user_id))
+
+
+async def test_unit_of_work_flushes_on_exit(make_memory):
+    await create_collection()
+    async with unit_of_work("uow-flush") as uow:
+        uow.insert(make_memory("uow-flush", "plays bass"))
+        assert uow.pending_count() == 1
+        assert await _texts("uow-flush") == []
+    assert await _texts("uow-flush") == ["plays bass"]
+
+
+async def test_unit_of_work_discards_on_error(make_memory):
+    await create_collection()
+    with pytest.raises(RuntimeError):
+        async with unit_of_work("uow-error") as uow:
+            uow.insert(make_memory("uow-error", "plays drums"))
+            raise RuntimeError("reconcile failed")
+    assert await _texts("uow-error") == []
+
+
+async def test_unit_of_work_nests_and_ignores_other_users():
+    async with unit_of_work("uow-outer") as outer:
+        async with unit_of_work("uow-outer") as inner:
+            assert inner is outer
+        assert current_unit_of_work("someone-else") is None
+
+
+async def test_overlay_hides_deletes_and_shows_inserts(make_memory, unit_vector):
+    await create_collection()
+    await insert_memories([make_memory("uow-overlay", "likes opera", 1)])
+    [stored] = await list_memories("uow-overlay")
+    async with unit_of_work("uow-overlay") as uow:
+        uow.delete(str(stored.id))
+        new_id = uow.insert(make_memory("uow-overlay", "likes jazz", 1))
+        results = await ingest.search_memories(unit_vector(1), "uow-overlay")
+        assert [str(r.id) for r in results] == [new_id]
+        assert uow.get(str(stored.id)) is None
+    assert await _texts("uow-overlay") == ["likes jazz"]
+
+
+async def test_fact_writes_are_stored_before_its_locks_are_released(
+    monkeypatch, make_memory, unit_vector
+):
+    """A reader that waited for a fact's locks sees what the fact wrote."""
+    await create_collection()
+    user_id = "lock-order"
+    await insert_memories([make_memory(user_id, "likes opera", 2)])
+    [stored] = await list_memories(user_id)
+    memory_id = str(stored.id)
+
+    async def _reconcile(memory, results, user_id):
+        uow = current_unit_of_work(user_id)
+        uow.update(str(results[0].id), make_memory(user_id, memory.information, 2))
+        await asyncio.sleep(0.05)
+        return "updated"
+
+    async def _embed(texts):
+        return [unit_vector(2) for _ in texts]
+
+    monkeypatch.setattr(ingest, "reconcile_memory", _reconcile)
+    monkeypatch.setattr(ingest, "embed_texts", _embed)
+    monkeypatch.setattr(
+        ingest,
+        "memory_extract_from_messages",
+        lambda messages, categories, context: [
+            Memory(information="likes opera and jazz", predicted_categories=["music"])
+        ],
+    )
+
+    async def _reader():
+        await asyncio.sleep(0.01)
+        async with memory_locks.hold(user_id, {memory_id}):
+            [record] = await store.retrieve([memory_id], user_id=user_id)
+            return record.payload["memory_text"]
+
+    messages = [{"role": "user", "content": "I like opera and jazz"}]
+    actions, seen = await asyncio.gather(
+        ingest.ingest_conversation(messages, user_id), _reader()
+    )
+    assert actions == ["updated"]
+    assert seen == "likes opera and jazz"
+
+
+async def test_facts_are_reconciled_concurrently_up_to_the_limit(monkeypatch, unit_vector):
+    running = 0
+    most = 0
+
+    async def _reconcile_fact(memory, embedding, user_id):
+        nonlocal running, most
+        running += 1
+        most = max(most, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return f"added: {memory.information}"
+
+    async def _embed(texts):
+        return [unit_vector(0) for _ in texts]
+
+    done = []
+
+    async def _fact_done(action):
+        done.append(action)
+
+    monkeypatch.setattr(ingest, "INGEST_CONCURRENCY", 2)
+    monkeypatch.setattr(ingest, "reconcile_fact", _reconcile_fact)
+    monkeypatch.setattr(ingest, "embed_texts", _embed)
+    memories = [Memory(information=f"fact {i}", predicted_categories=[]) for i in range(5)]
+
+    actions = await ingest.reconcile_memories(memories, "concurrent", on_fact_done=_fact_done)
+    assert actions == [f"added: fact {i}" for i in range(5)]
+    assert sorted(done) == actions
+    assert most == 2
+
+
+async def test_agent_tools_can_change_the_memories_found(
+    monkeypatch, make_memory, unit_vector
+):
+    """update and delete accept the neighbours searched before the locks."""
+    await create_collection()
+    user_id = "agent-tools"
+    await insert_memories(
+        [make_memory(user_id, "lives in Paris", 3), make_memory(user_id, "works at Acme", 3)]
+    )
+    paris, acme = sorted(
+        await list_memories(user_id), key=lambda point: point.payload["memory_text"]
+    )
+
+    async def _process_memory(new_memory, existing_memories, user_id):
+        def _run():
+            return [
+                tools.update(str(paris.id), new_memory, ["places"]),
+                tools.delete(str(acme.id)),
+            ]
+
+        return SimpleNamespace(action_taken="; ".join(await run_llm(_run)))
+
+    embeddings = FakeEmbeddings(latency=0, is_async=True)
+    monkeypatch.setattr(embed_memory, "async_client", SimpleNamespace(embeddings=embeddings))
+    monkeypatch.setattr(
+        embed_memory, "client", SimpleNamespace(embeddings=FakeEmbeddings(0, is_async=False))
+    )
+    monkeypatch.setattr(tool_caller, "FAST_NOOP_ABOVE", 1.01)
+    monkeypatch.setattr(tool_caller, "FAST_ADD_BELOW", 0.0)
+    monkeypatch.setattr(tool_caller, "process_memory", _process_memory)
+
+    memory = Memory(information="lives in Berlin", predicted_categories=["places"])
+    action = await ingest.reconcile_fact(memory, unit_vector(3), user_id)
+    assert action == f"updated: {paris.id}; deleted: {acme.id}"
+    assert await _texts(user_id) == ["lives in Berlin"]
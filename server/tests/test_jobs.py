@@ -0,0 +1,103 @@
+import asyncio
+import os
+
+import pytest
+from app.memory import jobs
+from app.memory.jobs import IngestQueue
+
+MESSAGES = [{"role": "user", "content": "I have a cat called Miso"}]
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return IngestQueue(str(tmp_path / "jobs.db"))
+
+
+def test_importing_the_app_does_not_open_the_queue():
+    import app.main  # noqa: F401
+
+    assert not os.path.exists(os.environ["INGEST_QUEUE_PATH"])
+
+
+def test_job_runs_to_done(queue):
+    job_id = queue.enqueue("u", MESSAGES, "conversation")
+    assert queue.get(job_id)["status"] == "queued"
+
+    job = queue.claim()
+    assert job["id"] == job_id
+    assert job["attempts"] == 1
+    assert job["messages"] == MESSAGES
+    assert queue.claim() is None
+
+    queue.progress(job_id, "reconciling", 1, 2, ["added: a"])
+    queue.complete(job_id, ["added: a", "added: b"])
+    done = queue.get(job_id)
+    assert (done["status"], done["processed"], done["actions"]) == (
+        "done",
+        2,
+        ["added: a", "added: b"],
+    )
+
+
+def test_progress_never_goes_back(queue):
+    job_id = queue.enqueue("u", MESSAGES)
+    queue.claim()
+    queue.progress(job_id, "reconciling", 2, 3, ["a", "b"])
+    queue.progress(job_id, "reconciling", 1, 3, ["a"])
+    assert queue.get(job_id)["processed"] == 2
+
+
+def test_failures_back_off_then_fail(queue, monkeypatch):
+    monkeypatch.setattr(jobs, "INGEST_MAX_ATTEMPTS", 2)
+    monkeypatch.setattr(jobs, "INGEST_RETRY_BACKOFF_SECONDS", 0)
+    job_id = queue.enqueue("u", MESSAGES)
+
+    queue.fail(job_id, queue.claim()["attempts"], "boom")
+    retrying = queue.get(job_id)
+    assert (retrying["status"], retrying["stage"]) == ("queued", "retrying")
+
+    job = queue.claim()
+    assert (job["attempts"], job["processed"]) == (2, 0)
+    queue.fail(job_id, job["attempts"], "boom again")
+    failed = queue.get(job_id)
+    assert (failed["status"], failed["error"]) == ("failed", "boom again")
+    assert queue.claim() is None
+
+
+def test_interrupted_jobs_are_requeued(queue):
+    job_id = queue.enqueue("u", MESSAGES)
+    queue.claim()
+    assert queue.requeue_running() == 1
+    assert queue.get(job_id)["status"] == "queued"
+
+
+@pytest.mark.anyio
+async def test_worker_records_progress_and_result(queue, monkeypatch):
+    async def _ingest(messages, user_id, on_progress, conversation_id):
+        await on_progress("reconciling", 0, 2, [])
+        await on_progress("reconciling", 1, 2, ["added: a"])
+        return ["added: a", "noop"]
+
+    monkeypatch.setattr(jobs, "_queue", queue)
+    monkeypatch.setattr(jobs, "ingest_conversation", _ingest)
+    await jobs.start_workers(1)
+    try:
+        job_id = await jobs.submit_ingest_job("u", MESSAGES)
+        for _ in range(100):
+            job = await jobs.get_job(job_id)
+            if job["status"] == "done":
+                break
+            await asyncio.sleep(0.01)
+    finally:
+        await jobs.stop_workers()
+    assert job["actions"] == ["added: a", "noop"]
+    assert job["processed"] == 2
+
+
+def test_counts_a_users_active_jobs(queue):
+    first = queue.enqueue("u", MESSAGES)
+    queue.enqueue("u", MESSAGES)
+    queue.enqueue("someone-else", MESSAGES)
+    queue.claim()
+    queue.complete(first, [])
+    assert queue.active_count("u") == 1
@@ -0,0 +1,102 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from app.bench.fakes import FakeLM
+from app.memory.lm import (
+    BACKGROUND,
+    CHAT,
+    PrioritySemaphore,
+    ResponseCache,
+)
+
+pytestmark = pytest.mark.anyio
+
+MESSAGES = [{"role": "user", "content": "context:\nlikes jazz\n\nquestion:\nmusic?"}]
+
+
+def test_response_cache_hits_misses_and_evicts():
+    cache = ResponseCache(max_entries=2, ttl_seconds=60)
+    first = ResponseCache.key("m", None, MESSAGES, {"temperature": 0})
+    assert first == ResponseCache.key("m", None, MESSAGES, {"temperature": 0})
+    assert first != ResponseCache.key("m", None, MESSAGES, {"temperature": 1})
+
+    assert cache.get(first) is None
+    cache.put(first, ["a"])
+    assert cache.get(first) == ["a"]
+    cache.put("second", ["b"])
+    cache.put("third", ["c"])
+    # first was used last before second and third went in, so it went first
+    assert cache.get(first) is None
+    assert cache.stats() == {"hits": 1, "misses": 2, "entries": 2}
+
+
+def test_response_cache_expires():
+    cache = ResponseCache(max_entries=2, ttl_seconds=0)
+    cache.put("key", ["a"])
+    assert cache.get("key") is None
+
+
+def test_priority_semaphore_serves_chat_first():
+    semaphore = PrioritySemaphore(1)
+    semaphore.acquire(BACKGROUND)
+    order = []
+
+    def _waiter(priority: int):
+        with semaphore.hold(priority):
+            order.append(priority)
+
+    background = threading.Thread(target=_waiter, args=(BACKGROUND,))
+    background.start()
+    time.sleep(0.05)
+    chat = threading.Thread(target=_waiter, args=(CHAT,))
+    chat.start()
+    time.sleep(0.05)
+    semaphore.release()
+    background.join()
+    chat.join()
+    assert order == [CHAT, BACKGROUND]
+
+
+def _lm(limit: int = 1, cache: ResponseCache = None) -> FakeLM:
+    return FakeLM("gpt-4o-mini", PrioritySemaphore(limit), cache)
+
+
+async def test_stream_holds_a_slot_while_open():
+    lm = _lm()
+    stream = lm.stream(MESSAGES, priority=CHAT)
+    first = await stream.__anext__()
+    assert first == "From "
+    assert lm.limit.value == 0
+    await stream.aclose()
+    assert lm.limit.value == 1
+
+
+async def test_stream_waits_for_a_slot():
+    lm = _lm()
+    lm.limit.acquire(BACKGROUND)
+    started = asyncio.ensure_future(lm.stream(MESSAGES, priority=CHAT).__anext__())
+    await asyncio.sleep(0.05)
+    assert not started.done()
+    lm.limit.release()
+    assert await started == "From "
+
+
+async def test_cancelled_wait_gives_the_slot_back():
+    lm = _lm()
+    lm.limit.acquire(BACKGROUND)
+    waiting = asyncio.ensure_future(lm.stream(MESSAGES, priority=CHAT).__anext__())
+    await asyncio.sleep(0.05)
+    waiting.cancel()
+    lm.limit.release()
+    await asyncio.sleep(0.05)
+    assert lm.limit.value == 1
+
+
+async def test_stream_uses_the_response_cache():
+    lm = _lm(cache=ResponseCache(max_entries=8, ttl_seconds=60))
+    answer = "".join([chunk async for chunk in lm.stream(MESSAGES)])
+    assert answer == "From what I remember: likes jazz "
+    assert [chunk async for chunk in lm.stream(MESSAGES)] == [answer]
+    assert lm.calls == 1
@@ -0,0 +1,42 @@
+import os
+
+import pytest
+from app.memory.local_store import LocalVectorStore
+from app.memory.vector_DB import _to_point
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_local_store_retrieve_and_delete(tmp_path, make_memory):
+    store = LocalVectorStore(str(tmp_path), 16, "float32")
+    memory_id = "a" * 32
+    await store.upsert([_to_point(memory_id, make_memory("local", "plays chess", 3))])
+
+    [record] = await store.retrieve([memory_id], with_vectors=True, user_id="local")
+    assert record.payload["memory_text"] == "plays chess"
+    assert record.vector[3] == pytest.approx(1.0)
+
+    await store.delete([memory_id], "local")
+    assert await store.retrieve([memory_id]) == []
+
+
+async def test_local_search_of_a_user_without_memories_creates_nothing(tmp_path):
+    store = LocalVectorStore(str(tmp_path), 16, "float32")
+    assert await store.search([1.0] * 16, "nobody", None, 4, 0.0) == []
+    assert await store.search_batch([([1.0] * 16, None, 4)], "nobody", 0.0) == [[]]
+    assert sorted(os.listdir(tmp_path)) == ["payloads.db"]
+
+
+async def test_local_search_ranks_by_cosine(tmp_path, make_memory):
+    store = LocalVectorStore(str(tmp_path), 16, "float32")
+    await store.upsert(
+        [
+            _to_point("a" * 32, make_memory("local", "plays chess", 3)),
+            _to_point("b" * 32, make_memory("local", "plays go", 4)),
+        ]
+    )
+    query = [0.0] * 16
+    query[3], query[4] = 0.9, 0.1
+    results = await store.search(query, "local", None, 2, 0.0)
+    assert [r.payload["memory_text"] for r in results] == ["plays chess", "plays go"]
+    assert await store.search(query, "local", ["travel"], 2, 0.0) == []
@@ -0,0 +1,86 @@
+import asyncio
+
+import pytest
+from app.memory.locks import memory_locks
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_hold_found_looks_again_after_waiting():
+    user_id = "hold-found"
+    finds = []
+
+    async def _find():
+        finds.append(1)
+        return {"a": None} if len(finds) == 1 else {"a": None, "b": None}
+
+    async with memory_locks.hold(user_id, {"a"}):
+        holder = asyncio.ensure_future(_hold(user_id, _find))
+        await asyncio.sleep(0.01)
+        assert not holder.done()
+    assert sorted(await holder) == ["a", "b"]
+    assert len(finds) == 2
+
+
+async def _hold(user_id, find):
+    async with memory_locks.hold_found(user_id, find) as found:
+        return found
+
+
+async def test_hold_serialises_overlapping_ids_only():
+    events = []
+
+    async def _worker(name: str, ids: set[str]):
+        async with memory_locks.hold("locks-user", ids) as waited:
+            events.append((name, "start", waited))
+            await asyncio.sleep(0.02)
+            events.append((name, "end", waited))
+
+    await asyncio.gather(
+        _worker("a", {"m1", "m2"}), _worker("b", {"m2", "m3"}), _worker("c", {"m4"})
+    )
+    starts = [(name, waited) for name, stage, waited in events if stage == "start"]
+    assert starts[:2] == [("a", False), ("c", False)]
+    assert starts[2] == ("b", True)
+    assert events.index(("a", "end", False)) < events.index(("b", "start", True))
+
+
+async def test_hold_is_per_user():
+    async with memory_locks.hold("user-1", {"m1"}):
+        async with memory_locks.hold("user-2", {"m1"}) as waited:
+            assert not waited
+
+
+async def test_opposite_orders_do_not_deadlock():
+    async def _worker(ids: list[str]):
+        for _ in range(20):
+            async with memory_locks.hold("locks-user", set(ids)):
+                await asyncio.sleep(0)
+
+    await asyncio.wait_for(
+        asyncio.gather(_worker(["x", "y"]), _worker(["y", "x"])), timeout=2
+    )
+
+
+async def test_locks_are_dropped_when_released():
+    async with memory_locks.hold("cleanup-user", {"m1", "m2"}):
+        pass
+    assert not [key for key in memory_locks._locks if key[0] == "cleanup-user"]
+    assert not [key for key in memory_locks._users if key[0] == "cleanup-user"]
+
+
+async def test_a_cancelled_waiter_releases_what_it_took():
+    async with memory_locks.hold("cancel-user", {"b"}):
+        waiter = asyncio.ensure_future(_hold_ids("cancel-user", {"a", "b"}))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+    async with memory_locks.hold("cancel-user", {"a"}) as waited:
+        assert not waited
+    assert not [key for key in memory_locks._locks if key[0] == "cancel-user"]
+
+
+async def _hold_ids(user_id: str, ids: set[str]):
+    async with memory_locks.hold(user_id, ids):
+        pass
@@ -0,0 +1,55 @@
+import threading
+from collections import Counter
+
+import pytest
+from app.bench.fakes import FakeLM
+from app.memory.lm import PrioritySemaphore, run_llm
+from app.metrics import count_request_tokens, request_llm_tokens, server_timing
+
+pytestmark = pytest.mark.anyio
+
+MESSAGES = [{"role": "user", "content": "what do I like"}]
+
+
+def test_tokens_count_only_inside_a_request():
+    count_request_tokens(10, 5)
+    tokens = Counter()
+    token = request_llm_tokens.set(tokens)
+    try:
+        count_request_tokens(10, 5)
+        count_request_tokens(3, None)
+    finally:
+        request_llm_tokens.reset(token)
+    assert tokens == {"prompt": 13, "completion": 5}
+
+
+def test_server_timing_lists_llm_tokens():
+    header = server_timing(
+        [("search", 0.002), ("search", 0.001), ("total", 0.01)],
+        Counter(prompt=120, completion=8),
+    )
+    assert header == (
+        "search;dur=3.0, total;dur=10.0, llm_tokens_completion;desc=8, llm_tokens_prompt;desc=120"
+    )
+    assert server_timing([("total", 0.01)]) == "total;dur=10.0"
+
+
+async def test_llm_calls_from_threads_add_to_their_request():
+    lm = FakeLM("gpt-4o-mini", PrioritySemaphore(4))
+    tokens = Counter()
+    token = request_llm_tokens.set(tokens)
+    try:
+        for _ in range(3):
+            await run_llm(lambda: lm(messages=MESSAGES))
+    finally:
+        request_llm_tokens.reset(token)
+    # 4 prompt words per call, and the fake's answer
+    assert tokens["prompt"] == 12
+    assert tokens["completion"] > 0
+
+    # another thread's calls are in its own history, not in this request
+    other = threading.Thread(target=lambda: lm(messages=MESSAGES))
+    other.start()
+    other.join()
+    assert tokens["prompt"] == 12
+    assert len(lm.history) == 0
@@ -0,0 +1,48 @@
+import asyncio
+import sys
+
+import pytest
+from app.memory import migrate_collection
+from app.memory.migrate_collection import migrate, resize, resolve_collection
+from app.memory.vector_DB import (
+    COLLECTION_NAME,
+    EmbeddedMemory,
+    create_collection,
+    insert_memories,
+    list_memories,
+)
+
+
+def test_resize_truncates_and_renormalises():
+    assert resize([3.0, 4.0], 2) == [3.0, 4.0]
+    assert resize([3.0, 4.0, 12.0], 2) == pytest.approx([0.6, 0.8])
+    assert resize([1.0], 2) is None
+
+
+def test_refuses_to_migrate_without_force(monkeypatch):
+    monkeypatch.setattr(sys, "argv", ["migrate_collection"])
+    with pytest.raises(SystemExit):
+        asyncio.run(migrate_collection.main())
+
+
+@pytest.mark.anyio
+async def test_migrate_copies_points_behind_an_alias():
+    await create_collection()
+    embedding = [0.0] * 16
+    embedding[5] = 1.0
+    await insert_memories(
+        [
+            EmbeddedMemory(
+                user_id="migrated",
+                memory_text="speaks Dutch",
+                categories=["language"],
+                date="2024-01-01",
+                embedding=embedding,
+            )
+        ]
+    )
+
+    target = await migrate()
+    assert await resolve_collection() == target != COLLECTION_NAME
+    [point] = await list_memories("migrated", with_vectors=True)
+    assert point.payload["memory_text"] == "speaks Dutch"
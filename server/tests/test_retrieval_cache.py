@@ -0,0 +1,114 @@
+from types import SimpleNamespace
+
+import pytest
+from app.bench.fakes import FakeEmbeddings
+from app.memory import embed_memory, retrieval_cache as rc
+from app.memory.embed_memory import EmbeddingCache, embed_text
+from app.memory.retrieval_cache import (
+    RetrievalCache,
+    retrieve_memories,
+    retrieve_memories_batch,
+)
+from app.memory.vector_DB import (
+    SEARCH_LIMIT,
+    EmbeddedMemory,
+    bump_write_generation,
+    create_collection,
+    delete_memory,
+    insert_memories,
+    write_generation,
+)
+
+pytestmark = pytest.mark.anyio
+
+
+def test_key_ignores_category_order():
+    assert RetrievalCache.key("u", "jazz?", ["b", "a"], 5) == RetrievalCache.key(
+        "u", "jazz?", ["a", "b"], 5
+    )
+    assert RetrievalCache.key("u", "jazz?", None, 5) != RetrievalCache.key("u", "jazz?", None, 6)
+
+
+def test_entries_go_stale_on_a_write_for_their_user():
+    cache = RetrievalCache(max_entries=10, ttl_seconds=60)
+    mine = RetrievalCache.key("rc-mine", "q", None, 5)
+    theirs = RetrievalCache.key("rc-theirs", "q", None, 5)
+    cache.put(mine, write_generation("rc-mine"), ["a"])
+    cache.put(theirs, write_generation("rc-theirs"), ["b"])
+
+    bump_write_generation("rc-mine")
+    assert cache.get(mine) is None
+    assert cache.get(theirs) == ["b"]
+
+    # a write without a user (e.g. a migration) makes every entry stale
+    bump_write_generation()
+    assert cache.get(theirs) is None
+
+
+def test_entries_expire_and_are_evicted():
+    cache = RetrievalCache(max_entries=1, ttl_seconds=0)
+    key = RetrievalCache.key("rc-ttl", "q", None, 5)
+    cache.put(key, write_generation("rc-ttl"), ["a"])
+    assert cache.get(key) is None
+
+    cache = RetrievalCache(max_entries=1, ttl_seconds=60)
+    cache.put(key, write_generation("rc-ttl"), ["a"])
+    cache.put(RetrievalCache.key("rc-ttl", "other", None, 5), write_generation("rc-ttl"), ["b"])
+    assert cache.get(key) is None
+    assert cache.stats()["entries"] == 1
+
+
+@pytest.fixture
+def fakes(monkeypatch):
+    embeddings = FakeEmbeddings(latency=0, is_async=True)
+    monkeypatch.setattr(embed_memory, "async_client", SimpleNamespace(embeddings=embeddings))
+    monkeypatch.setattr(embed_memory, "cache", EmbeddingCache(max_entries=100))
+    monkeypatch.setattr(rc, "retrieval_cache", RetrievalCache(max_entries=100, ttl_seconds=60))
+    return embeddings
+
+
+async def _insert(user_id: str, text: str):
+    await insert_memories(
+        [
+            EmbeddedMemory(
+                user_id=user_id,
+                memory_text=text,
+                categories=["music"],
+                date="2024-01-01",
+                embedding=await embed_text(text),
+            )
+        ]
+    )
+
+
+async def test_retrieve_memories_never_hides_a_write(fakes):
+    await create_collection()
+    await _insert("rc-user", "likes jazz")
+
+    first = await retrieve_memories("jazz", "rc-user")
+    assert [p.payload["memory_text"] for p in first] == ["likes jazz"]
+    assert await retrieve_memories("jazz", "rc-user") is first
+    assert rc.retrieval_cache.hits == 1
+
+    await _insert("rc-user", "plays jazz piano")
+    after_insert = await retrieve_memories("jazz", "rc-user")
+    assert len(after_insert) == 2
+
+    await delete_memory(after_insert[0].id, "rc-user")
+    assert len(await retrieve_memories("jazz", "rc-user")) == 1
+
+
+async def test_retrieve_memories_batch_searches_only_misses(fakes):
+    await create_collection()
+    await _insert("rc-batch", "likes jazz")
+    cached = await retrieve_memories("jazz", "rc-batch")
+    calls = fakes.calls
+
+    results = await retrieve_memories_batch(
+        [("jazz", None, SEARCH_LIMIT), ("piano", None, SEARCH_LIMIT), ("drums", None, SEARCH_LIMIT)],
+        "rc-batch",
+    )
+    assert results[0] is cached
+    assert len(results) == 3
+    # the two new queries were embedded in one call
+    assert fakes.calls == calls + 1
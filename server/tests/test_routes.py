@@ -0,0 +1,192 @@
+import json
+from uuid import uuid4
+
+import pytest
+from app.api import routes
+from app.api.auth import get_current_user
+from app.bench import fakes
+from app.main import app
+from app.memory import embed_memory
+from app.memory.embed_memory import EmbeddingCache
+from app.memory.lm import PooledLM, registry
+from fastapi import Header
+from fastapi.testclient import TestClient
+
+
+async def _test_user(x_test_user: str = Header()) -> str:
+    return x_test_user
+
+
+@pytest.fixture
+def client(monkeypatch):
+    # install() swaps these; monkeypatch puts them back afterwards
+    monkeypatch.setattr(embed_memory, "client", embed_memory.client)
+    monkeypatch.setattr(embed_memory, "async_client", embed_memory.async_client)
+    monkeypatch.setattr(embed_memory, "cache", EmbeddingCache(max_entries=1000))
+    fakes.install(0, 0)
+    app.dependency_overrides[get_current_user] = _test_user
+    try:
+        with TestClient(app) as client:
+            yield client
+    finally:
+        app.dependency_overrides.clear()
+        registry.use(PooledLM)
+
+
+def _user() -> dict:
+    return {"X-Test-User": f"routes-{uuid4().hex[:8]}"}
+
+
+def _ndjson(*texts: str, categories=("food",)) -> str:
+    return "".join(
+        json.dumps(
+            {
+                "id": uuid4().hex,
+                "payload": {"memory_text": text, "categories": list(categories)},
+                "vector": fakes.hash_embedding(text, 16),
+            }
+        )
+        + "\n"
+        for text in texts
+    )
+
+
+def _import(client: TestClient, user: dict, body: str) -> dict:
+    response = client.post("/memories/import", content=body, headers=user)
+    assert response.status_code == 200
+    return response.json()
+
+
+def _export(client: TestClient, user: dict) -> list[dict]:
+    response = client.get("/memories/export", headers=user)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def _events(text: str) -> list[tuple[str, dict]]:
+    events = []
+    for block in text.strip().split("\n\n"):
+        event, data = block.split("\n")
+        events.append((event.removeprefix("event: "), json.loads(data.removeprefix("data: "))))
+    return events
+
+
+def test_export_import_round_trip(client):
+    alice, bob = _user(), _user()
+    result = _import(client, alice, _ndjson("likes sushi", "cooks ramen") + "not json\n")
+    assert result["imported"] == 2
+    assert result["skipped"] == 1
+    exported = _export(client, alice)
+    assert sorted(p["payload"]["memory_text"] for p in exported) == ["cooks ramen", "likes sushi"]
+
+    # into another account: same memories and vectors, new ids and owner
+    assert _import(client, bob, "".join(json.dumps(p) + "\n" for p in exported))["imported"] == 2
+    copied = _export(client, bob)
+    assert {p["payload"]["memory_text"] for p in copied} == {"cooks ramen", "likes sushi"}
+    assert {p["payload"]["user_id"] for p in copied} == {bob["X-Test-User"]}
+    assert not {p["id"] for p in copied} & {p["id"] for p in exported}
+    vectors = {p["payload"]["memory_text"]: p["vector"] for p in exported}
+    for point in copied:
+        assert point["vector"] == pytest.approx(vectors[point["payload"]["memory_text"]])
+
+    # importing the same file again updates instead of duplicating
+    _import(client, alice, "".join(json.dumps(p) + "\n" for p in exported))
+    assert len(_export(client, alice)) == 2
+    categories = client.get("/memories/categories", headers=alice).json()
+    assert categories == {"categories": {"food": 2}}
+
+
+def test_batch_search_keeps_query_order_and_limits(client):
+    user = _user()
+    _import(
+        client,
+        user,
+        _ndjson(
+            "likes jazz",
+            "plays jazz piano",
+            "jazz concerts on fridays",
+            "likes sushi",
+            "sushi every sunday",
+        ),
+    )
+    response = client.post(
+        "/memories/search/batch",
+        json={
+            "queries": [
+                {"query": "sushi", "limit": 1},
+                {"query": "jazz", "limit": 2},
+                {"query": "jazz", "limit": 3},
+            ]
+        },
+        headers=user,
+    )
+    assert response.status_code == 200
+    results = [r["memories"] for r in response.json()["results"]]
+    assert [len(memories) for memories in results] == [1, 2, 3]
+    assert "sushi" in results[0][0]["memory_text"]
+    assert all("jazz" in m["memory_text"] for m in results[1] + results[2])
+    for memories in results:
+        scores = [m["score"] for m in memories]
+        assert scores == sorted(scores, reverse=True)
+
+
+def test_batch_search_validates_limits(client):
+    response = client.post(
+        "/memories/search/batch",
+        json={"queries": [{"query": "jazz", "limit": 0}]},
+        headers=_user(),
+    )
+    assert response.status_code == 422
+
+
+def test_chat_stream_events_in_order(client):
+    user = _user()
+    _import(client, user, _ndjson("likes jazz"))
+    response = client.post(
+        "/chat/stream", json={"question": "what music do I like? jazz?"}, headers=user
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = _events(response.text)
+    names = [name for name, _ in events]
+    assert names[0] == "memories"
+    assert names[-1] == "done"
+    assert set(names[1:-1]) == {"token"}
+    [memory] = events[0][1]["memories"]
+    assert memory["score"] > 0
+    answer = "".join(data["text"] for name, data in events if name == "token")
+    assert answer.startswith("From what I remember: likes jazz")
+    done = events[-1][1]
+    assert done["retrieval_ms"] <= done["first_token_ms"] <= done["total_ms"]
+
+
+def test_chat_stream_reports_generation_errors(client, monkeypatch):
+    async def _failing(question, context, past_messages):
+        yield "partial "
+        raise RuntimeError("provider down")
+
+    monkeypatch.setattr(routes, "stream_answer", _failing)
+    response = client.post("/chat/stream", json={"question": "anything?"}, headers=_user())
+    events = _events(response.text)
+    assert [name for name, _ in events] == ["memories", "token", "error"]
+    assert events[-1][1] == {"detail": "provider down"}
+
+
+def test_llm_tokens_are_reported_per_request(client):
+    user = _user()
+    _import(client, user, _ndjson("likes jazz"))
+    question = {"question": "what music do I like? jazz?"}
+
+    response = client.post("/chat", json=question, headers=user)
+    assert response.status_code == 200
+    timing = dict(
+        entry.split(";", 1) for entry in response.headers["Server-Timing"].split(", ")
+    )
+    assert int(timing["llm_tokens_prompt"].removeprefix("desc=")) > 0
+    assert int(timing["llm_tokens_completion"].removeprefix("desc=")) > 0
+
+    done = _events(client.post("/chat/stream", json=question, headers=user).text)[-1]
+    assert done[0] == "done"
+    assert done[1]["llm_tokens"]["prompt"] > 0
+    assert done[1]["llm_tokens"]["completion"] > 0
@@ -0,0 +1,80 @@
+from types import SimpleNamespace
+
+import pytest
+from app.bench.fakes import FakeEmbeddings
+from app.eval import run_eval
+from app.eval.run_eval import SCORES, compare, run_case, summarize
+from app.memory import embed_memory
+from app.memory.embed_memory import EmbeddingCache
+from app.memory.vector_DB import create_collection, list_memories
+
+pytestmark = pytest.mark.anyio
+
+CASES = [
+    {
+        "question": "Where do I live?",
+        "context": "The user lives in Lisbon.",
+        "expected_facts": ["Lisbon"],
+    },
+    {
+        "question": "What is my job?",
+        "context": "The user is a nurse.",
+        "expected_facts": ["nurse"],
+    },
+]
+
+
+@pytest.fixture
+def stubs(monkeypatch):
+    monkeypatch.setattr(
+        embed_memory,
+        "async_client",
+        SimpleNamespace(embeddings=FakeEmbeddings(latency=0, is_async=True)),
+    )
+    monkeypatch.setattr(embed_memory, "cache", EmbeddingCache(max_entries=100))
+
+    async def _generate_answer(question, context):
+        if "job" in question:
+            raise RuntimeError("provider down")
+        return f"You live in Lisbon. ({context})"
+
+    async def _judge_response(question, context, response):
+        return {name: 4 for name in SCORES} | {"reasoning": "fine"}
+
+    monkeypatch.setattr(run_eval, "generate_answer", _generate_answer)
+    monkeypatch.setattr(run_eval, "judge_response", _judge_response)
+
+
+async def test_a_failing_case_is_recorded_and_left_out_of_the_means(stubs):
+    await create_collection()
+    results = [await run_case(i, case, "eval-test") for i, case in enumerate(CASES)]
+
+    assert results[0]["rule_check"] == "PASS"
+    assert results[1] == {"question": "What is my job?", "error": "RuntimeError('provider down')"}
+    # the failed case's throwaway user is still cleaned up
+    assert await list_memories("eval-test-1") == []
+
+    summary = summarize(results)
+    assert (summary["passed"], summary["failed"], summary["errors"]) == (1, 0, 1)
+    assert summary["scores"] == {name: 4 for name in SCORES}
+    assert summary["latency_ms"]["total"]["n"] == 1
+
+
+def test_summary_and_comparison_when_every_case_failed():
+    summary = summarize([{"question": "q", "error": "RuntimeError()"}])
+    assert summary["scores"] == {name: None for name in SCORES}
+    assert summary["errors"] == 1
+
+    # baselines written before errors were counted have no "errors"
+    baseline = {
+        "summary": {
+            "passed": 1,
+            "failed": 0,
+            "scores": {name: 4.0 for name in SCORES},
+            "latency_ms": {stage: None for stage in run_eval.STAGES},
+        }
+    }
+    diff = compare({"summary": summary}, baseline)
+    assert diff["passed"] == -1
+    assert diff["errors"] == 1
+    assert not set(SCORES) & set(diff)
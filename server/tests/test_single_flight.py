@@ -0,0 +1,115 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from app.memory.single_flight import SingleFlight
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_do_shares_one_call_between_concurrent_callers():
+    flight = SingleFlight()
+    calls = 0
+
+    async def _fetch():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return ["likes jazz"]
+
+    results = await asyncio.gather(*[flight.do("jazz", _fetch) for _ in range(5)])
+    assert calls == 1
+    assert all(result is results[0] for result in results)
+    assert flight.stats() == {"calls": 1, "coalesced": 4}
+
+    # nothing is kept once the call is done
+    await flight.do("jazz", _fetch)
+    assert calls == 2
+
+
+async def test_do_keeps_keys_apart():
+    flight = SingleFlight()
+
+    async def _echo(value):
+        await asyncio.sleep(0.01)
+        return value
+
+    results = await asyncio.gather(
+        flight.do("a", lambda: _echo("a")), flight.do("b", lambda: _echo("b"))
+    )
+    assert results == ["a", "b"]
+    assert flight.stats() == {"calls": 2, "coalesced": 0}
+
+
+async def test_do_gives_every_caller_the_exception():
+    flight = SingleFlight()
+
+    async def _fail():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("search failed")
+
+    results = await asyncio.gather(
+        *[flight.do("q", _fail) for _ in range(3)], return_exceptions=True
+    )
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+async def test_cancelled_caller_does_not_cancel_the_others():
+    flight = SingleFlight()
+    release = asyncio.Event()
+
+    async def _fetch():
+        await release.wait()
+        return "done"
+
+    first = asyncio.create_task(flight.do("q", _fetch))
+    second = asyncio.create_task(flight.do("q", _fetch))
+    await asyncio.sleep(0)
+    first.cancel()
+    await asyncio.sleep(0)
+    release.set()
+    assert await second == "done"
+    assert first.cancelled()
+
+
+def test_call_shares_one_call_between_threads():
+    flight = SingleFlight()
+    started = threading.Event()
+    calls = 0
+
+    def _embed():
+        nonlocal calls
+        calls += 1
+        started.set()
+        time.sleep(0.05)
+        return [0.5]
+
+    with ThreadPoolExecutor(4) as pool:
+        leader = pool.submit(flight.call, "text", _embed)
+        started.wait()
+        followers = [pool.submit(flight.call, "text", _embed) for _ in range(3)]
+        results = [leader.result()] + [f.result() for f in followers]
+    assert calls == 1
+    assert results == [[0.5]] * 4
+    assert flight.stats() == {"calls": 1, "coalesced": 3}
+
+
+def test_call_raises_in_every_thread_and_forgets_the_key():
+    flight = SingleFlight()
+    started = threading.Event()
+
+    def _fail():
+        started.set()
+        time.sleep(0.05)
+        raise RuntimeError("embeddings down")
+
+    with ThreadPoolExecutor(2) as pool:
+        leader = pool.submit(flight.call, "text", _fail)
+        started.wait()
+        follower = pool.submit(flight.call, "text", _fail)
+        for future in (leader, follower):
+            with pytest.raises(RuntimeError):
+                future.result()
+    assert flight.call("text", lambda: "ok") == "ok"
@@ -0,0 +1,81 @@
+from types import SimpleNamespace
+
+import pytest
+from app.bench.fakes import FakeEmbeddings
+from app.memory import embed_memory, tool_caller
+from app.memory.extract_memory import Memory
+from app.memory.tool_caller import choose_path, reconcile_memory
+from app.memory.vector_DB import create_collection, list_memories
+
+pytestmark = pytest.mark.anyio
+
+
+def _results(*scores: float) -> list:
+    return [
+        SimpleNamespace(id=f"m{i}", score=score, payload={"memory_text": f"fact {i}"})
+        for i, score in enumerate(scores)
+    ]
+
+
+@pytest.mark.parametrize(
+    "scores, path",
+    [
+        ((), "add"),
+        ((0.05,), "add"),
+        ((0.1,), "agent"),
+        ((0.5, 0.2), "agent"),
+        ((0.94,), "agent"),
+        ((0.2, 0.95), "noop"),
+        ((0.99,), "noop"),
+    ],
+)
+def test_choose_path_thresholds(scores, path):
+    assert choose_path(_results(*scores)) == path
+
+
+def test_choose_path_can_send_everything_to_the_agent(monkeypatch):
+    monkeypatch.setattr(tool_caller, "FAST_NOOP_ABOVE", 1.01)
+    monkeypatch.setattr(tool_caller, "FAST_ADD_BELOW", 0.0)
+    assert choose_path(_results()) == "agent"
+    assert choose_path(_results(1.0)) == "agent"
+
+
+@pytest.fixture
+def no_agent(monkeypatch):
+    async def _process_memory(*args):
+        raise AssertionError("the agent should not run")
+
+    monkeypatch.setattr(tool_caller, "process_memory", _process_memory)
+
+
+async def test_reconcile_skips_the_agent_for_duplicates(no_agent):
+    memory = Memory(information="likes jazz", predicted_categories=["music"])
+    result = await reconcile_memory(memory, _results(0.3, 0.97), "tc-noop")
+    assert result.startswith("no action")
+    assert "m1" in result
+
+
+async def test_reconcile_adds_clearly_new_facts(no_agent, monkeypatch):
+    await create_collection()
+    monkeypatch.setattr(
+        embed_memory,
+        "client",
+        SimpleNamespace(embeddings=FakeEmbeddings(latency=0, is_async=False)),
+    )
+    memory = Memory(information="has a cat", predicted_categories=["pets"])
+    await reconcile_memory(memory, _results(0.01), "tc-add")
+    points = await list_memories("tc-add")
+    assert [p.payload["memory_text"] for p in points] == ["has a cat"]
+
+
+async def test_reconcile_runs_the_agent_in_between(monkeypatch):
+    calls = []
+
+    async def _process_memory(new_memory, existing_memories, user_id):
+        calls.append((new_memory, existing_memories))
+        return SimpleNamespace(action_taken="updated m0")
+
+    monkeypatch.setattr(tool_caller, "process_memory", _process_memory)
+    memory = Memory(information="likes free jazz", predicted_categories=["music"])
+    assert await reconcile_memory(memory, _results(0.6), "tc-agent") == "updated m0"
+    assert calls == [("likes free jazz", "id: m0 | text:fact 0")]
@@ -0,0 +1,19 @@
+import pytest
+from app.memory.transfer import _own_ids
+from app.memory.vector_DB import create_collection, insert_memories, list_memories
+from qdrant_client import models
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_import_gives_foreign_ids_new_ones(make_memory):
+    await create_collection()
+    await insert_memories([make_memory("owner", "plays chess")])
+    [point] = await list_memories("owner")
+    memory_id = str(point.id)
+    points = [
+        models.PointStruct(id=memory_id, payload={"user_id": "importer"}, vector=[1.0] * 16)
+    ]
+
+    await _own_ids(points, "importer")
+    assert str(points[0].id) != memory_id
@@ -0,0 +1,52 @@
+import pytest
+from app.memory import vector_DB
+from app.memory.vector_DB import (
+    create_collection,
+    delete_memory,
+    get_memory_by_id,
+    insert_memories,
+    list_memories,
+)
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_get_and_delete_memory_by_id(make_memory):
+    await create_collection()
+    await insert_memories([make_memory("by-id", "likes sushi")])
+    [point] = await list_memories("by-id")
+    memory_id = str(point.id)
+
+    record = await get_memory_by_id(memory_id, "by-id")
+    assert record.payload["memory_text"] == "likes sushi"
+    assert record.vector[0] == pytest.approx(1.0)
+    assert (await get_memory_by_id(memory_id)).payload["user_id"] == "by-id"
+
+    await delete_memory(memory_id, "by-id")
+    assert await get_memory_by_id(memory_id, "by-id") is None
+
+
+async def test_tenant_layout_marks_user_id_index(monkeypatch):
+    created = {}
+
+    class _Client:
+        async def create_payload_index(self, collection_name, field_name, field_schema):
+            created[field_name] = field_schema
+
+    monkeypatch.setattr(vector_DB, "QDRANT_LAYOUT", "tenant")
+    await vector_DB.QdrantStore(_Client()).create_indexes("memories")
+    assert created["user_id"].is_tenant
+
+
+async def test_indexes_and_config_follow_the_layout_asked_for():
+    created = {}
+
+    class _Client:
+        async def create_payload_index(self, collection_name, field_name, field_schema):
+            created[field_name] = field_schema
+
+    await vector_DB.QdrantStore(_Client()).create_indexes("bench_tenant", "tenant")
+    assert created["user_id"].is_tenant
+    assert vector_DB.collection_config("tenant", size=8)["hnsw_config"].m == 0
+    assert vector_DB.collection_config("tenant", size=8)["vectors_config"].size == 8
+    assert "hnsw_config" not in vector_DB.collection_config("default")